@@ -1,10 +1,29 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import sys
+import time
 import tokenize
+from array import array
+from enum import IntEnum
+from functools import lru_cache
 from io import StringIO
+from itertools import combinations, islice
+import numpy as np
+
+# Number of DP cells above which perform_alignment switches to linear-memory alignment
+LINEAR_MEMORY_THRESHOLD = 4_000_000
+
+# Default scores for matches, mismatches and gaps
+DEFAULT_SCORING = {"match": 2, "mismatch": -1, "gap": -2}
 
 
 def tokenize_code(code):
     """
     Tokenize Python code into raw tokens.
+    Kept for compatibility; perform_alignment uses the single-pass iter_abstract_tokens.
     :param code: Python code as a string.
     :return: List of tokens representing raw constructs.
     """
@@ -81,6 +100,7 @@ def tokenize_code(code):
 def abstract_tokens(tokens):
     """
     Abstract raw tokens into high-level constructs.
+    Kept for compatibility; perform_alignment uses the single-pass iter_abstract_tokens.
     :param tokens: List of raw tokens.
     :return: List of abstracted tokens.
     """
@@ -104,7 +124,150 @@ def abstract_tokens(tokens):
             abstracted_tokens.append("general_token")
     return abstracted_tokens
 
-def needleman_wunsch(seq1, seq2, match=2, mismatch=-1, gap=-2):
+class AbstractToken(IntEnum):
+    """High-level constructs produced by the abstraction step."""
+    GENERAL_TOKEN = 0
+    FUNCTION_DEF = 1
+    CLASS_DEF = 2
+    LOOP = 3
+    CONDITIONAL = 4
+    DOCSTRING = 5
+    IMPORT_STATEMENT = 6
+
+    def __str__(self):
+        return self.name.lower()
+
+# Keywords that open a new block, mapped to the construct they denote
+KEYWORD_TOKENS = {
+    "import": AbstractToken.IMPORT_STATEMENT,
+    "from": AbstractToken.IMPORT_STATEMENT,
+    "def": AbstractToken.FUNCTION_DEF,
+    "class": AbstractToken.CLASS_DEF,
+    "for": AbstractToken.LOOP,
+    "while": AbstractToken.LOOP,
+    "if": AbstractToken.CONDITIONAL,
+    "elif": AbstractToken.CONDITIONAL,
+    "else": AbstractToken.CONDITIONAL,
+}
+
+def iter_abstract_tokens(readline, lines=None):
+    """
+    Tokenize Python code and yield abstract tokens in a single pass.
+    Blocks are split exactly like tokenize_code, but each block is classified by the construct
+    that opened it instead of by substring checks on its joined text. Blank lines before the first token
+    and blocks of blank lines after the last one are skipped, so the tokens equal those of the stripped code.
+    :param readline: Callable returning the next line of source, as accepted by tokenize.generate_tokens.
+    :param lines: Optional pair of arrays receiving the first and last source line (1-based) of every token.
+    :return: Generator of AbstractToken values, one per block.
+    """
+    current = None  # Construct of the open block, None if no block is open
+    first = last = 0  # First and last source line of the open block; first is 0 while it only holds blank lines
+    commented = False  # Whether the open block holds a comment
+    blank = None  # Last line of a preceding block of blank lines, held back until a later block follows it
+
+    def close():
+        if lines is not None:
+            lines[0].append(first or last)
+            lines[1].append(last)
+        yield current
+
+    try:
+        for token in tokenize.generate_tokens(readline):
+            token_type = token.type
+
+            # Blank lines at the start of the file
+            if token_type == tokenize.NL and current is None and not last:
+                continue
+
+            # Keywords and strings close the open block and start a new one
+            if token_type == tokenize.NAME and token.string in KEYWORD_TOKENS:
+                opened = KEYWORD_TOKENS[token.string]
+            elif token_type == tokenize.STRING:
+                opened = AbstractToken.DOCSTRING
+
+            # Ignore comments
+            elif token_type == tokenize.COMMENT:
+                commented = True
+                last = token.end[0]
+                continue
+
+            # Indents and newlines close the open block
+            elif token_type in (tokenize.INDENT, tokenize.DEDENT, tokenize.NEWLINE):
+                opened = None
+
+            # Any other token belongs to the open block or starts a general one
+            elif current is None:
+                opened = AbstractToken.GENERAL_TOKEN
+            else:
+                if not first and token_type != tokenize.NL:
+                    first = token.start[0]
+                last = token.end[0]
+                continue
+
+            if current is not None:
+                if blank is not None:
+                    if lines is not None:
+                        lines[0].append(blank)
+                        lines[1].append(blank)
+                    yield AbstractToken.GENERAL_TOKEN
+                    blank = None
+                if first or commented:
+                    yield from close()
+                else:
+                    # Only blank lines: yielded only if the file goes on after them
+                    blank = last
+            current = opened
+            first = token.start[0] if token_type != tokenize.NL else 0
+            last = token.end[0]
+            commented = False
+
+        if current is not None:
+            yield from close()
+    except tokenize.TokenError:
+        pass
+
+def tokenize_abstract(code):
+    """
+    Tokenize Python code straight into abstract tokens.
+    :param code: Python code as a string.
+    :return: List of AbstractToken values.
+    """
+    return list(iter_abstract_tokens(StringIO(code).readline))
+
+def tokenize_lines(code):
+    """
+    Tokenize Python code into abstract tokens together with the source lines each token spans.
+    :param code: Python code as a string.
+    :return: Tuple of (tokens, first lines, last lines); the line numbers are 1-based array("I") parallel to tokens.
+    """
+    lines = (array("I"), array("I"))
+    tokens = list(iter_abstract_tokens(StringIO(code).readline, lines))
+    return tokens, lines[0], lines[1]
+
+def source_lines(code):
+    """
+    Split Python code into the lines that the line numbers of tokenize_lines refer to.
+    Only "\n" ends a line, as in the readline tokenize reads from; str.splitlines also splits on form
+    feeds and other separators, which would shift every line after them.
+    :param code: Python code as a string.
+    :return: List of lines without their line endings.
+    """
+    lines = code.split("\n")
+    if not lines[-1]:
+        lines.pop()
+    return [line[:-1] if line.endswith("\r") else line for line in lines]
+
+def _add_timing(timings, stage, start):
+    """
+    Add the time elapsed since start to a stage of an optional timings dictionary.
+    :return: The current time, to be used as the start of the next stage.
+    """
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + now - start
+    return now
+
+def needleman_wunsch(seq1, seq2, match=2, mismatch=-1, gap=-2, timings=None):
     """
     Perform Needleman-Wunsch alignment on two sequences.
     :param seq1: First sequence (list of tokens).
@@ -112,8 +275,10 @@ def needleman_wunsch(seq1, seq2, match=2, mismatch=-1, gap=-2):
     :param match: Score for a match.
     :param mismatch: Penalty for a mismatch.
     :param gap: Penalty for a gap.
+    :param timings: Optional dictionary receiving the seconds spent in the "dp_fill" and "traceback" stages.
     :return: Alignment score and aligned sequences.
     """
+    start = time.perf_counter()
     n, m = len(seq1), len(seq2)
     dp = [[0] * (m + 1) for _ in range(n + 1)]
 
@@ -131,6 +296,7 @@ def needleman_wunsch(seq1, seq2, match=2, mismatch=-1, gap=-2):
             else:
                 score = mismatch
             dp[i][j] = max(dp[i - 1][j - 1] + score, dp[i - 1][j] + gap, dp[i][j - 1] + gap)
+    start = _add_timing(timings, "dp_fill", start)
 
     # Backtrack to get the aligned sequences
     aligned_seq1, aligned_seq2 = [], []
@@ -161,26 +327,805 @@ def needleman_wunsch(seq1, seq2, match=2, mismatch=-1, gap=-2):
 
     aligned_seq1.reverse()
     aligned_seq2.reverse()
+    _add_timing(timings, "traceback", start)
     return dp[n][m], aligned_seq1, aligned_seq2
 
+# Direction flags stored per cell in the int8 traceback matrix
+DIAG, UP, LEFT = 1, 2, 4
+
+def intern_tokens(*sequences):
+    """
+    Map tokens to small integer codes shared by all given sequences.
+    :param sequences: Sequences of hashable tokens.
+    :return: List of tokens indexed by code, followed by one int16 array of codes per sequence.
+    """
+    codes = {}
+    arrays = [
+        np.fromiter((codes.setdefault(token, len(codes)) for token in seq), dtype=np.int16, count=len(seq))
+        for seq in sequences
+    ]
+    return (list(codes), *arrays)
+
+def _nw_row(prev, code, codes2, i, match, mismatch, gap):
+    """
+    Compute one row of the Needleman-Wunsch scoring matrix from the previous row.
+    The left gaps are resolved with a running maximum over score - j * gap.
+    :return: Current row, diagonal candidates and up candidates (the latter two for columns 1..m).
+    """
+    diag = prev[:-1] + np.where(codes2 == code, match, mismatch)
+    up = prev[1:] + gap
+    best = np.empty_like(prev)
+    best[0] = i * gap
+    np.maximum(diag, up, out=best[1:])
+    offsets = np.arange(len(prev), dtype=np.int64) * gap
+    curr = np.maximum.accumulate(best - offsets) + offsets
+    return curr, diag, up
+
+def needleman_wunsch_numpy(seq1, seq2, match=2, mismatch=-1, gap=-2, timings=None):
+    """
+    Perform Needleman-Wunsch alignment with a row-vectorized NumPy DP.
+    Produces exactly the same output as needleman_wunsch.
+    :param seq1: First sequence (list of tokens).
+    :param seq2: Second sequence (list of tokens).
+    :param match: Score for a match.
+    :param mismatch: Penalty for a mismatch.
+    :param gap: Penalty for a gap.
+    :param timings: Optional dictionary receiving the seconds spent in the "dp_fill" and "traceback" stages.
+    :return: Alignment score and aligned sequences.
+    """
+    start = time.perf_counter()
+    n, m = len(seq1), len(seq2)
+    _, codes1, codes2 = intern_tokens(seq1, seq2)
+
+    # Compact traceback matrix with the DIAG/UP/LEFT predecessors that reach each cell's maximum
+    directions = np.zeros((n + 1, m + 1), dtype=np.int8)
+    directions[0, 1:] = LEFT
+    directions[1:, 0] = UP
+
+    prev = np.arange(m + 1, dtype=np.int64) * gap
+    for i in range(1, n + 1):
+        curr, diag, up = _nw_row(prev, codes1[i - 1], codes2, i, match, mismatch, gap)
+        cells = curr[1:]
+        row = directions[i, 1:]
+        row |= (diag == cells) * np.int8(DIAG)
+        row |= (up == cells) * np.int8(UP)
+        row |= (curr[:-1] + gap == cells) * np.int8(LEFT)
+        prev = curr
+    start = _add_timing(timings, "dp_fill", start)
+
+    # Backtrack with the same preference order as needleman_wunsch
+    codes1, codes2 = codes1.tolist(), codes2.tolist()
+    aligned_seq1, aligned_seq2 = [], []
+    i, j = n, m
+    while i > 0 and j > 0:
+        if codes1[i - 1] == codes2[j - 1]:
+            aligned_seq1.append(seq1[i - 1])
+            aligned_seq2.append(seq2[j - 1])
+            i -= 1
+            j -= 1
+        elif directions[i, j] & UP:
+            aligned_seq1.append(seq1[i - 1])
+            aligned_seq2.append("-")
+            i -= 1
+        else:
+            aligned_seq1.append("-")
+            aligned_seq2.append(seq2[j - 1])
+            j -= 1
+
+    while i > 0:
+        aligned_seq1.append(seq1[i - 1])
+        aligned_seq2.append("-")
+        i -= 1
+    while j > 0:
+        aligned_seq1.append("-")
+        aligned_seq2.append(seq2[j - 1])
+        j -= 1
+
+    aligned_seq1.reverse()
+    aligned_seq2.reverse()
+    _add_timing(timings, "traceback", start)
+    return int(prev[m]), aligned_seq1, aligned_seq2
+
+def _nw_last_row(codes1, codes2, match, mismatch, gap):
+    """
+    Compute the last row of the Needleman-Wunsch scoring matrix using two rolling rows.
+    :param codes1: Token codes indexing the rows.
+    :param codes2: Token codes indexing the columns.
+    :return: Array of len(codes2) + 1 scores for aligning all of codes1 against each prefix of codes2.
+    """
+    row = np.arange(len(codes2) + 1, dtype=np.int64) * gap
+    for i, code in enumerate(codes1, 1):
+        row, _, _ = _nw_row(row, code, codes2, i, match, mismatch, gap)
+    return row
+
+def _align_single(code, codes, match, mismatch, gap):
+    """
+    Optimally align a single token code against a sequence of codes.
+    :return: Aligned code lists with None for gaps.
+    """
+    # Either the token is placed in front of some position of codes or it is left unpaired
+    codes = codes.tolist()
+    best_score, best_pos = (len(codes) + 1) * gap, None
+    for pos, other in enumerate(codes):
+        score = (len(codes) - 1) * gap + (match if code == other else mismatch)
+        if score > best_score:
+            best_score, best_pos = score, pos
+    if best_pos is None:
+        return [code] + [None] * len(codes), [None] + codes
+    aligned1 = [None] * best_pos + [code] + [None] * (len(codes) - best_pos - 1)
+    return aligned1, codes
+
+def _hirschberg(codes1, codes2, match, mismatch, gap):
+    if not len(codes1):
+        return [None] * len(codes2), codes2.tolist()
+    if not len(codes2):
+        return codes1.tolist(), [None] * len(codes1)
+    if len(codes1) == 1:
+        return _align_single(codes1[0], codes2, match, mismatch, gap)
+    if len(codes2) == 1:
+        aligned2, aligned1 = _align_single(codes2[0], codes1, match, mismatch, gap)
+        return aligned1, aligned2
+
+    # Split codes1 in the middle and find where the optimal path crosses that row
+    mid = len(codes1) // 2
+    upper = _nw_last_row(codes1[:mid], codes2, match, mismatch, gap)
+    lower = _nw_last_row(codes1[mid:][::-1], codes2[::-1], match, mismatch, gap)
+    split = int(np.argmax(upper + lower[::-1]))
+    del upper, lower
+
+    left1, left2 = _hirschberg(codes1[:mid], codes2[:split], match, mismatch, gap)
+    right1, right2 = _hirschberg(codes1[mid:], codes2[split:], match, mismatch, gap)
+    return left1 + right1, left2 + right2
+
+def hirschberg(seq1, seq2, match=2, mismatch=-1, gap=-2, timings=None):
+    """
+    Perform Needleman-Wunsch alignment in linear memory (Hirschberg's divide and conquer).
+    The score is identical to needleman_wunsch; on ties a different optimal alignment may be returned.
+    :param seq1: First sequence (list of tokens).
+    :param seq2: Second sequence (list of tokens).
+    :param match: Score for a match.
+    :param mismatch: Penalty for a mismatch.
+    :param gap: Penalty for a gap.
+    :param timings: Optional dictionary receiving the seconds spent in the "dp_fill" stage (the recursive
+        split searches) and the "traceback" stage (assembling the aligned sequences).
+    :return: Alignment score and aligned sequences.
+    """
+    # Keep the rolling rows over the shorter sequence so memory is O(min(n, m))
+    if len(seq2) > len(seq1):
+        score, aligned_seq2, aligned_seq1 = hirschberg(seq2, seq1, match, mismatch, gap, timings)
+        return score, aligned_seq1, aligned_seq2
+
+    start = time.perf_counter()
+    vocabulary, codes1, codes2 = intern_tokens(seq1, seq2)
+    score = int(_nw_last_row(codes1, codes2, match, mismatch, gap)[-1])
+    aligned1, aligned2 = _hirschberg(codes1, codes2, match, mismatch, gap)
+    start = _add_timing(timings, "dp_fill", start)
+    aligned_seq1 = ["-" if code is None else vocabulary[code] for code in aligned1]
+    aligned_seq2 = ["-" if code is None else vocabulary[code] for code in aligned2]
+    _add_timing(timings, "traceback", start)
+    return score, aligned_seq1, aligned_seq2
+
+# Score assigned to cells outside the band; far below any reachable score but safe from overflow
+OUT_OF_BAND = np.iinfo(np.int64).min // 4
+
+def needleman_wunsch_score(seq1, seq2, match=2, mismatch=-1, gap=-2, band=None):
+    """
+    Compute the Needleman-Wunsch score with two rolling rows and no traceback.
+    Alongside the score, the number of matches and the alignment length of the path the traceback of
+    needleman_wunsch takes are tracked, so the similarity is reported without materializing the aligned sequences.
+    With a band (Ukkonen), only cells whose diagonal lies within `band` of the corner-to-corner diagonals
+    are computed. If a path leaving the band could still beat the banded score, the banded score is a
+    lower bound and the returned upper bound is the best score any out-of-band path could reach.
+    :param seq1: First sequence (list of tokens).
+    :param seq2: Second sequence (list of tokens).
+    :param match: Score for a match.
+    :param mismatch: Penalty for a mismatch.
+    :param gap: Penalty for a gap.
+    :param band: Optional band width (non-negative int).
+    :return: Tuple of (score, matches, alignment length, upper bound on the score).
+    """
+    n, m = len(seq1), len(seq2)
+    vocabulary, codes1, codes2 = intern_tokens(seq1, seq2)
+
+    # Band bounds are ignored for scoring schemes where the out-of-band bound would not hold
+    if band is None or mismatch > match:
+        low, high = -n, m
+    else:
+        low, high = min(0, m - n) - band, max(0, m - n) + band
+
+    scores = np.full(m + 1, OUT_OF_BAND, dtype=np.int64)
+    matches = np.zeros(m + 1, dtype=np.int64)
+    lengths = np.zeros(m + 1, dtype=np.int64)
+    first = np.arange(min(m, high) + 1, dtype=np.int64)
+    scores[:len(first)] = first * gap
+    lengths[:len(first)] = first
+    next_scores, next_matches, next_lengths = scores.copy(), matches.copy(), lengths.copy()
+
+    for i in range(1, n + 1):
+        jlo, jhi = max(0, i + low), min(m, i + high)
+        _nw_score_row((scores, matches, lengths), (next_scores, next_matches, next_lengths),
+                      codes1[i - 1], codes2, i, jlo, jhi, match, mismatch, gap)
+        if jlo > 0:
+            next_scores[jlo - 1] = OUT_OF_BAND
+        if jhi < m:
+            next_scores[jhi + 1] = OUT_OF_BAND
+
+        scores, next_scores = next_scores, scores
+        matches, next_matches = next_matches, matches
+        lengths, next_lengths = next_lengths, lengths
+
+    score = int(scores[m])
+    upper = score
+    if (low, high) != (-n, m):
+        # Any path leaving the band needs at least this many gaps
+        min_gaps = abs(m - n) + 2 * (band + 1)
+        if min_gaps <= n + m:
+            # Matches are limited by how often each token occurs in both sequences
+            counts1 = np.bincount(codes1, minlength=len(vocabulary))
+            counts2 = np.bincount(codes2, minlength=len(vocabulary))
+            max_matches = int(np.minimum(counts1, counts2).sum())
+            upper = max(score, _out_of_band_bound(n, m, max_matches, min_gaps, match, mismatch, gap))
+    return score, int(matches[m]), int(lengths[m]), upper
+
+def _nw_score_row(rows, next_rows, code, codes2, i, jlo, jhi, match, mismatch, gap):
+    """
+    Compute columns jlo..jhi of one row of needleman_wunsch_score from the previous row.
+    The matches and lengths follow the path the traceback of needleman_wunsch takes from each cell:
+    diagonal on equal tokens, otherwise up if that reaches the cell's score, otherwise left. The
+    similarity of score-only alignments is therefore the one of the full alignment.
+    :param rows: Scores, matches and lengths of the previous row.
+    :param next_rows: Arrays receiving the scores, matches and lengths of the current row.
+    """
+    scores, matches, lengths = rows
+    next_scores, next_matches, next_lengths = next_rows
+    start = max(jlo, 1)
+    is_match = codes2[start - 1:jhi] == code
+    diag = scores[start - 1:jhi] + np.where(is_match, match, mismatch)
+    up = scores[start:jhi + 1] + gap
+
+    # Resolve left gaps with a running maximum, column 0 coming from the gap-only path
+    cand_scores = np.maximum(diag, up)
+    if jlo == 0:
+        cand_scores = np.concatenate(([i * gap], cand_scores))
+    positions = np.arange(jhi - jlo + 1)
+    offsets = (positions + jlo) * gap
+    cells = np.maximum.accumulate(cand_scores - offsets) + offsets
+    next_scores[jlo:jhi + 1] = cells
+
+    # Cells the traceback leaves diagonally or upwards start a run of left moves
+    take_up = ~is_match & (up == cells[start - jlo:])
+    take_diag = is_match | (~take_up & (diag >= up))  # The latter only for the first cell of a band
+    cand_matches = np.where(take_diag, matches[start - 1:jhi] + is_match, matches[start:jhi + 1])
+    cand_lengths = np.where(take_diag, lengths[start - 1:jhi], lengths[start:jhi + 1]) + 1
+    anchored = is_match | take_up
+    if jlo == 0:
+        cand_matches = np.concatenate(([0], cand_matches))
+        cand_lengths = np.concatenate(([i], cand_lengths))
+        anchored = np.concatenate(([True], anchored))
+
+    # Every cell extends the path of the last anchored cell to its left
+    source = np.maximum.accumulate(np.where(anchored, positions, 0))
+    next_matches[jlo:jhi + 1] = cand_matches[source]
+    next_lengths[jlo:jhi + 1] = cand_lengths[source] + (positions - source)
+
+def _out_of_band_bound(n, m, max_matches, min_gaps, match, mismatch, gap):
+    """
+    Upper bound on the score of any alignment with at least min_gaps gaps and at most max_matches matches.
+    The bound is piecewise linear in the number of gaps, so it is enough to check its breakpoints.
+    """
+    best = None
+    for gaps in (min_gaps, n + m - 2 * max_matches, n + m):
+        if gaps < min_gaps or (n + m - gaps) % 2:
+            continue
+        pairs = (n + m - gaps) // 2
+        paired_matches = min(pairs, max_matches)
+        bound = paired_matches * match + (pairs - paired_matches) * mismatch + gaps * gap
+        best = bound if best is None else max(best, bound)
+    return best
+
+def _symbol_masks(codes):
+    """Bitmask of the positions of every symbol in a code array, as Python ints (bit j set for position j)."""
+    return {
+        int(code): int.from_bytes(np.packbits(codes == code, bitorder="little").tobytes(), "little")
+        for code in np.unique(codes)
+    }
+
+def lcs_length(seq1, seq2):
+    """
+    Length of the longest common subsequence, computed bit-parallel (Allison-Dix, Hyyro).
+    One sequence is encoded as a bit vector per symbol; each token of the other updates a whole DP row
+    with a few big-int operations, i.e. 64 cells per machine word.
+    """
+    _, codes1, codes2 = intern_tokens(seq1, seq2)
+    if len(codes1) > len(codes2):
+        codes1, codes2 = codes2, codes1
+    full = (1 << len(codes2)) - 1
+    masks = _symbol_masks(codes2)
+    row = full  # Zero bits mark the columns where the LCS grows
+    for code in codes1.tolist():
+        matched = row & masks.get(code, 0)
+        row = ((row + matched) | (row - matched)) & full
+    return len(codes2) - row.bit_count()
+
+def edit_distance(seq1, seq2):
+    """
+    Unit-cost edit distance (Levenshtein) of two sequences with Myers' bit-vector algorithm.
+    Vertical deltas of a whole DP column are kept as positive/negative bit vectors over the longer sequence.
+    """
+    _, codes1, codes2 = intern_tokens(seq1, seq2)
+    if len(codes1) > len(codes2):
+        codes1, codes2 = codes2, codes1
+    m = len(codes2)
+    if m == 0:
+        return len(codes1)
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    masks = _symbol_masks(codes2)
+    positive, negative = full, 0
+    distance = m
+    for code in codes1.tolist():
+        equal = masks.get(code, 0)
+        vertical = equal | negative
+        horizontal = (((equal & positive) + positive) ^ positive) | equal
+        horizontal_positive = negative | (~(horizontal | positive) & full)
+        horizontal_negative = positive & horizontal
+        if horizontal_positive & last:
+            distance += 1
+        elif horizontal_negative & last:
+            distance -= 1
+        # Row 0 of a global alignment grows by one per token
+        horizontal_positive = ((horizontal_positive << 1) | 1) & full
+        horizontal_negative = (horizontal_negative << 1) & full
+        positive = horizontal_negative | (~(vertical | horizontal_positive) & full)
+        negative = horizontal_positive & vertical
+    return distance
+
+def bitparallel_scheme(match, mismatch, gap):
+    """
+    Classify a scoring scheme by the bit-parallel algorithm that computes its Needleman-Wunsch score.
+    With M matches, X mismatches and gaps filling up the rest, a global alignment of lengths n and m scores
+    gap * (n + m) + (match - 2 * gap) * M + (mismatch - 2 * gap) * X.
+    :return: "lcs" if mismatches never beat two gaps (mismatch <= 2 * gap), so the score follows from the LCS;
+        "edit" if a match is worth two mismatches (2 * mismatch == match + 2 * gap), so the score follows from
+        the edit distance; None otherwise.
+    """
+    if match <= 2 * gap:
+        return None
+    if mismatch <= 2 * gap:
+        return "lcs"
+    if 2 * mismatch == match + 2 * gap:
+        return "edit"
+    return None
+
+def bitparallel_score(seq1, seq2, match=2, mismatch=-1, gap=-2):
+    """
+    Compute the Needleman-Wunsch score with a bit-parallel LCS or edit distance (see bitparallel_scheme).
+    :return: The same score as needleman_wunsch_score.
+    :raises ValueError: If the scoring scheme has no bit-parallel equivalent.
+    """
+    scheme = bitparallel_scheme(match, mismatch, gap)
+    length = len(seq1) + len(seq2)
+    if scheme == "lcs":
+        return gap * length + (match - 2 * gap) * lcs_length(seq1, seq2)
+    if scheme == "edit":
+        # 2 * M + X = n + m - distance for every alignment with the minimal number of edits
+        return (mismatch - gap) * length - (mismatch - 2 * gap) * edit_distance(seq1, seq2)
+    raise ValueError(f"No bit-parallel equivalent for match={match}, mismatch={mismatch}, gap={gap}")
+
+# Alignment modes accepted by align_tokens
+MODES = ("global", "local")
+
+# Traceback flags of the affine-gap DP: the source of each H cell in the low two bits,
+# plus whether the E (left) and F (up) gap states extend a gap instead of opening it
+H_STOP, H_DIAG, H_LEFT, H_UP = 0, 1, 2, 3
+E_EXTEND, F_EXTEND = 4, 8
+
+def _check_affine(gap_open, gap_extend):
+    if gap_open > gap_extend:
+        raise ValueError("The gap open penalty must not be smaller than the gap extension penalty.")
+
+def _affine_first_row(m, gap_open, gap_extend, local):
+    """Return the H and F rows for the empty prefix of the first sequence."""
+    h = np.zeros(m + 1, dtype=np.int64)
+    if not local:
+        h[1:] = gap_open + np.arange(m, dtype=np.int64) * gap_extend
+    return h, np.full(m + 1, OUT_OF_BAND, dtype=np.int64)
+
+def _affine_row(h_prev, f_prev, code, codes2, i, match, mismatch, gap_open, gap_extend, local, offsets,
+                top=None):
+    """
+    Compute one row of Gotoh's three DP matrices (H best, E gap in the first sequence, F gap in the second).
+    Horizontal gaps are resolved with a running maximum over H - j * gap_extend, which is exact because
+    opening a gap costs at least as much as extending one (see _check_affine).
+    :param offsets: Array of j * gap_extend for the columns 0..m.
+    :param top: Penalty for the first position of the gap along column 0, defaults to gap_open.
+    :return: Rows H, E and F, the row H' of H before horizontal gaps, the diagonal candidates of columns 1..m,
+        and the running maximum of H' - j * gap_extend.
+    """
+    boundary = 0 if local else (gap_open if top is None else top) + (i - 1) * gap_extend
+
+    f = np.maximum(h_prev + gap_open, f_prev + gap_extend)
+    f[0] = OUT_OF_BAND if local else boundary
+    diag = h_prev[:-1] + np.where(codes2 == code, match, mismatch)
+    h_inner = np.empty_like(h_prev)
+    h_inner[0] = boundary
+    np.maximum(diag, f[1:], out=h_inner[1:])
+    if local:
+        np.maximum(h_inner, 0, out=h_inner)
+
+    shifted = h_inner - offsets
+    best = np.maximum.accumulate(shifted)
+    e = np.empty_like(h_prev)
+    e[0] = OUT_OF_BAND
+    np.add(best[:-1], offsets[:-1] + gap_open, out=e[1:])
+    return np.maximum(h_inner, e), e, f, h_inner, diag, shifted, best
+
+def gotoh(seq1, seq2, match=2, mismatch=-1, gap_open=-3, gap_extend=-1, local=False, timings=None):
+    """
+    Align two sequences with affine gap penalties (Gotoh), globally or locally (Smith-Waterman).
+    A gap of length k costs gap_open + (k - 1) * gap_extend. Rows are computed vectorized and the
+    traceback is kept in a single int8 matrix, like needleman_wunsch_numpy.
+    :param seq1: First sequence (list of tokens).
+    :param seq2: Second sequence (list of tokens).
+    :param match: Score for a match.
+    :param mismatch: Penalty for a mismatch.
+    :param gap_open: Penalty for the first position of a gap.
+    :param gap_extend: Penalty for every further position of a gap; must not be below gap_open.
+    :param local: Align the best-matching regions instead of the whole sequences.
+    :param timings: Optional dictionary receiving the seconds spent in the "dp_fill" and "traceback" stages.
+    :return: Score, aligned sequences and the aligned token span (start1, end1, start2, end2).
+    """
+    _check_affine(gap_open, gap_extend)
+    start = time.perf_counter()
+    n, m = len(seq1), len(seq2)
+    _, codes1, codes2 = intern_tokens(seq1, seq2)
+
+    offsets = np.arange(m + 1, dtype=np.int64) * gap_extend
+    flags = np.full((n + 1, m + 1), H_LEFT, dtype=np.int8)
+    h, f = _affine_first_row(m, gap_open, gap_extend, local)
+    best_score, end = (0, (0, 0)) if local else (None, (n, m))
+    for i in range(1, n + 1):
+        h_next, e, f_next, _, diag, _, _ = _affine_row(
+            h, f, codes1[i - 1], codes2, i, match, mismatch, gap_open, gap_extend, local, offsets
+        )
+        # Cells start as H_LEFT; diagonal moves take precedence over up moves
+        cells = h_next[1:]
+        row = flags[i, 1:]
+        is_diag = cells == diag
+        row -= is_diag
+        row += (cells == f_next[1:]) & ~is_diag
+        if local:
+            row[cells == 0] = H_STOP
+        row |= (e[1:] == e[:-1] + gap_extend) * np.int8(E_EXTEND)
+        row |= (f_next[1:] == f[1:] + gap_extend) * np.int8(F_EXTEND)
+        if local:
+            j = int(np.argmax(h_next))
+            if h_next[j] > best_score:
+                best_score, end = int(h_next[j]), (i, j)
+        h, f = h_next, f_next
+    score = best_score if local else int(h[m])
+    start = _add_timing(timings, "dp_fill", start)
+
+    # Follow the flags from the end cell, switching between the H, E and F states
+    aligned_seq1, aligned_seq2 = [], []
+    i, j = end
+    state = H_DIAG
+    while i > 0 and j > 0:
+        flag = int(flags[i, j])
+        if state == H_DIAG:
+            choice = flag & 3
+            if choice == H_STOP:
+                break
+            if choice == H_DIAG:
+                aligned_seq1.append(seq1[i - 1])
+                aligned_seq2.append(seq2[j - 1])
+                i -= 1
+                j -= 1
+            else:
+                state = choice
+        elif state == H_LEFT:
+            aligned_seq1.append("-")
+            aligned_seq2.append(seq2[j - 1])
+            state = H_LEFT if flag & E_EXTEND else H_DIAG
+            j -= 1
+        else:
+            aligned_seq1.append(seq1[i - 1])
+            aligned_seq2.append("-")
+            state = H_UP if flag & F_EXTEND else H_DIAG
+            i -= 1
+
+    if not local:
+        while i > 0:
+            aligned_seq1.append(seq1[i - 1])
+            aligned_seq2.append("-")
+            i -= 1
+        while j > 0:
+            aligned_seq1.append("-")
+            aligned_seq2.append(seq2[j - 1])
+            j -= 1
+
+    aligned_seq1.reverse()
+    aligned_seq2.reverse()
+    _add_timing(timings, "traceback", start)
+    return score, aligned_seq1, aligned_seq2, (i, end[0], j, end[1])
+
+def gotoh_score(seq1, seq2, match=2, mismatch=-1, gap_open=-3, gap_extend=-1, local=False):
+    """
+    Compute the score of gotoh() with rolling rows and no traceback.
+    Like needleman_wunsch_score, the matches and length of one optimal path are tracked alongside the
+    scores, together with the cell the path starts in, so local alignments also report their span.
+    :return: Tuple of (score, matches, alignment length, span (start1, end1, start2, end2)).
+    """
+    _check_affine(gap_open, gap_extend)
+    n, m = len(seq1), len(seq2)
+    _, codes1, codes2 = intern_tokens(seq1, seq2)
+    columns = np.arange(m + 1, dtype=np.int64)
+
+    # Path statistics per cell and state: matches, length, start row, start column
+    h, f = _affine_first_row(m, gap_open, gap_extend, local)
+    h_stats = np.zeros((4, m + 1), dtype=np.int64)
+    if local:
+        h_stats[3] = columns
+    else:
+        h_stats[1] = columns
+    f_stats = h_stats.copy()
+    best_score, best_stats, end = (0, h_stats[:, 0].copy(), (0, 0)) if local else (None, None, (n, m))
+
+    offsets = columns * gap_extend
+    for i in range(1, n + 1):
+        code = codes1[i - 1]
+        h_next, e, f_next, h_inner, diag, shifted, best = _affine_row(
+            h, f, code, codes2, i, match, mismatch, gap_open, gap_extend, local, offsets
+        )
+        # Left moves extend the gap of E on ties, like the traceback of gotoh(), so a gap opens at
+        # the column where the running maximum was first reached
+        raised = np.empty(m + 1, dtype=bool)
+        raised[0] = True
+        np.greater(shifted[1:], best[:-1], out=raised[1:])
+        opened = np.maximum.accumulate(np.where(raised, columns, 0))
+        # Up moves extend the gap of F on ties, like the traceback of gotoh()
+        f_stats = np.where(f_next == f + gap_extend, f_stats, h_stats)
+        f_stats[1] += 1
+
+        inner_stats = np.empty_like(h_stats)
+        inner_stats[:, 0] = (0, 0, i, 0) if local else (0, i, 0, 0)
+        diag_stats = h_stats[:, :-1].copy()
+        diag_stats[0] += codes2 == code
+        diag_stats[1] += 1
+        inner_stats[:, 1:] = np.where(h_inner[1:] == diag, diag_stats, f_stats[:, 1:])
+        if local:
+            restart = h_inner == 0
+            inner_stats[:2, restart] = 0
+            inner_stats[2, restart] = i
+            inner_stats[3, restart] = columns[restart]
+
+        e_stats = np.zeros_like(h_stats)
+        e_stats[:, 1:] = inner_stats[:, opened[:-1]]
+        e_stats[1, 1:] += columns[1:] - opened[:-1]
+        h_stats = np.where(h_next == h_inner, inner_stats, e_stats)
+        h, f = h_next, f_next
+
+        if local:
+            j = int(np.argmax(h))
+            if h[j] > best_score:
+                best_score, best_stats, end = int(h[j]), h_stats[:, j].copy(), (i, j)
+
+    stats = best_stats if local else h_stats[:, m]
+    score = best_score if local else int(h[m])
+    matches, length, start1, start2 = (int(value) for value in stats)
+    return score, matches, length, (start1, end[0], start2, end[1])
+
+def _affine_last_rows(codes1, codes2, match, mismatch, gap_open, gap_extend, top):
+    """
+    Compute the last H and F rows of the global affine-gap DP using rolling rows.
+    :param top: Penalty for the first position of a gap along column 0 (see _myers_miller).
+    :return: Arrays of len(codes2) + 1 scores for aligning all of codes1 against each prefix of codes2,
+        ending in any state (H) and ending with a gap in codes2 (F).
+    """
+    m = len(codes2)
+    offsets = np.arange(m + 1, dtype=np.int64) * gap_extend
+    h, f = _affine_first_row(m, gap_open, gap_extend, False)
+    for i, code in enumerate(codes1, 1):
+        h, _, f, _, _, _, _ = _affine_row(
+            h, f, code, codes2, i, match, mismatch, gap_open, gap_extend, False, offsets, top
+        )
+    return h, f
+
+def _affine_single(code, codes, match, mismatch, gap_open, gap_extend, top, bottom):
+    """
+    Optimally align a single token code against a non-empty sequence of codes with affine gaps.
+    :param top: Penalty for leaving the token unpaired in front of codes.
+    :param bottom: Penalty for leaving the token unpaired behind codes.
+    :return: Aligned code lists with None for gaps.
+    """
+    codes = codes.tolist()
+    n = len(codes)
+    # Gap penalties before and after the position the token is paired with
+    before = np.where(np.arange(n) > 0, gap_open + (np.arange(n) - 1) * gap_extend, 0)
+    scores = before + before[::-1] + np.where(np.array(codes) == code, match, mismatch)
+    pos = int(np.argmax(scores))
+    unpaired = gap_open + (n - 1) * gap_extend + max(top, bottom)
+    if unpaired > scores[pos]:
+        if top >= bottom:
+            return [code] + [None] * n, [None] + codes
+        return [None] * n + [code], codes + [None]
+    return [None] * pos + [code] + [None] * (n - pos - 1), codes
+
+def _myers_miller(codes1, codes2, match, mismatch, gap_open, gap_extend, top, bottom):
+    """
+    Align codes1 and codes2 with affine gaps in linear memory (Myers and Miller's divide and conquer).
+    :param top: Penalty for the first position of a gap in codes2 at the start; gap_extend when the gap
+        continues one of the enclosing alignment.
+    :param bottom: Same as top for a gap in codes2 at the end.
+    :return: Aligned code lists with None for gaps.
+    """
+    if not len(codes1):
+        return [None] * len(codes2), codes2.tolist()
+    if not len(codes2):
+        return codes1.tolist(), [None] * len(codes1)
+    if len(codes1) == 1:
+        return _affine_single(int(codes1[0]), codes2, match, mismatch, gap_open, gap_extend, top, bottom)
+
+    # The optimal path either crosses the middle row in the H state or inside a gap spanning the row,
+    # in which case the two halves of the gap are charged a single opening penalty
+    mid = len(codes1) // 2
+    upper, upper_gap = _affine_last_rows(codes1[:mid], codes2, match, mismatch, gap_open, gap_extend, top)
+    lower, lower_gap = _affine_last_rows(
+        codes1[mid:][::-1], codes2[::-1], match, mismatch, gap_open, gap_extend, bottom
+    )
+    joined = upper + lower[::-1]
+    gapped = upper_gap + lower_gap[::-1] - (gap_open - gap_extend)
+    split, gap_split = int(np.argmax(joined)), int(np.argmax(gapped))
+    joined_score, gapped_score = joined[split], gapped[gap_split]
+    del upper, upper_gap, lower, lower_gap, joined, gapped
+
+    if gapped_score > joined_score:
+        left1, left2 = _myers_miller(
+            codes1[:mid - 1], codes2[:gap_split], match, mismatch, gap_open, gap_extend, top, gap_extend
+        )
+        right1, right2 = _myers_miller(
+            codes1[mid + 1:], codes2[gap_split:], match, mismatch, gap_open, gap_extend, gap_extend, bottom
+        )
+        return left1 + [int(codes1[mid - 1]), int(codes1[mid])] + right1, left2 + [None, None] + right2
+    left1, left2 = _myers_miller(codes1[:mid], codes2[:split], match, mismatch, gap_open, gap_extend, top, gap_open)
+    right1, right2 = _myers_miller(
+        codes1[mid:], codes2[split:], match, mismatch, gap_open, gap_extend, gap_open, bottom
+    )
+    return left1 + right1, left2 + right2
+
+def myers_miller(seq1, seq2, match=2, mismatch=-1, gap_open=-3, gap_extend=-1, timings=None):
+    """
+    Perform global affine-gap alignment in linear memory, the counterpart of hirschberg for gotoh().
+    The score is identical to gotoh; on ties a different optimal alignment may be returned.
+    :param seq1: First sequence (list of tokens).
+    :param seq2: Second sequence (list of tokens).
+    :param match: Score for a match.
+    :param mismatch: Penalty for a mismatch.
+    :param gap_open: Penalty for the first position of a gap.
+    :param gap_extend: Penalty for every further position of a gap; must not be below gap_open.
+    :param timings: Optional dictionary receiving the seconds spent in the "dp_fill" and "traceback" stages.
+    :return: Alignment score and aligned sequences.
+    """
+    _check_affine(gap_open, gap_extend)
+    # Keep the rolling rows over the shorter sequence so memory is O(min(n, m))
+    if len(seq2) > len(seq1):
+        score, aligned_seq2, aligned_seq1 = myers_miller(seq2, seq1, match, mismatch, gap_open, gap_extend, timings)
+        return score, aligned_seq1, aligned_seq2
+
+    start = time.perf_counter()
+    vocabulary, codes1, codes2 = intern_tokens(seq1, seq2)
+    score = int(_affine_last_rows(codes1, codes2, match, mismatch, gap_open, gap_extend, gap_open)[0][-1])
+    aligned1, aligned2 = _myers_miller(codes1, codes2, match, mismatch, gap_open, gap_extend, gap_open, gap_open)
+    start = _add_timing(timings, "dp_fill", start)
+    aligned_seq1 = ["-" if code is None else vocabulary[code] for code in aligned1]
+    aligned_seq2 = ["-" if code is None else vocabulary[code] for code in aligned2]
+    _add_timing(timings, "traceback", start)
+    return score, aligned_seq1, aligned_seq2
+
+# Alignment engines selectable through perform_alignment
+ENGINES = {
+    "python": needleman_wunsch,
+    "numpy": needleman_wunsch_numpy,
+    "hirschberg": hirschberg,
+}
+
 def calculate_normalized_similarity(score, len_seq1, len_seq2):
     norm_similarity = score / max(len_seq1, len_seq2)
     return norm_similarity
 
-def perform_alignment(file1_content, file2_content):
+def perform_alignment(file1_content, file2_content, **options):
     """
     Perform pairwise alignment for Python files using token-based Needleman-Wunsch algorithm.
     Calculate E-value for the alignment score.
     :param file1_content: Content of the first Python file.
     :param file2_content: Content of the second Python file.
+    :param options: Alignment options passed on to align_tokens.
     :return: Dictionary with similarity score, aligned sequences, and E-value.
     """
     # Tokenize and abstract both files
-    tokens1 = abstract_tokens(tokenize_code(file1_content))
-    tokens2 = abstract_tokens(tokenize_code(file2_content))
+    tokens1 = tokenize_abstract(file1_content)
+    tokens2 = tokenize_abstract(file2_content)
+    return align_tokens(tokens1, tokens2, **options)
+
+def align_tokens(tokens1, tokens2, match=2, mismatch=-1, gap=-2, engine="auto",
+                 linear_memory_threshold=LINEAR_MEMORY_THRESHOLD, score_only=False, band=None, timings=None,
+                 mode="global", gap_open=None, gap_extend=None):
+    """
+    Align two abstract token sequences and summarize the result.
+    :param tokens1: Abstract tokens of the first file.
+    :param tokens2: Abstract tokens of the second file.
+    :param match: Score for a match.
+    :param mismatch: Penalty for a mismatch.
+    :param gap: Penalty for a gap.
+    :param engine: One of ENGINES, or "auto" to pick "numpy" or "hirschberg" by matrix size. In score_only
+        mode, "auto" uses the bit-parallel kernels wherever they give the same result (see bitparallel_scheme):
+        the LCS for the whole result under the "lcs" scheme; under either scheme a band is skipped and the
+        result is exact.
+        "bitparallel" does the same but raises ValueError for full alignments and schemes without a kernel.
+    :param linear_memory_threshold: Number of DP cells above which "auto" uses Hirschberg's linear-memory mode.
+    :param score_only: Skip the traceback and return only the scores (see needleman_wunsch_score). The similarity
+        is that of the "numpy" and "python" engines; "hirschberg" may pick another alignment on ties.
+    :param band: Optional band width for score_only mode; adds "score_bounds" and "exact" to the result.
+        Schemes with a bit-parallel kernel ignore the band and report their exact score as both bounds.
+    :param timings: Optional dictionary receiving the seconds spent per stage ("dp_fill", "traceback").
+    :param mode: One of MODES; "local" aligns the best-matching regions (Smith-Waterman) and adds their
+        token span [start1, end1, start2, end2] to the result as "span".
+    :param gap_open: Penalty for opening a gap; with gap_extend this selects affine gaps (Gotoh).
+        Either one defaults to gap, and both default to the linear penalty gap.
+    :param gap_extend: Penalty for extending a gap.
+    :return: Dictionary with similarity, Needleman-Wunsch score, normalized score and aligned sequences.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown alignment mode: {mode}")
+    if mode == "local" or gap_open is not None or gap_extend is not None:
+        gap_open = gap if gap_open is None else gap_open
+        gap_extend = gap if gap_extend is None else gap_extend
+        return _align_affine(tokens1, tokens2, match, mismatch, gap_open, gap_extend, mode == "local",
+                             linear_memory_threshold, score_only, timings)
+
+    if engine == "bitparallel":
+        if not score_only:
+            raise ValueError("The bitparallel engine only computes scores; use it with score_only.")
+        if bitparallel_scheme(match, mismatch, gap) is None:
+            raise ValueError(f"No bit-parallel equivalent for match={match}, mismatch={mismatch}, gap={gap}")
 
-    # Perform alignment
-    alignment_score, aligned_tokens1, aligned_tokens2 = needleman_wunsch(tokens1, tokens2)
+    if score_only:
+        start = time.perf_counter()
+        scheme = bitparallel_scheme(match, mismatch, gap) if engine in ("auto", "bitparallel") else None
+        if scheme == "lcs":
+            # The path of the traceback then has exactly LCS matches and no mismatches, which fixes the similarity
+            matches = lcs_length(tokens1, tokens2)
+            total_length = len(tokens1) + len(tokens2) - matches
+            alignment_score = upper = gap * (len(tokens1) + len(tokens2)) + (match - 2 * gap) * matches
+        else:
+            # Under the "edit" scheme the score is exact without a band, so only the path statistics
+            # of the similarity need the rolling rows, and those over the whole matrix
+            alignment_score, matches, total_length, upper = needleman_wunsch_score(
+                tokens1, tokens2, match, mismatch, gap, band=None if scheme is not None else band
+            )
+        _add_timing(timings, "dp_fill", start)
+        similarity = matches / total_length if total_length > 0 else 0
+        norm_score = calculate_normalized_similarity(alignment_score, len(tokens1), len(tokens2))
+        result = {
+            "similarity": round(similarity, 3),
+            "needleman_score": alignment_score,
+            "norm_score": round(norm_score, 3)
+        }
+        if band is not None:
+            result["score_bounds"] = [alignment_score, upper]
+            result["exact"] = upper == alignment_score
+        return result
+
+    # Perform alignment, switching to linear memory when the full matrix would be too large
+    if engine == "auto":
+        cells = (len(tokens1) + 1) * (len(tokens2) + 1)
+        engine = "hirschberg" if cells > linear_memory_threshold else "numpy"
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown alignment engine: {engine}")
+    alignment_score, aligned_tokens1, aligned_tokens2 = ENGINES[engine](
+        tokens1, tokens2, match, mismatch, gap, timings=timings
+    )
+    start = time.perf_counter()
 
     # Calculate matches
     matches = sum(1 for t1, t2 in zip(aligned_tokens1, aligned_tokens2) if t1 == t2 and t1 != "-" and t2 != "-")
@@ -192,10 +1137,179 @@ def perform_alignment(file1_content, file2_content):
     # Calculate normalized similarity
     norm_score = calculate_normalized_similarity(alignment_score, len(tokens1), len(tokens2))
 
-    return {
+    result = {
         "similarity": round(similarity, 3),
         "needleman_score": alignment_score,
         "norm_score": round(norm_score, 3),
-        "aligned_file1": " ".join(aligned_tokens1),
-        "aligned_file2": " ".join(aligned_tokens2)
+        "aligned_file1": " ".join(map(str, aligned_tokens1)),
+        "aligned_file2": " ".join(map(str, aligned_tokens2))
+    }
+    _add_timing(timings, "traceback", start)
+    return result
+
+def _align_affine(tokens1, tokens2, match, mismatch, gap_open, gap_extend, local, linear_memory_threshold,
+                  score_only, timings):
+    """
+    Affine-gap and local branch of align_tokens.
+    Large local alignments first locate the best-matching span with rolling rows and then run the traceback
+    only on that span, whose optimal global alignment has the same score. Global alignments, including such
+    spans, switch to myers_miller when the full traceback matrix would exceed linear_memory_threshold cells.
+    """
+    start = time.perf_counter()
+    cells = (len(tokens1) + 1) * (len(tokens2) + 1)
+    if score_only or (local and cells > linear_memory_threshold):
+        alignment_score, matches, total_length, span = gotoh_score(
+            tokens1, tokens2, match, mismatch, gap_open, gap_extend, local
+        )
+        start = _add_timing(timings, "dp_fill", start)
+    if score_only:
+        aligned_tokens1 = aligned_tokens2 = None
+    elif cells > linear_memory_threshold:
+        region1, region2 = tokens1, tokens2
+        if local:
+            start1, end1, start2, end2 = span
+            region1, region2 = tokens1[start1:end1], tokens2[start2:end2]
+        if (len(region1) + 1) * (len(region2) + 1) > linear_memory_threshold:
+            alignment_score, aligned_tokens1, aligned_tokens2 = myers_miller(
+                region1, region2, match, mismatch, gap_open, gap_extend, timings=timings
+            )
+        else:
+            alignment_score, aligned_tokens1, aligned_tokens2, _ = gotoh(
+                region1, region2, match, mismatch, gap_open, gap_extend, timings=timings
+            )
+    else:
+        alignment_score, aligned_tokens1, aligned_tokens2, span = gotoh(
+            tokens1, tokens2, match, mismatch, gap_open, gap_extend, local, timings=timings
+        )
+    start = time.perf_counter()
+
+    if aligned_tokens1 is not None:
+        matches = sum(1 for t1, t2 in zip(aligned_tokens1, aligned_tokens2) if t1 == t2 and t1 != "-")
+        total_length = len(aligned_tokens1)
+    similarity = matches / total_length if total_length > 0 else 0
+    norm_score = calculate_normalized_similarity(alignment_score, len(tokens1), len(tokens2))
+    result = {
+        "similarity": round(similarity, 3),
+        "needleman_score": alignment_score,
+        "norm_score": round(norm_score, 3)
     }
+    if aligned_tokens1 is not None:
+        result["aligned_file1"] = " ".join(map(str, aligned_tokens1))
+        result["aligned_file2"] = " ".join(map(str, aligned_tokens2))
+    if local:
+        result["span"] = list(span)
+    _add_timing(timings, "traceback", start)
+    return result
+
+
+# Alignment options of the command line, set once per worker process by _init_cli_worker
+_cli_options = None
+
+def _init_cli_worker(options):
+    global _cli_options
+    _cli_options = options
+
+@lru_cache(maxsize=256)
+def _file_tokens(path):
+    """Abstract tokens of a file, kept per worker process since a file usually takes part in many pairs."""
+    with open(path, encoding="utf-8", errors="replace") as file:
+        return tokenize_abstract(file.read())
+
+def _align_files(pairs):
+    """Align a chunk of (path1, path2) pairs; runs inside worker processes."""
+    records = []
+    for path1, path2 in pairs:
+        record = {"file1": path1, "file2": path2}
+        if path2 is None:
+            record["error"] = "Expected two tab-separated paths."
+        else:
+            try:
+                record.update(align_tokens(_file_tokens(path1), _file_tokens(path2), **_cli_options))
+            except (OSError, ValueError, ZeroDivisionError) as error:
+                record["error"] = str(error)
+        records.append(record)
+    return records
+
+def expand_paths(patterns):
+    """
+    Expand files, directories (searched recursively for .py files) and glob patterns into a list of files.
+    :return: Sorted list of distinct file paths.
+    """
+    # Imported here since batch imports this module, which also runs without it as a script
+    from .batch import python_files
+
+    paths = set()
+    for pattern in patterns:
+        for path in glob.glob(pattern, recursive=True) or [pattern]:
+            if os.path.isdir(path):
+                paths.update(python_files(path))
+            else:
+                paths.add(path)
+    return sorted(paths)
+
+def read_pairs(stream):
+    """
+    Read tab-separated "path1<TAB>path2" lines, skipping blank ones.
+    Malformed lines are yielded as (line, None), which _align_files reports as an error record.
+    """
+    for line in stream:
+        if line.strip():
+            fields = line.rstrip("\n").split("\t")
+            yield tuple(fields) if len(fields) == 2 else (line.rstrip("\n"), None)
+
+def align_many(pairs, workers=None, chunk_size=16, **options):
+    """
+    Align many pairs of files across a process pool (see batch.run_chunks).
+    Files are read and tokenized inside the workers and at most two chunks per worker are in flight,
+    so arbitrarily long pair streams are processed in constant memory.
+    :param pairs: Iterable of (path1, path2) pairs.
+    :param workers: Number of worker processes (None for one per CPU, 0 to align in this process).
+    :param chunk_size: Number of pairs aligned per task.
+    :param options: Options passed on to align_tokens.
+    :return: Generator of result dictionaries with "file1" and "file2" (or "error"), in completion order.
+    """
+    from .batch import run_chunks
+
+    iterator = iter(pairs)
+    chunks = iter(lambda: list(islice(iterator, chunk_size)), [])
+    yield from run_chunks(_align_files, chunks, workers, _init_cli_worker, (options,))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Align Python files offline and write one JSON result per pair to stdout."
+    )
+    parser.add_argument("paths", nargs="*", help="files, directories or glob patterns (all pairs are aligned)")
+    parser.add_argument("--reference", help="align every path against this file instead of all pairs")
+    parser.add_argument("--pairs", help="file with tab-separated pairs of paths, - for stdin")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="pairs aligned per task")
+    parser.add_argument("--alignment", action="store_true", help="include the aligned token sequences")
+    parser.add_argument("--mode", choices=MODES, default="global")
+    parser.add_argument("--match", type=int, default=DEFAULT_SCORING["match"])
+    parser.add_argument("--mismatch", type=int, default=DEFAULT_SCORING["mismatch"])
+    parser.add_argument("--gap", type=int, default=DEFAULT_SCORING["gap"])
+    parser.add_argument("--gap-open", type=int, default=None)
+    parser.add_argument("--gap-extend", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    options = {
+        "match": args.match, "mismatch": args.mismatch, "gap": args.gap, "mode": args.mode,
+        "gap_open": args.gap_open, "gap_extend": args.gap_extend, "score_only": not args.alignment
+    }
+    with contextlib.ExitStack() as stack:
+        if args.pairs:
+            stream = sys.stdin if args.pairs == "-" else stack.enter_context(open(args.pairs, encoding="utf-8"))
+            pairs = read_pairs(stream)
+        elif args.reference:
+            pairs = ((path, args.reference) for path in expand_paths(args.paths) if path != args.reference)
+        else:
+            pairs = combinations(expand_paths(args.paths), 2)
+
+        for record in align_many(pairs, workers=args.workers, chunk_size=args.chunk_size, **options):
+            sys.stdout.write(json.dumps(record) + "\n")
+            sys.stdout.flush()
+
+if __name__ == "__main__":
+    # Import through the package so worker processes resolve the functions as app.alignment.*
+    from app.alignment import main as alignment_main
+    alignment_main()
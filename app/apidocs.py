@@ -0,0 +1,42 @@
+import threading
+
+# Paths served by flasgger with its default configuration: the UI, its static files and the JSON spec
+DOCS_PATHS = ("/apidocs", "/apispec", "/flasgger_static", "/oauth2-redirect.html")
+
+
+class LazySwagger:
+    """
+    WSGI middleware serving the Swagger UI from an app that is only built on the first request to it.
+    Importing flasgger and collecting the view docstrings is thereby kept out of application startup.
+    The docs app mirrors the URL rules and view functions of the main app, which is all flasgger reads
+    to build the spec; every other request goes straight to the main app.
+    """
+
+    def __init__(self, app, wsgi_app):
+        self.app = app
+        self.wsgi_app = wsgi_app
+        self.docs = None
+        self._lock = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO", "").startswith(DOCS_PATHS):
+            return self.docs_app()(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+    def docs_app(self):
+        """Return the app serving the docs, creating it on first use."""
+        with self._lock:
+            if self.docs is None:
+                from flask import Flask
+                from flasgger import Swagger
+
+                docs = Flask(self.app.import_name)
+                docs.config.update(self.app.config)
+                for rule in self.app.url_map.iter_rules():
+                    if rule.endpoint != "static":
+                        docs.add_url_rule(
+                            rule.rule, rule.endpoint, self.app.view_functions[rule.endpoint], methods=rule.methods
+                        )
+                Swagger(docs)
+                self.docs = docs
+        return self.docs
@@ -0,0 +1,224 @@
+import argparse
+import heapq
+import io
+import json
+import os
+import sys
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import combinations, islice
+import numpy as np
+from .alignment import DEFAULT_SCORING, align_tokens, tokenize_abstract
+from .cache import pack_tokens, unpack_tokens
+
+# Token sequences of the current batch, set once per worker process by _init_worker
+_batch_tokens = None
+_batch_options = None
+
+
+def _init_worker(blobs, options):
+    global _batch_tokens, _batch_options
+    _batch_tokens = [unpack_tokens(blob) for blob in blobs]
+    _batch_options = options
+
+def _score_chunk(pairs):
+    """Score a chunk of (i, j) index pairs of the current batch; runs inside worker processes."""
+    results = []
+    for i, j in pairs:
+        result = align_tokens(_batch_tokens[i], _batch_tokens[j], score_only=True, **_batch_options)
+        results.append((i, j, result))
+    return results
+
+def _score_job(job):
+    """Score a chunk of pairs together with the packed tokens they refer to; runs inside job queue workers."""
+    blobs, pairs, options = job
+    tokens = {index: unpack_tokens(blob) for index, blob in blobs.items()}
+    return [(i, j, align_tokens(tokens[i], tokens[j], score_only=True, **options)) for i, j in pairs]
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _completed(futures, max_pending):
+    """Yield the results of lazily submitted futures, keeping at most max_pending of them in flight."""
+    pending = set()
+    for future in futures:
+        pending.add(future)
+        if len(pending) >= max_pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for done in finished:
+                yield from done.result()
+    for future in pending:
+        yield from future.result()
+
+def run_chunks(function, chunks, workers=None, initializer=None, initargs=(), executor=None):
+    """
+    Apply a function to chunks of work across a process pool and yield the items of the lists it returns.
+    At most two chunks per worker are in flight, so memory does not grow with the number of chunks.
+    :param function: Picklable function taking one chunk and returning a list of results.
+    :param chunks: Iterable of chunks, consumed lazily.
+    :param workers: Number of worker processes (None for one per CPU, 0 to run in this process).
+    :param initializer: Optional function run once per worker process, e.g. to receive shared data.
+    :param initargs: Arguments of the initializer.
+    :param executor: Running executor to submit the chunks to instead of starting a pool (e.g. the
+        jobs.JobQueue of the server); workers then only bounds the chunks in flight and initializer is not used.
+    :return: Generator of results in completion order.
+    """
+    max_pending = 2 * (workers or os.cpu_count() or 1)
+    if executor is not None:
+        yield from _completed((executor.submit(function, chunk) for chunk in chunks), max_pending)
+    elif workers == 0:
+        if initializer is not None:
+            initializer(*initargs)
+        for chunk in chunks:
+            yield from function(chunk)
+    else:
+        with ProcessPoolExecutor(workers, initializer=initializer, initargs=initargs) as pool:
+            yield from _completed((pool.submit(function, chunk) for chunk in chunks), max_pending)
+
+def score_pairs(blobs, pairs, options, workers=None, chunk_size=256, executor=None):
+    """
+    Score index pairs of packed token arrays in chunks across a process pool (see run_chunks).
+    :param blobs: Packed token arrays, each sent to every worker process once.
+    :param pairs: Iterable of (i, j) index pairs into blobs.
+    :param options: Keyword arguments of align_tokens (scoring parameters).
+    :param workers: Number of worker processes (None for one per CPU, 0 to score in this process).
+    :param chunk_size: Number of pairs scored per task.
+    :param executor: Running executor to submit the chunks to; every chunk then carries the arrays it needs.
+    :return: Generator of (i, j, score-only result) triples in completion order.
+    """
+    chunks = _chunks(pairs, chunk_size)
+    if executor is None:
+        return run_chunks(_score_chunk, chunks, workers, _init_worker, (blobs, options))
+    jobs = (({index: blobs[index] for pair in chunk for index in pair}, chunk, options) for chunk in chunks)
+    return run_chunks(_score_job, jobs, workers, executor=executor)
+
+class ArchiveTooLarge(ValueError):
+    """Raised when an archive holds more Python files or bytes than accepted."""
+
+
+def read_archive(data, max_bytes=None, max_files=None, max_total_bytes=None):
+    """
+    Extract the Python files of a zip archive.
+    The limits are checked against the archive directory before any member is decompressed.
+    :param data: Archive content as bytes or a binary file object.
+    :param max_bytes: Largest member size accepted, None for no limit.
+    :param max_files: Largest number of Python files accepted, None for no limit.
+    :param max_total_bytes: Largest uncompressed size of all accepted members together, None for no limit.
+    :return: List of (name, content) pairs; oversized and non-.py members are skipped.
+    :raises ArchiveTooLarge: If the accepted members exceed max_files or max_total_bytes.
+    """
+    with zipfile.ZipFile(data if hasattr(data, "read") else io.BytesIO(data)) as archive:
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir() and info.filename.endswith(".py")
+            and (max_bytes is None or info.file_size <= max_bytes)
+        ]
+        if max_files is not None and len(members) > max_files:
+            raise ArchiveTooLarge(f"The archive holds more than {max_files} Python files.")
+        # Members never decompress past the size recorded in the directory, so the sum bounds the reads
+        if max_total_bytes is not None and sum(info.file_size for info in members) > max_total_bytes:
+            raise ArchiveTooLarge(f"The archive holds more than {max_total_bytes} bytes of Python files.")
+        return [(info.filename, archive.read(info).decode("utf-8", errors="replace")) for info in members]
+
+def compare_all(files, workers=None, chunk_size=256, top_k=10, scoring=None, tokenizer=tokenize_abstract,
+                executor=None):
+    """
+    Compare every pair of files and build their similarity matrix.
+    Each file is tokenized exactly once and the pairs are scored with score_pairs, so memory beyond
+    the N x N matrix does not grow with the number of pairs.
+    :param files: List of (name, content) pairs.
+    :param workers: Number of worker processes (None for one per CPU, 0 to score in this process).
+    :param chunk_size: Number of pairs scored per task.
+    :param top_k: Number of most similar pairs to report.
+    :param scoring: Match/mismatch/gap scores, defaults to DEFAULT_SCORING.
+    :param tokenizer: Callable turning file content into abstract tokens (e.g. a cache lookup).
+    :param executor: Running executor to score the pairs in instead of starting a pool (see score_pairs).
+    :return: Dictionary with file names, similarity matrix and the top-k most similar pairs.
+    """
+    if top_k < 1:
+        raise ValueError("top_k must be at least 1")
+    names = [name for name, _ in files]
+    blobs = [pack_tokens(tokenizer(content)) for _, content in files]
+    options = dict(scoring or DEFAULT_SCORING)
+
+    matrix = np.eye(len(files))
+    top_pairs = []  # Min-heap of (similarity, i, j, result) holding the best top_k pairs
+
+    pairs = combinations(range(len(files)), 2)
+    for i, j, result in score_pairs(blobs, pairs, options, workers, chunk_size, executor):
+        matrix[i, j] = matrix[j, i] = result["similarity"]
+        entry = (result["similarity"], -i, -j, result)
+        if len(top_pairs) < top_k:
+            heapq.heappush(top_pairs, entry)
+        elif entry[:3] > top_pairs[0][:3]:
+            heapq.heapreplace(top_pairs, entry)
+
+    return {
+        "names": names,
+        "matrix": matrix.round(3).tolist(),
+        "top_pairs": [
+            {
+                "file1": names[-i],
+                "file2": names[-j],
+                "similarity": result["similarity"],
+                "needleman_score": result["needleman_score"],
+                "norm_score": result["norm_score"]
+            }
+            for _, i, j, result in sorted(top_pairs, key=lambda entry: entry[:3], reverse=True)
+        ]
+    }
+
+def python_files(directory):
+    """Yield the paths of the .py files below a directory, searched recursively in a stable order."""
+    for root, dirs, filenames in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(".py"):
+                yield os.path.join(root, filename)
+
+def collect_files(paths, max_bytes=None):
+    """
+    Gather Python files from paths that are .py files, directories (searched recursively) or zip archives.
+    :param max_bytes: Largest file size accepted, None for no limit; larger files are skipped.
+    :return: List of (name, content) pairs.
+    """
+    files = []
+    for path in paths:
+        if zipfile.is_zipfile(path):
+            with open(path, "rb") as archive:
+                files.extend((f"{path}:{name}", content) for name, content in read_archive(archive, max_bytes))
+        elif os.path.isdir(path):
+            files.extend(collect_files(python_files(path), max_bytes))
+        elif max_bytes is None or os.path.getsize(path) <= max_bytes:
+            with open(path, encoding="utf-8", errors="replace") as file:
+                files.append((path, file.read()))
+    return files
+
+def _positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="All-vs-all similarity of Python files.")
+    parser.add_argument("paths", nargs="+", help=".py files, directories or zip archives")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="pairs scored per task")
+    parser.add_argument("--top-k", type=_positive_int, default=10, help="number of most similar pairs to report")
+    args = parser.parse_args(argv)
+
+    files = collect_files(args.paths)
+    report = compare_all(files, workers=args.workers, chunk_size=args.chunk_size, top_k=args.top_k)
+    json.dump(report, sys.stdout)
+    sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    # Import through the package so worker processes resolve the functions as app.batch.*
+    from app.batch import main as batch_main
+    batch_main()
@@ -0,0 +1,200 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from .alignment import AbstractToken, tokenize_abstract
+
+# Abstract tokens indexed by their code, used to unpack stored token arrays
+TOKENS_BY_CODE = list(AbstractToken)
+
+
+def content_hash(content):
+    """
+    Compute the SHA-256 hex digest of decoded file content.
+    :param content: File content as a string.
+    :return: 64-character hex digest.
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def pack_tokens(tokens):
+    """Pack abstract tokens into a compact array with one byte per token."""
+    return bytes(tokens)
+
+def unpack_tokens(blob):
+    """Unpack a token array produced by pack_tokens."""
+    return [TOKENS_BY_CODE[code] for code in blob]
+
+
+class LRUCache:
+    """Thread-safe LRU cache evicting least recently used entries once the total size exceeds max_bytes."""
+
+    def __init__(self, max_bytes, sizeof=len):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key][0]
+
+    def put(self, key, value):
+        """Store value under key and evict old entries if the cache grew too large."""
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self.size -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return
+            self._entries[key] = (value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """Return hit/miss counters and the current occupancy."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "size_bytes": self.size,
+                "max_bytes": self.max_bytes
+            }
+
+
+class TokenCache:
+    """
+    Content-addressed cache of abstract token arrays.
+    Lookups go through an in-process LRU tier first and then an optional persistent store,
+    which must provide load(digest) -> bytes or None and save(digest, blob).
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, store=None):
+        self.memory = LRUCache(max_bytes)
+        self.store = store
+
+    def lookup(self, digest):
+        """Return the packed tokens stored for a content hash in any tier, or None."""
+        blob = self.memory.get(digest)
+        if blob is None and self.store is not None:
+            blob = self.store.load(digest)
+            if blob is not None:
+                self.memory.put(digest, blob)
+        return blob
+
+    def get_blob(self, content, digest=None):
+        """
+        Return the packed abstract tokens of content, tokenizing it only if no tier has them.
+        :param content: Decoded file content.
+        :param digest: Precomputed content_hash of content, if known.
+        :return: Token array as produced by pack_tokens.
+        """
+        digest = digest or content_hash(content)
+        blob = self.lookup(digest)
+        if blob is None:
+            blob = pack_tokens(tokenize_abstract(content))
+            self.put(digest, blob)
+        return blob
+
+    def put(self, digest, blob):
+        """Store packed tokens computed elsewhere (e.g. from a streamed upload) in all tiers."""
+        self.memory.put(digest, blob)
+        if self.store is not None:
+            self.store.save(digest, blob)
+
+    def get_tokens(self, content, digest=None):
+        """Return the abstract tokens of content as a list of AbstractToken values (see get_blob)."""
+        return unpack_tokens(self.get_blob(content, digest))
+
+
+def _result_size(result):
+    """Approximate the memory held by an alignment result by the length of its aligned sequences."""
+    return len(result.get("aligned_file1", "")) + len(result.get("aligned_file2", "")) + 64
+
+
+class ResultCache:
+    """
+    Cache of alignment results keyed by both content hashes, the scoring parameters, the alignment mode and
+    whether the result is score-only, so a score-only request never reuses the similarity of a full one.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.memory = LRUCache(max_bytes, sizeof=_result_size)
+
+    @staticmethod
+    def key(hash1, hash2, scoring, score_only=False):
+        return (
+            hash1, hash2, scoring["match"], scoring["mismatch"], scoring["gap"],
+            scoring.get("mode", "global"), scoring.get("gap_open"), scoring.get("gap_extend"), score_only
+        )
+
+    def get(self, hash1, hash2, scoring, score_only=False):
+        """Return a copy of the cached result for the pair, or None on a miss."""
+        result = self.memory.get(self.key(hash1, hash2, scoring, score_only))
+        return dict(result) if result is not None else None
+
+    def put(self, hash1, hash2, scoring, result, score_only=False):
+        self.memory.put(self.key(hash1, hash2, scoring, score_only), dict(result))
+
+    def stats(self):
+        return self.memory.stats()
+
+
+class TTLCache:
+    """Thread-safe cache whose entries expire ttl seconds after they were stored; a ttl of 0 disables it."""
+
+    def __init__(self, ttl, max_entries=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the value stored for key, or None if it is missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if self.clock() >= expires:
+                del self._entries[key]
+                return None
+            return value
+
+    def put(self, key, value):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, self.clock() + self.ttl)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key):
+        """Invalidate the entry for key."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,65 @@
+import os
+from sqlalchemy import event
+from .schema import upgrade_schema
+
+# Applied to every new SQLite connection: WAL lets readers run alongside a writer, busy_timeout makes
+# writers wait for the lock instead of failing with "database is locked"
+SQLITE_PRAGMAS = {"journal_mode": "WAL", "busy_timeout": 5000, "synchronous": "NORMAL"}
+
+
+def database_uri(url=None):
+    """
+    Return the SQLAlchemy database URI, taken from DATABASE_URL unless given.
+    :param url: Database URL; defaults to the DATABASE_URL environment variable or a local SQLite file.
+    :return: URI with the legacy "postgres://" scheme of some hosting providers rewritten.
+    """
+    url = url or os.environ.get("DATABASE_URL", "sqlite:///users.db")
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    return url
+
+def engine_options(uri, pool_size=5, max_overflow=10, pool_recycle=1800):
+    """
+    Build SQLAlchemy engine options for a database URI.
+    :param uri: Database URI.
+    :param pool_size: Connections kept open per process.
+    :param max_overflow: Extra connections opened under load.
+    :param pool_recycle: Seconds after which pooled connections are replaced.
+    :return: Keyword arguments for create_engine (SQLALCHEMY_ENGINE_OPTIONS).
+    """
+    if uri.startswith("sqlite") and (":memory:" in uri or uri.rstrip("/") == "sqlite:"):
+        return {}  # In-memory databases live in a single connection
+    options = {"pool_size": pool_size, "max_overflow": max_overflow, "pool_pre_ping": True}
+    if not uri.startswith("sqlite"):
+        options["pool_recycle"] = pool_recycle
+    return options
+
+def configure_database(app):
+    """Set the database URI and engine options of an app from the environment unless configured already."""
+    uri = app.config.setdefault("SQLALCHEMY_DATABASE_URI", database_uri())
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(
+        uri,
+        pool_size=int(os.environ.get("DATABASE_POOL_SIZE", 5)),
+        max_overflow=int(os.environ.get("DATABASE_MAX_OVERFLOW", 10))
+    ))
+    app.config.setdefault("SQLITE_PRAGMAS", dict(SQLITE_PRAGMAS))
+
+def enable_sqlite_pragmas(engine, pragmas=SQLITE_PRAGMAS):
+    """Run PRAGMA statements on every new connection of a SQLite engine; other engines are left as they are."""
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+def init_database(db):
+    """
+    Create missing tables and upgrade existing ones to the current schema.
+    :return: List of columns and indexes added to existing tables.
+    """
+    db.create_all()
+    return upgrade_schema(db)
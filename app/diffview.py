@@ -0,0 +1,66 @@
+import numpy as np
+from .storage import CODE_LABELS, GAP_CODE
+
+# Aligned positions rendered per page of the results view
+ROWS_PER_PAGE = 200
+
+# Source lines shown for a single token; longer tokens (e.g. docstrings) are truncated
+MAX_ROW_LINES = 12
+
+
+def _token_index(codes, offset, first):
+    """Index of the first token at or after an aligned position, given the index of the first aligned token."""
+    return first + int(np.count_nonzero(np.frombuffer(codes, dtype=np.uint8)[:offset] != GAP_CODE))
+
+def _source_side(code, index, token_lines, source_lines, previous):
+    """
+    Describe one side of a diff row.
+    :param previous: Line range of the previous token shown on this side, whose text is not repeated.
+    :return: Dictionary with the token label, its line range and source text, or None for a gap.
+    """
+    if code == GAP_CODE:
+        return None
+    first_lines, last_lines = token_lines
+    # The end marker of a file forms a token past its last line
+    if index >= len(first_lines) or first_lines[index] > len(source_lines):
+        return {"token": CODE_LABELS[code], "first": None, "last": None, "text": ""}
+    first, last = first_lines[index], min(last_lines[index], len(source_lines))
+    text = ""
+    if (first, last) != previous:
+        shown = source_lines[first - 1:min(last, first + MAX_ROW_LINES - 1)]
+        text = "\n".join(shown)
+        if last - first + 1 > len(shown) and shown:
+            text += f"\n... ({last - first + 1 - len(shown)} more lines)"
+    return {"token": CODE_LABELS[code], "first": first, "last": last, "text": text}
+
+def line_aligned_rows(codes1, codes2, lines1, lines2, source1, source2, offset=0, limit=ROWS_PER_PAGE, span=None):
+    """
+    Build one page of a line-aligned diff from two aligned token code arrays.
+    Only the requested window is decoded, so the cost of a page does not depend on the alignment length.
+    :param codes1: Token codes of the first aligned sequence (see storage.unpack_alignment_codes).
+    :param codes2: Token codes of the second aligned sequence.
+    :param lines1: Pair of arrays with the first and last source line of every token of the first file.
+    :param lines2: Same for the second file.
+    :param source1: Lines of the first file.
+    :param source2: Lines of the second file.
+    :param offset: First aligned position of the page.
+    :param limit: Number of aligned positions per page.
+    :param span: Aligned token span (start1, end1, start2, end2) of a local alignment, None for global ones.
+    :return: List of rows with a "status" (match, mismatch or gap) and the "left" and "right" sides.
+    """
+    index1 = _token_index(codes1, offset, span[0] if span else 0)
+    index2 = _token_index(codes2, offset, span[2] if span else 0)
+    previous1 = previous2 = None
+    rows = []
+    for code1, code2 in zip(codes1[offset:offset + limit], codes2[offset:offset + limit]):
+        left = _source_side(code1, index1, lines1, source1, previous1)
+        right = _source_side(code2, index2, lines2, source2, previous2)
+        if left is not None:
+            index1 += 1
+            previous1 = (left["first"], left["last"])
+        if right is not None:
+            index2 += 1
+            previous2 = (right["first"], right["last"])
+        status = "gap" if left is None or right is None else "match" if code1 == code2 else "mismatch"
+        rows.append({"status": status, "left": left, "right": right})
+    return rows
@@ -0,0 +1,225 @@
+import math
+import time
+import numpy as np
+from .alignment import DIAG, UP, LEFT, _add_timing, _nw_row, _nw_score_row, calculate_normalized_similarity
+from .storage import CODE_LABELS, GAP_CODE
+
+
+class IncrementalState:
+    """
+    What is kept of an aligned pair to re-align a revision of its first sequence against the same second one:
+    DP rows every `interval` rows of the first sequence and, for full alignments, the aligned path.
+    """
+
+    def __init__(self, codes1, codes2, scoring, score_only, interval, checkpoints, path, result):
+        self.codes1 = codes1
+        self.codes2 = codes2
+        self.scoring = scoring
+        self.score_only = score_only
+        self.interval = interval
+        self.checkpoints = checkpoints  # Row index -> tuple of row arrays (scores, plus matches/lengths)
+        self.path = path  # Aligned token codes of both sequences, None for score-only states
+        self.result = result
+        self.reused_rows = 0  # DP rows taken from the previous state when this one was computed
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the state."""
+        size = len(self.codes1) + len(self.codes2)
+        size += sum(row.nbytes for rows in self.checkpoints.values() for row in rows)
+        if self.path is not None:
+            size += len(self.path[0]) + len(self.path[1])
+        return size
+
+    def applies_to(self, codes2, scoring, score_only):
+        """Whether the state was computed for the same second sequence and options."""
+        return (self.scoring, self.score_only) == (scoring, score_only) and np.array_equal(self.codes2, codes2)
+
+
+def _common_prefix(codes1, codes2):
+    length = min(len(codes1), len(codes2))
+    mismatches = np.flatnonzero(codes1[:length] != codes2[:length])
+    return int(mismatches[0]) if len(mismatches) else length
+
+def _summary(score, matches, length, n, m):
+    """Scores of an alignment, rounded like align_tokens."""
+    similarity = matches / length if length > 0 else 0
+    return {
+        "similarity": round(similarity, 3),
+        "needleman_score": score,
+        "norm_score": round(calculate_normalized_similarity(score, n, m), 3)
+    }
+
+def _fill_directions(codes1, codes2, first, last, row, match, mismatch, gap, checkpoints=None, interval=None):
+    """
+    Compute rows first+1..last of the Needleman-Wunsch matrix with their traceback directions,
+    like needleman_wunsch_numpy, starting from the scores of row first.
+    :param checkpoints: Optional dictionary receiving the scores of every row that is a multiple of interval.
+    :return: Directions of rows first..last (row first is left empty unless it is row 0) and the last row.
+    """
+    m = len(codes2)
+    directions = np.zeros((last - first + 1, m + 1), dtype=np.int8)
+    directions[1:, 0] = UP
+    if first == 0:
+        directions[0, 1:] = LEFT
+    for i in range(first + 1, last + 1):
+        row, diag, up = _nw_row(row, codes1[i - 1], codes2, i, match, mismatch, gap)
+        cells = row[1:]
+        directions_row = directions[i - first, 1:]
+        directions_row |= (diag == cells) * np.int8(DIAG)
+        directions_row |= (up == cells) * np.int8(UP)
+        directions_row |= (row[:-1] + gap == cells) * np.int8(LEFT)
+        if checkpoints is not None and i % interval == 0:
+            checkpoints[i] = (row,)
+    return directions, row
+
+def _path_position(path, i, j):
+    """
+    Find the aligned position at which a path reaches cell (i, j).
+    :param path: Pair of cumulative token counts of the aligned sequences, both starting with 0.
+    :return: Number of aligned positions before the cell, or None if the path does not pass through it.
+    """
+    rows, columns = path
+    start = int(np.searchsorted(rows, i))  # First position of the path in row i
+    if start == len(rows) or rows[start] != i:
+        return None
+    # Within a row the path only moves right, one column per position
+    k = start + j - int(columns[start])
+    if start <= k < len(rows) and rows[k] == i and columns[k] == j:
+        return k
+    return None
+
+def _traceback(codes1, codes2, directions, first, prefix, previous):
+    """
+    Trace an alignment back from the last cell with the preference order of needleman_wunsch_numpy.
+    Once the path reaches a cell within the common prefix that the previous path passed through as well,
+    the rest of the previous path is reused, since every cell above it is unchanged.
+    :param directions: Directions of rows first..n.
+    :param prefix: Number of leading rows shared with the previous first sequence.
+    :param previous: Aligned codes of the previous path, or None.
+    :return: Aligned codes of both sequences, or None if the path left the computed rows without joining
+        the previous path.
+    """
+    path = None
+    if previous is not None:
+        path = tuple(np.concatenate(([0], np.cumsum(np.frombuffer(codes, dtype=np.uint8) != GAP_CODE)))
+                     for codes in previous)
+    codes1, codes2 = codes1.tolist(), codes2.tolist()
+    aligned1, aligned2 = [], []
+    i, j = len(codes1), len(codes2)
+    while i > 0 and j > 0:
+        if i <= prefix and path is not None:
+            position = _path_position(path, i, j)
+            if position is not None:
+                aligned1.reverse()
+                aligned2.reverse()
+                return previous[0][:position] + bytes(aligned1), previous[1][:position] + bytes(aligned2)
+        if i == first:
+            return None
+        if codes1[i - 1] == codes2[j - 1]:
+            aligned1.append(codes1[i - 1])
+            aligned2.append(codes2[j - 1])
+            i -= 1
+            j -= 1
+        elif directions[i - first, j] & UP:
+            aligned1.append(codes1[i - 1])
+            aligned2.append(GAP_CODE)
+            i -= 1
+        else:
+            aligned1.append(GAP_CODE)
+            aligned2.append(codes2[j - 1])
+            j -= 1
+
+    # Gaps at the border are the same whichever rows were computed
+    aligned1.extend(codes1[i - 1::-1] if i else [])
+    aligned2.extend([GAP_CODE] * i)
+    aligned1.extend([GAP_CODE] * j)
+    aligned2.extend(codes2[j - 1::-1] if j else [])
+    aligned1.reverse()
+    aligned2.reverse()
+    return bytes(aligned1), bytes(aligned2)
+
+def _checkpoint_interval(n, m, score_only, max_bytes):
+    """Return the smallest row interval at which the checkpoints of an n x m alignment fit into max_bytes."""
+    row_bytes = (m + 1) * np.dtype(np.int64).itemsize * (3 if score_only else 1)
+    return max(1, -(-n * row_bytes // max_bytes))
+
+def align_incremental(blob1, blob2, state=None, match=2, mismatch=-1, gap=-2, score_only=False, timings=None,
+                      max_bytes=None):
+    """
+    Align two packed token arrays, reusing the DP rows of a previous alignment of an earlier revision
+    of the first sequence against the same second sequence.
+    Rows are recomputed from the last checkpoint within the common prefix of both revisions; the result
+    is exactly that of align_tokens with the numpy engine (or of its score-only mode).
+    The common suffix cannot be reused: every row after the first changed token may change, and so may
+    the optimal path that the similarity is computed from.
+    :param blob1: Packed abstract tokens of the new revision of the first file.
+    :param blob2: Packed abstract tokens of the second file.
+    :param state: IncrementalState returned for the previous revision, or None.
+    :param match: Score for a match.
+    :param mismatch: Penalty for a mismatch.
+    :param gap: Penalty for a gap.
+    :param score_only: Skip the traceback, like align_tokens.
+    :param timings: Optional dictionary receiving the seconds spent in the "dp_fill" and "traceback" stages.
+    :param max_bytes: Optional memory budget of the checkpoints; they are spaced further apart than every
+        sqrt(n) rows if needed to stay within it.
+    :return: Tuple of (alignment result dictionary, IncrementalState for the next revision).
+    """
+    start = time.perf_counter()
+    codes1 = np.frombuffer(blob1, dtype=np.uint8)
+    codes2 = np.frombuffer(blob2, dtype=np.uint8)
+    n, m = len(codes1), len(codes2)
+    scoring = (match, mismatch, gap)
+    if state is not None and not state.applies_to(codes2, scoring, score_only):
+        state = None
+    if state is not None and np.array_equal(state.codes1, codes1):
+        return dict(state.result), state
+
+    # Start from the last checkpoint within the common prefix. The interval of the previous state is kept,
+    # or raised to a multiple of it if the new revision would exceed the budget, so its checkpoints stay usable.
+    prefix = _common_prefix(state.codes1, codes1) if state is not None else 0
+    interval = state.interval if state is not None else max(1, math.isqrt(n))
+    if max_bytes:
+        interval *= -(-_checkpoint_interval(n, m, score_only, max_bytes) // interval)
+    first = prefix - prefix % interval
+    checkpoints = {
+        row: rows for row, rows in state.checkpoints.items() if row <= first and row % interval == 0
+    } if state else {}
+    if 0 not in checkpoints:
+        columns = np.arange(m + 1, dtype=np.int64)
+        checkpoints[0] = (columns * gap, np.zeros(m + 1, dtype=np.int64), columns) if score_only else (columns * gap,)
+    first = max(checkpoints)
+
+    if score_only:
+        rows = tuple(row.copy() for row in checkpoints[first])
+        next_rows = tuple(np.empty_like(row) for row in rows)
+        for i in range(first + 1, n + 1):
+            _nw_score_row(rows, next_rows, codes1[i - 1], codes2, i, 0, m, match, mismatch, gap)
+            rows, next_rows = next_rows, rows
+            if i % interval == 0:
+                checkpoints[i] = tuple(row.copy() for row in rows)
+        scores, matches, lengths = rows
+        _add_timing(timings, "dp_fill", start)
+        result = _summary(int(scores[m]), int(matches[m]), int(lengths[m]), n, m)
+        path = None
+    else:
+        directions, last_row = _fill_directions(
+            codes1, codes2, first, n, checkpoints[first][0], match, mismatch, gap, checkpoints, interval
+        )
+        start = _add_timing(timings, "dp_fill", start)
+        path = _traceback(codes1, codes2, directions, first, prefix, state.path if state else None)
+        if path is None:
+            # The new path crossed the checkpoint row away from the previous path: fill the prefix rows too
+            prefix_directions, _ = _fill_directions(codes1, codes2, 0, first, checkpoints[0][0], match, mismatch, gap)
+            directions = np.concatenate((prefix_directions, directions[1:]))
+            path = _traceback(codes1, codes2, directions, 0, 0, None)
+        aligned1, aligned2 = path
+        matches = sum(1 for code1, code2 in zip(aligned1, aligned2) if code1 == code2 != GAP_CODE)
+        result = _summary(int(last_row[m]), matches, len(aligned1), n, m)
+        result["aligned_file1"] = " ".join(CODE_LABELS[code] for code in aligned1)
+        result["aligned_file2"] = " ".join(CODE_LABELS[code] for code in aligned2)
+        _add_timing(timings, "traceback", start)
+
+    new_state = IncrementalState(codes1.copy(), codes2.copy(), scoring, score_only, interval, checkpoints, path, result)
+    new_state.reused_rows = first
+    return dict(result), new_state
@@ -0,0 +1,63 @@
+import atexit
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from .alignment import align_tokens
+from .cache import unpack_tokens
+
+
+def align_packed(blob1, blob2, with_timings=False, **options):
+    """
+    Align two packed token arrays; runs inside worker processes.
+    :param blob1: Packed abstract tokens of the first file.
+    :param blob2: Packed abstract tokens of the second file.
+    :param with_timings: Also return the seconds spent per alignment stage, for the metrics of the caller.
+    :param options: Options passed on to align_tokens.
+    :return: Alignment result dictionary, or a (result, timings) pair if with_timings is set.
+    """
+    timings = {} if with_timings else None
+    result = align_tokens(unpack_tokens(blob1), unpack_tokens(blob2), timings=timings, **options)
+    return (result, timings) if with_timings else result
+
+
+class JobQueue:
+    """
+    Runs alignment jobs in a process pool and reports completion through callbacks.
+    The pool is started on the first submitted job; max_workers=0 runs jobs inline in the caller.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+                atexit.register(self.shutdown)
+            return self._executor
+
+    def submit(self, fn, *args, callback=None, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) and call callback(future) once it finished.
+        Callbacks of pooled jobs run in a background thread of this process.
+        :return: concurrent.futures.Future of the job.
+        """
+        if self.max_workers == 0:
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as error:
+                future.set_exception(error)
+        else:
+            future = self._get_executor().submit(fn, *args, **kwargs)
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+    def shutdown(self, wait=True):
+        """Stop the worker pool, if it was started."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
@@ -0,0 +1,66 @@
+import atexit
+import copy
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# Argument types that are safe to format later in the listener thread
+_PLAIN_TYPES = (str, int, float, bool, type(None))
+
+
+def _freeze(value):
+    return value if isinstance(value, _PLAIN_TYPES) else str(value)
+
+
+class StructuredQueueHandler(QueueHandler):
+    """
+    QueueHandler that keeps records structured: the message template and its arguments travel to the
+    listener thread separately, so %-formatting happens there instead of in the request.
+    Arguments that are not plain values are converted to strings first, because objects such as ORM
+    rows must not be touched from another thread; tracebacks are rendered for the same reason.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if isinstance(record.args, dict):
+            record.args = {key: _freeze(value) for key, value in record.args.items()}
+        elif record.args:
+            record.args = tuple(_freeze(value) for value in record.args)
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class QueueLogging:
+    """
+    Sends the records of a logger through a queue to handlers running in a background listener thread,
+    so that requests never wait for file I/O or log rotation.
+    """
+
+    def __init__(self, logger, *handlers):
+        self.logger = logger
+        self.queue = queue.SimpleQueue()
+        self.handler = StructuredQueueHandler(self.queue)
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.running = False
+
+    def start(self):
+        """Attach the queue handler and start the listener; stop() is also run at interpreter exit."""
+        if self.running:
+            return
+        self.logger.addHandler(self.handler)
+        self.listener.start()
+        self.running = True
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Detach the queue handler, write out all queued records and close the handlers."""
+        if not self.running:
+            return
+        self.logger.removeHandler(self.handler)
+        self.listener.stop()
+        self.running = False
+        for handler in self.listener.handlers:
+            handler.close()
+        atexit.unregister(self.stop)
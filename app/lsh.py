@@ -0,0 +1,82 @@
+import hashlib
+import numpy as np
+
+# Tokens per shingle; each token code takes 3 bits so a shingle fits into one uint64
+SHINGLE_SIZE = 5
+
+# Signature length and its split into LSH bands; 32 bands of 4 rows favour pairs with Jaccard above ~0.4
+NUM_PERMUTATIONS = 128
+NUM_BANDS = 32
+
+# Shingles hashed per block when computing signatures, bounding the temporary hash matrix
+SHINGLE_BLOCK = 4096
+
+
+def _hash_parameters(num_perm, seed=23):
+    """Odd multipliers and offsets of the multiply-shift hash functions used as permutations."""
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    offsets = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+    return multipliers, offsets
+
+_MULTIPLIERS, _OFFSETS = _hash_parameters(NUM_PERMUTATIONS)
+
+
+def shingles(tokens, k=SHINGLE_SIZE):
+    """
+    Encode the k-grams of an abstract token sequence as integers.
+    :param tokens: Sequence of abstract token codes (0-7), e.g. a list of AbstractToken or a packed array.
+    :param k: Shingle length in tokens (at most 15, as the length is stored in the top 4 bits).
+    :return: Sorted array of distinct uint64 shingles; sequences shorter than k form a single shingle.
+    """
+    if not 1 <= k <= 15:
+        raise ValueError(f"Shingle length must be between 1 and 15 tokens, got {k}")
+    codes = np.frombuffer(bytes(tokens), dtype=np.uint8).astype(np.uint64)
+    k = min(k, len(codes)) or 1
+    if not len(codes):
+        return np.zeros(1, dtype=np.uint64)
+    values = np.zeros(len(codes) - k + 1, dtype=np.uint64)
+    for offset in range(k):
+        values = (values << np.uint64(3)) | codes[offset:len(codes) - k + 1 + offset]
+    # Mark the shingle length so that short sequences do not collide with longer k-grams
+    return np.unique(values | np.uint64(k << 60))
+
+def minhash_signature(shingle_values):
+    """
+    Compute the MinHash signature of a set of shingles.
+    :param shingle_values: Array of uint64 shingles as returned by shingles().
+    :return: uint64 array of NUM_PERMUTATIONS minimum hash values.
+    """
+    signature = np.full(NUM_PERMUTATIONS, np.iinfo(np.uint64).max, dtype=np.uint64)
+    for start in range(0, len(shingle_values), SHINGLE_BLOCK):
+        block = shingle_values[start:start + SHINGLE_BLOCK]
+        hashed = block[None, :] * _MULTIPLIERS[:, None] + _OFFSETS[:, None]  # Wraps modulo 2^64
+        np.minimum(signature, hashed.min(axis=1), out=signature)
+    return signature
+
+def band_keys(signature, bands=NUM_BANDS):
+    """
+    Split a signature into LSH bands and hash each band to a bucket key.
+    :param signature: MinHash signature.
+    :param bands: Number of bands; must divide the signature length.
+    :return: List of (band, bucket) pairs with buckets as signed 64-bit integers.
+    """
+    keys = []
+    for band, rows in enumerate(np.split(signature, bands)):
+        digest = hashlib.blake2b(rows.tobytes(), digest_size=8).digest()
+        keys.append((band, int.from_bytes(digest, "big", signed=True)))
+    return keys
+
+def estimate_jaccard(signature1, signature2):
+    """Estimate the Jaccard similarity of two shingle sets from their signatures."""
+    return float(np.mean(signature1 == signature2))
+
+def signature_of(tokens):
+    """MinHash signature of an abstract token sequence."""
+    return minhash_signature(shingles(tokens))
+
+def pack_signature(signature):
+    return signature.astype(np.uint64).tobytes()
+
+def unpack_signature(blob):
+    return np.frombuffer(blob, dtype=np.uint64)
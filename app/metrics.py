@@ -0,0 +1,138 @@
+import cProfile
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the latency buckets in seconds
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Upper bounds of the size buckets (tokens, DP cells), powers of 4
+SIZE_BUCKETS = tuple(4 ** exponent for exponent in range(2, 18))
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(**labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+class Histogram:
+    """Thread-safe Prometheus histogram with an optional single label."""
+
+    def __init__(self, name, help, buckets, label=None):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets) + (math.inf,)
+        self.label = label
+        self._series = {}  # Label value -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_value=None):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, label_value=None):
+        """Return (cumulative bucket counts, sum, count) of one series."""
+        with self._lock:
+            counts, total, count = self._series.get(label_value, [[0] * len(self.buckets), 0.0, 0])
+            cumulative, running = [], 0
+            for bucket_count in counts:
+                running += bucket_count
+                cumulative.append(running)
+            return cumulative, total, count
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            label_values = sorted(self._series, key=str)
+        for label_value in label_values:
+            labels = {self.label: label_value} if self.label else {}
+            cumulative, total, count = self.snapshot(label_value)
+            for bound, bucket_count in zip(self.buckets, cumulative):
+                lines.append(f"{self.name}_bucket{_labels(**labels, le=_format_value(bound))} {bucket_count}")
+            lines.append(f"{self.name}_sum{_labels(**labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_labels(**labels)} {count}")
+        return lines
+
+
+stage_seconds = Histogram(
+    "filealigner_stage_seconds", "Time spent per pipeline stage.", STAGE_BUCKETS, label="stage"
+)
+request_seconds = Histogram(
+    "filealigner_request_seconds", "Request latency per endpoint.", STAGE_BUCKETS, label="endpoint"
+)
+token_counts = Histogram("filealigner_tokens", "Abstract tokens per processed file.", SIZE_BUCKETS)
+matrix_cells = Histogram("filealigner_dp_cells", "DP matrix cells per alignment.", SIZE_BUCKETS)
+
+HISTOGRAMS = [stage_seconds, request_seconds, token_counts, matrix_cells]
+
+
+@contextmanager
+def timed(stage):
+    """Record the duration of the enclosed block under a stage of filealigner_stage_seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, stage)
+
+def record_timings(timings):
+    """Record the stage durations collected by align_tokens(..., timings=...)."""
+    for stage, seconds in timings.items():
+        stage_seconds.observe(seconds, stage)
+
+def render_metrics(cache_stats=None):
+    """
+    Render all metrics in the Prometheus text exposition format.
+    :param cache_stats: Optional mapping of cache name to LRUCache.stats() dictionaries.
+    :return: Metrics page as a string.
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    if cache_stats:
+        for key, kind, help in (("hits", "counter", "Cache hits."), ("misses", "counter", "Cache misses."),
+                                ("entries", "gauge", "Cached entries."), ("size_bytes", "gauge", "Cache size in bytes."),
+                                ("max_bytes", "gauge", "Cache capacity in bytes.")):
+            name = f"filealigner_cache_{key}" + ("_total" if kind == "counter" else "")
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for cache, stats in cache_stats.items():
+                lines.append(f"{name}{_labels(cache=cache)} {stats[key]}")
+    return "\n".join(lines) + "\n"
+
+
+def start_profile():
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+def finish_profile(profiler, directory, name):
+    """
+    Stop a profiler started by start_profile and dump its statistics.
+    :param directory: Directory for the .prof files; created if missing.
+    :param name: Prefix of the file name, e.g. the endpoint.
+    :return: Path of the written file, readable with pstats or snakeviz.
+    """
+    profiler.disable()
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{id(profiler):x}.prof")
+    profiler.dump_stats(path)
+    return path
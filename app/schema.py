@@ -0,0 +1,31 @@
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+
+def upgrade_schema(db):
+    """
+    Add columns and indexes that were introduced after a table was first created.
+    db.create_all() only creates missing tables, so existing databases are upgraded in place
+    with ALTER TABLE ... ADD COLUMN; new columns therefore need to be nullable or have a server default.
+    :param db: Flask-SQLAlchemy extension whose models describe the target schema.
+    :return: List of "table.column" and "table.index" names that were added.
+    """
+    inspector = inspect(db.engine)
+    added = []
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {ddl}"))
+                added.append(f"{table.name}.{column.name}")
+            existing_indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    added.append(f"{table.name}.{index.name}")
+    return added
@@ -1,21 +1,74 @@
-#import os
+import os
+import time
+import random
 import uuid
 import logging
+import threading
+import zipfile
+from functools import partial
 from logging.handlers import RotatingFileHandler
-from flasgger import Swagger
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import (
+    Flask, current_app, render_template as flask_render_template, request, redirect, url_for, session, flash, g
+)
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, tuple_
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
-from .alignment import perform_alignment
+from .apidocs import LazySwagger
+from .alignment import align_tokens, source_lines, tokenize_lines, DEFAULT_SCORING, LINEAR_MEMORY_THRESHOLD, MODES
+from .cache import LRUCache, TokenCache, ResultCache, TTLCache, content_hash, unpack_tokens
+from .jobs import JobQueue, align_packed
+from .incremental import align_incremental
+from .batch import ArchiveTooLarge, compare_all, read_archive
+from .units import compare_units
+from .uploads import UploadTooLarge, format_size, hash_upload, tokenize_upload, compress_upload_text, read_upload_text
+from .lsh import signature_of, band_keys, estimate_jaccard, pack_signature, unpack_signature
+from .logs import QueueLogging
+from .database import configure_database, enable_sqlite_pragmas, init_database
+from .metrics import (
+    timed, record_timings, render_metrics, stage_seconds, request_seconds, token_counts, matrix_cells,
+    start_profile, finish_profile
+)
+from .storage import (
+    compress_text, decompress_text, encode_alignment, pack_alignment, unpack_alignment, unpack_alignment_codes
+)
+from .diffview import ROWS_PER_PAGE, line_aligned_rows
 
-app = Flask(__name__)
-app.secret_key = "23"
+db = SQLAlchemy()
 
-# Configure SQLAlchemy
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///users.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-db = SQLAlchemy(app)
+# Views and CLI commands registered on the application by create_app
+ROUTES = []
+COMMANDS = []
+
+def route(rule, **options):
+    """Record a view to be registered by create_app, like Flask's app.route; the endpoint is the function name."""
+    def decorator(view):
+        ROUTES.append((rule, view, options))
+        return view
+    return decorator
+
+def command(name):
+    """Record a function to be registered by create_app as a flask CLI command."""
+    def decorator(function):
+        COMMANDS.append((name, function))
+        return function
+    return decorator
+
+@event.listens_for(db.session, 'before_commit')
+def _start_commit_timer(session):
+    session.info['commit_started'] = time.perf_counter()
+
+@event.listens_for(db.session, 'after_commit')
+def _record_commit_time(session):
+    started = session.info.pop('commit_started', None)
+    if started is not None:
+        stage_seconds.observe(time.perf_counter() - started, 'db_commit')
+
+def render_template(template_name, **context):
+    """Render a template and record the time spent under the template_render stage."""
+    with timed('template_render'):
+        return flask_render_template(template_name, **context)
 
 # Database model for user
 class User(db.Model):
@@ -29,19 +82,73 @@ class AlignmentHistory(db.Model):
     user_id = db.Column(db.Integer, nullable=False)
     file1_name = db.Column(db.String(120), nullable=False)
     file2_name = db.Column(db.String(120), nullable=False)
-    file1_content = db.Column(db.Text, nullable=False)  # Content of File 1
-    file2_content = db.Column(db.Text, nullable=False)  # Content of File 2
-    aligned_file1 = db.Column(db.Text, nullable=False)  # Aligned content of File 1
-    aligned_file2 = db.Column(db.Text, nullable=False)  # Aligned content of File 2
+    # Legacy text columns, emptied by `flask migrate-storage`; new rows use the hash and code columns below
+    file1_content = db.deferred(db.Column(db.Text, nullable=False, default=''), group='legacy')
+    file2_content = db.deferred(db.Column(db.Text, nullable=False, default=''), group='legacy')
+    aligned_file1 = db.deferred(db.Column(db.Text, nullable=False, default=''), group='legacy')
+    aligned_file2 = db.deferred(db.Column(db.Text, nullable=False, default=''), group='legacy')
+    file1_hash = db.Column(db.String(64))  # ContentBlob of File 1
+    file2_hash = db.Column(db.String(64))  # ContentBlob of File 2
+    aligned_codes1 = db.deferred(db.Column(db.LargeBinary), group='alignment')  # Aligned tokens of File 1, packed
+    aligned_codes2 = db.deferred(db.Column(db.LargeBinary), group='alignment')  # Aligned tokens of File 2, packed
     score = db.Column(db.Float, nullable=False)
     similarity = db.Column(db.Float, nullable=False)
     norm_score = db.Column(db.Float, nullable=False)
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
     alignment_id = db.Column(db.String(36), unique=True, nullable=False)
+    # pending/done/failed, or queued for resumption after a restart (see requeue_pending_alignments)
+    status = db.Column(db.String(16), nullable=False, default='done', server_default='done')
+    scoring = db.Column(db.JSON)  # Scoring and mode the alignment was requested with, None for the defaults
+    span = db.Column(db.JSON)  # Aligned token span [start1, end1, start2, end2] of local alignments
+    __table_args__ = (db.Index('ix_alignment_history_user_date', 'user_id', 'date_created', 'id'),)
+
+    def file_contents(self):
+        """Return the contents of both files, read from the content blobs or from the legacy columns."""
+        if self.file1_hash is None:
+            return self.file1_content, self.file2_content
+        return load_content(self.file1_hash), load_content(self.file2_hash)
+
+    def aligned_sequences(self):
+        """Return both aligned token sequences, decoding the packed codes or reading the legacy columns."""
+        if self.aligned_codes1 is None:
+            return self.aligned_file1, self.aligned_file2
+        return unpack_alignment(self.aligned_codes1), unpack_alignment(self.aligned_codes2)
 
+    def alignment_codes(self):
+        """Return both aligned sequences as token code arrays (see storage.unpack_alignment_codes)."""
+        if self.aligned_codes1 is None:
+            return encode_alignment(self.aligned_file1), encode_alignment(self.aligned_file2)
+        return unpack_alignment_codes(self.aligned_codes1), unpack_alignment_codes(self.aligned_codes2)
 
-with app.app_context():
-    db.create_all()
+# Database model for uploaded file contents, stored compressed and once per content hash
+class ContentBlob(db.Model):
+    content_hash = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed UTF-8 text
+    size = db.Column(db.Integer, nullable=False)  # Uncompressed size in bytes
+
+# Database model for abstract tokens of uploaded files, addressed by content hash
+class TokenizedFile(db.Model):
+    content_hash = db.Column(db.String(64), primary_key=True)
+    tokens = db.Column(db.LargeBinary, nullable=False)  # One byte per abstract token
+    token_count = db.Column(db.Integer, nullable=False)
+
+# Database model for files in a user's MinHash similarity index
+class IndexedFile(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    content_hash = db.Column(db.String(64), nullable=False)
+    file_name = db.Column(db.String(120), nullable=False)
+    signature = db.Column(db.LargeBinary, nullable=False)  # MinHash signature of the abstract token k-grams
+    __table_args__ = (db.UniqueConstraint('user_id', 'content_hash'),)
+
+# Database model for the LSH buckets of indexed files, one row per signature band
+class MinHashBucket(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    band = db.Column(db.Integer, nullable=False)
+    bucket = db.Column(db.BigInteger, nullable=False)
+    file_id = db.Column(db.Integer, db.ForeignKey('indexed_file.id'), nullable=False)
+    __table_args__ = (db.Index('ix_min_hash_bucket_lookup', 'user_id', 'band', 'bucket'),)
 
 class SingletonLogger:
     """Singleton Logger for application-wide logging."""
@@ -53,9 +160,12 @@ class SingletonLogger:
             cls._instance.logger = logging.getLogger("FlaskAppLogger")
             cls._instance.logger.setLevel(logging.INFO)
 
-            handler = RotatingFileHandler('app.log', maxBytes=5 * 1024 * 1024, backupCount=3)
+            # The file handler runs in a listener thread; requests only put records on a queue.
+            # QueueLogging stops the listener at interpreter exit, which writes out the queued records.
+            handler = RotatingFileHandler('app.log', maxBytes=5 * 1024 * 1024, backupCount=3, delay=True)
             handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
-            cls._instance.logger.addHandler(handler)
+            cls._instance.queue_logging = QueueLogging(cls._instance.logger, handler)
+            cls._instance.queue_logging.start()
 
         return cls._instance
 
@@ -64,17 +174,370 @@ class SingletonLogger:
         """Return the singleton logger instance."""
         return SingletonLogger()._instance.logger
 
-# Initialize the logger
-app.logger = SingletonLogger.get_logger()
+class TokenStore:
+    """Persistent tier of the token cache backed by the TokenizedFile table."""
+
+    def load(self, digest):
+        row = db.session.get(TokenizedFile, digest)
+        return row.tokens if row else None
+
+    def save(self, digest, blob):
+        db.session.add(TokenizedFile(content_hash=digest, tokens=blob, token_count=len(blob)))
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another request stored the same content concurrently
+            db.session.rollback()
+
+class AppCaches:
+    """
+    In-memory caches of one application, sized from its configuration. They are kept in app.extensions
+    rather than in module globals, so applications on different databases never serve each other's rows.
+    """
+
+    def __init__(self, config):
+        self.tokens = TokenCache(config['TOKEN_CACHE_MAX_BYTES'], store=TokenStore())
+        self.results = ResultCache(config['RESULT_CACHE_MAX_BYTES'])
+        self.users = TTLCache(config['USER_CACHE_TTL'])
+        self.incremental = LRUCache(config['INCREMENTAL_CACHE_MAX_BYTES'], sizeof=lambda state: state.nbytes)
+        self.lines = LRUCache(
+            config['LINE_CACHE_MAX_BYTES'], sizeof=lambda lines: 2 * lines[0].itemsize * len(lines[0])
+        )
+
+def get_caches():
+    """Return the caches of the current application (see AppCaches)."""
+    return current_app.extensions['caches']
+
+def token_lines(content, digest=None):
+    """
+    Return the first and last source line of every abstract token of a file, tokenizing it on a cache miss.
+    :param content: Decoded file content.
+    :param digest: Content hash of content, if known.
+    :return: Pair of arrays parallel to the token sequence.
+    """
+    digest = digest or content_hash(content)
+    cache = get_caches().lines
+    lines = cache.get(digest)
+    if lines is None:
+        _, first, last = tokenize_lines(content)
+        lines = (first, last)
+        cache.put(digest, lines)
+    return lines
+
+def get_job_queue():
+    """Return the alignment job queue, created on first use with ALIGNMENT_WORKERS processes."""
+    queue = current_app.extensions.get('alignment_jobs')
+    if queue is None:
+        queue = current_app.extensions['alignment_jobs'] = JobQueue(current_app.config['ALIGNMENT_WORKERS'])
+    return queue
+
+def store_content(digest, content=None, stream=None, size=None):
+    """
+    Store file content compressed under its hash unless a blob for that hash exists already.
+    :param digest: content_hash of the content.
+    :param content: Decoded content, or None to compress an upload stream chunk by chunk instead.
+    :param stream: Binary upload stream, read only if the content is not stored yet.
+    :param size: Uncompressed size in bytes, if known.
+    """
+    if db.session.get(ContentBlob, digest) is not None:
+        return
+    if content is not None:
+        data, size = compress_text(content), len(content.encode('utf-8'))
+    else:
+        data = compress_upload_text(stream)
+    db.session.add(ContentBlob(content_hash=digest, data=data, size=size))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request stored the same content concurrently
+        db.session.rollback()
+
+def load_content(digest):
+    """Return the decompressed content stored under a hash."""
+    return decompress_text(db.session.get(ContentBlob, digest).data)
+
+def apply_alignment_result(alignment, result):
+    """Copy an alignment result into a history row and mark it as done."""
+    alignment.aligned_codes1 = pack_alignment(result['aligned_file1'])
+    alignment.aligned_codes2 = pack_alignment(result['aligned_file2'])
+    alignment.score = result['needleman_score']
+    alignment.similarity = result['similarity']
+    alignment.norm_score = result['norm_score']
+    alignment.span = result.get('span')
+    alignment.status = 'done'
+
+def parse_alignment_options(values):
+    """
+    Read the alignment mode and affine gap penalties of a request.
+    :param values: Form, query or JSON values with optional "mode", "gap_open" and "gap_extend".
+    :return: Dictionary with the given options, to be merged into ALIGNMENT_SCORING.
+    :raises ValueError: If an option is invalid.
+    """
+    options = {}
+    mode = values.get('mode') or 'global'
+    if mode not in MODES:
+        raise ValueError(f"The alignment mode must be one of: {', '.join(MODES)}.")
+    if mode != 'global':
+        options['mode'] = mode
+    for name in ('gap_open', 'gap_extend'):
+        value = values.get(name)
+        if value is None or value == '':
+            continue
+        try:
+            options[name] = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"The {name.replace('_', ' ')} penalty must be an integer.")
+    if 'gap_open' in options or 'gap_extend' in options:
+        gap = current_app.config['ALIGNMENT_SCORING']['gap']
+        if options.get('gap_open', gap) > options.get('gap_extend', gap):
+            raise ValueError("The gap open penalty must not be smaller than the gap extension penalty.")
+    return options
+
+def alignment_scoring(options=None):
+    """Return the scoring parameters of an alignment: ALIGNMENT_SCORING updated with request options."""
+    return dict(current_app.config['ALIGNMENT_SCORING'], **(options or {}))
+
+def enqueue_alignment(alignment_id, hash1, hash2, blob1, blob2, scoring=None):
+    """Submit the alignment of two packed token arrays to the job queue."""
+    scoring = scoring or alignment_scoring()
+    matrix_cells.observe((len(blob1) + 1) * (len(blob2) + 1))
+    get_job_queue().submit(
+        align_packed, blob1, blob2, **scoring,
+        engine=current_app.config['ALIGNMENT_ENGINE'],
+        linear_memory_threshold=current_app.config['LINEAR_MEMORY_THRESHOLD'],
+        with_timings=True,
+        callback=partial(finish_alignment, current_app._get_current_object(), alignment_id, hash1, hash2, scoring)
+    )
+
+def supports_incremental(blob1, blob2, scoring, score_only):
+    """Whether align_incremental gives the same result as the configured engine for these options."""
+    if scoring.get('mode', 'global') != 'global' or scoring.get('gap_open') is not None \
+            or scoring.get('gap_extend') is not None:
+        return False
+    engine = current_app.config['ALIGNMENT_ENGINE']
+    if engine == 'auto' and not score_only:
+        return (len(blob1) + 1) * (len(blob2) + 1) <= current_app.config['LINEAR_MEMORY_THRESHOLD']
+    return engine in ('auto', 'numpy', 'python')
+
+def run_alignment(hash1, hash2, blob1, blob2, score_only=False, scoring=None, incremental_key=None):
+    """
+    Align two packed token arrays in the job pool and wait for the result, reusing cached results.
+    Incremental alignments run in this process, next to their checkpoints.
+    :param score_only: Skip the traceback; the result then has no aligned sequences.
+    :param scoring: Scoring parameters, defaults to alignment_scoring().
+    :param incremental_key: Key under which the DP checkpoints of the alignment are kept, so that the next
+        revision of the first file aligned under the same key only recomputes the rows after their common prefix.
+    :return: Alignment result dictionary.
+    """
+    scoring = scoring or alignment_scoring()
+    caches = get_caches()
+    result = caches.results.get(hash1, hash2, scoring, score_only)
+    if result is not None:
+        return result
+    matrix_cells.observe((len(blob1) + 1) * (len(blob2) + 1))
+    if incremental_key is not None and supports_incremental(blob1, blob2, scoring, score_only):
+        key = (incremental_key, score_only)
+        timings = {}
+        # Runs in this process, where the checkpoints are kept, instead of copying them to a worker and back.
+        # The checkpoints of one alignment take at most a quarter of the cache, so several revisions fit.
+        result, state = align_incremental(
+            blob1, blob2, caches.incremental.get(key),
+            match=scoring['match'], mismatch=scoring['mismatch'], gap=scoring['gap'],
+            score_only=score_only, timings=timings,
+            max_bytes=current_app.config['INCREMENTAL_CACHE_MAX_BYTES'] // 4
+        )
+        caches.incremental.put(key, state)
+    else:
+        result, timings = get_job_queue().submit(
+            align_packed, blob1, blob2, **scoring,
+            engine=current_app.config['ALIGNMENT_ENGINE'],
+            linear_memory_threshold=current_app.config['LINEAR_MEMORY_THRESHOLD'],
+            score_only=score_only,
+            with_timings=True
+        ).result()
+    record_timings(timings)
+    caches.results.put(hash1, hash2, scoring, result, score_only)
+    return result
+
+def finish_alignment(app, alignment_id, hash1, hash2, scoring, future):
+    """Store the outcome of an alignment job; called by the job queue once the job finished."""
+    with app.app_context():
+        alignment = AlignmentHistory.query.filter_by(alignment_id=alignment_id).first()
+        if alignment is None:
+            return
+        try:
+            result, timings = future.result()
+        except Exception:
+            app.logger.exception("Alignment job failed: %s", alignment_id)
+            alignment.status = 'failed'
+        else:
+            record_timings(timings)
+            get_caches().results.put(hash1, hash2, scoring, result)
+            apply_alignment_result(alignment, result)
+        db.session.commit()
+
+def get_upload_tokens(upload, digest):
+    """Return the packed tokens of an upload, streaming it through the tokenizer only on a cache miss."""
+    cache = get_caches().tokens
+    blob = cache.lookup(digest)
+    if blob is None:
+        with timed('tokenize'):
+            blob = tokenize_upload(upload.stream)
+        cache.put(digest, blob)
+    token_counts.observe(len(blob))
+    return blob
+
+def index_file(user_id, file_name, digest, tokens):
+    """Add a file to the user's similarity index unless the same content is indexed already; commits the session."""
+    if IndexedFile.query.filter_by(user_id=user_id, content_hash=digest).first():
+        return
+    signature = signature_of(tokens)
+    entry = IndexedFile(user_id=user_id, content_hash=digest, file_name=file_name, signature=pack_signature(signature))
+    db.session.add(entry)
+    try:
+        db.session.flush()
+        db.session.add_all(
+            MinHashBucket(user_id=user_id, band=band, bucket=bucket, file_id=entry.id)
+            for band, bucket in band_keys(signature)
+        )
+        db.session.commit()
+    except IntegrityError:
+        # Another request indexed the same content concurrently
+        db.session.rollback()
+
+def find_similar_files(user_id, tokens, limit):
+    """
+    Look up files of a user that share at least one LSH bucket with the given tokens.
+    :return: Up to limit (estimated Jaccard similarity, IndexedFile) pairs, most similar first.
+    """
+    signature = signature_of(tokens)
+    file_ids = db.session.query(MinHashBucket.file_id).filter(
+        MinHashBucket.user_id == user_id,
+        tuple_(MinHashBucket.band, MinHashBucket.bucket).in_(band_keys(signature))
+    ).distinct()
+    candidates = IndexedFile.query.filter(IndexedFile.id.in_(file_ids)).all()
+    scored = [(estimate_jaccard(signature, unpack_signature(entry.signature)), entry) for entry in candidates]
+    scored.sort(key=lambda pair: pair[0], reverse=True)
+    return scored[:limit]
+
+def history_page(user_id, before=None, page_size=50):
+    """
+    Load one page of a user's alignments, newest first, using keyset pagination on (date_created, id).
+    Only the columns shown in the history list are loaded.
+    :param before: Cursor of the last row of the previous page, or None for the first page.
+    :return: Tuple of the alignments on the page and the cursor of the next page (None on the last page).
+    """
+    query = AlignmentHistory.query.filter(AlignmentHistory.user_id == user_id).options(db.load_only(
+        AlignmentHistory.alignment_id, AlignmentHistory.file1_name, AlignmentHistory.file2_name,
+        AlignmentHistory.similarity, AlignmentHistory.norm_score, AlignmentHistory.status,
+        AlignmentHistory.date_created
+    ))
+    if before is not None:
+        query = query.filter(tuple_(AlignmentHistory.date_created, AlignmentHistory.id) < before)
+    alignments = query.order_by(
+        AlignmentHistory.date_created.desc(), AlignmentHistory.id.desc()
+    ).limit(page_size + 1).all()
+    if len(alignments) <= page_size:
+        return alignments, None
+    last = alignments[page_size - 1]
+    return alignments[:page_size], f"{last.date_created.isoformat()}_{last.id}"
+
+def parse_history_cursor(cursor):
+    """Parse a cursor produced by history_page into a (date_created, id) pair, or None if it is invalid."""
+    date, _, alignment_id = (cursor or '').rpartition('_')
+    try:
+        return datetime.fromisoformat(date), int(alignment_id)
+    except ValueError:
+        return None
+
+def requeue_pending_alignments():
+    """
+    Mark the alignments that were still pending when the server stopped as queued for resumption.
+    Run at startup by init-db, while no server process is computing them.
+    :return: Number of queued alignments.
+    """
+    queued = AlignmentHistory.query.filter_by(status='pending').update({'status': 'queued'})
+    db.session.commit()
+    return queued
+
+def resume_pending_alignments():
+    """
+    Re-submit the alignments queued by requeue_pending_alignments. Every row is claimed with a conditional
+    update first, so with several server processes each alignment is resumed by exactly one of them, and
+    the pending rows of live processes are never touched.
+    """
+    resumed = 0
+    queued = [row.id for row in AlignmentHistory.query.filter_by(status='queued').with_entities(AlignmentHistory.id)]
+    for row_id in queued:
+        claimed = AlignmentHistory.query.filter_by(id=row_id, status='queued').update({'status': 'pending'})
+        db.session.commit()
+        if not claimed:
+            continue  # Claimed by another process
+        alignment = db.session.get(AlignmentHistory, row_id)
+        content1, content2 = alignment.file_contents()
+        hash1 = alignment.file1_hash or content_hash(content1)
+        hash2 = alignment.file2_hash or content_hash(content2)
+        tokens = get_caches().tokens
+        blob1, blob2 = tokens.get_blob(content1, hash1), tokens.get_blob(content2, hash2)
+        enqueue_alignment(alignment.alignment_id, hash1, hash2, blob1, blob2, alignment_scoring(alignment.scoring))
+        resumed += 1
+    if resumed:
+        current_app.logger.info("Resumed pending alignments: %d", resumed)
+
+_resume_lock = threading.Lock()
 
-swagger = Swagger(app)
+def resume_pending_once():
+    """Resume queued alignments on the first request served by this process."""
+    if current_app.extensions.get('pending_resumed'):
+        return
+    with _resume_lock:
+        if not current_app.extensions.get('pending_resumed'):
+            current_app.extensions['pending_resumed'] = True
+            resume_pending_alignments()
+
+def start_request_instrumentation():
+    """Start the request timer and, for admins sending the profile header, a sampled cProfile run."""
+    g.request_started = time.perf_counter()
+    if request.headers.get(current_app.config['PROFILE_HEADER']) and random.random() < current_app.config['PROFILE_SAMPLE_RATE']:
+        user = current_user()
+        if user is not None and user.username in current_app.config['ADMIN_USERS']:
+            g.profiler = start_profile()
+
+def finish_request_instrumentation(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        path = finish_profile(profiler, current_app.config['PROFILE_DIR'], request.endpoint or 'unknown')
+        response.headers[current_app.config['PROFILE_HEADER']] = os.path.basename(path)
+    started = g.pop('request_started', None)
+    if started is not None:
+        request_seconds.observe(time.perf_counter() - started, request.endpoint or 'unknown')
+    return response
+
+@command('init-db')
+def init_db():
+    """Create the database tables, upgrade an existing schema and queue interrupted alignments for resumption."""
+    added = init_database(db)
+    print(f"Database schema is up to date. Added: {', '.join(added) or 'nothing'}")
+    print(f"Queued interrupted alignments: {requeue_pending_alignments()}")
+
+def load_user(user_id):
+    """Load a user by id, serving it from the user cache while its entry is fresh."""
+    cache = get_caches().users
+    user = cache.get(user_id)
+    if user is None:
+        user = db.session.get(User, user_id)
+        if user is not None and cache.ttl > 0:
+            # Detach the loaded row so that it can be shared between requests
+            db.session.expunge(user)
+            cache.put(user_id, user)
+    return user
 
 def current_user():
-    """Retrieve the currently logged-in user."""
-    user_id = session.get('user_id')
-    if user_id:
-        return User.query.get(user_id)
-    return None
+    """Retrieve the currently logged-in user, loading it at most once per request."""
+    if 'user' not in g:
+        user_id = session.get('user_id')
+        g.user = load_user(user_id) if user_id else None
+    return g.user
 
 """
 def manage_alignment_storage(user_id):
@@ -88,7 +551,7 @@ def manage_alignment_storage(user_id):
                 os.rmdir(alignment_dir)
 """
 
-@app.route('/')
+@route('/')
 def index():
     """
     Landing page.
@@ -99,12 +562,12 @@ def index():
       200:
         description: Displays the landing page or redirects to /home if the user is logged in.
     """
-    app.logger.info("Index page accessed.")
+    current_app.logger.info("Index page accessed.")
     if current_user():
         return redirect(url_for('home'), code=303)
     return render_template('index.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@route('/register', methods=['GET', 'POST'])
 def register():
     """
     Register a new user.
@@ -139,12 +602,12 @@ def register():
         confirm_password = request.form.get('confirm_password')
 
         if password != confirm_password:
-            app.logger.warning("Registration failed: Passwords do not match.")
+            current_app.logger.warning("Registration failed: Passwords do not match.")
             flash('Passwords do not match.', 'error')
             return render_template('register.html'), 400
 
         if User.query.filter_by(username=username).first():
-            app.logger.warning("Registration failed: Username already exists.")
+            current_app.logger.warning("Registration failed: Username already exists.")
             flash("Username already exists. Please choose another one.", "error")
             return render_template('register.html'), 400
 
@@ -154,12 +617,12 @@ def register():
         db.session.commit()
 
         session['user_id'] = new_user.id
-        app.logger.info(f"User registered successfully: {username}")
+        current_app.logger.info("User registered successfully: %s", username)
         return redirect(url_for('home'), code=303)
 
     return render_template('register.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     """
     User login.
@@ -189,17 +652,17 @@ def login():
 
         user = User.query.filter_by(username=username).first()
         if user and check_password_hash(user.password_hash, password):
-            app.logger.info(f"User authorized successfully: {username}")
+            current_app.logger.info("User authorized successfully: %s", username)
             session['user_id'] = user.id
             return redirect(url_for('home'), code=303)
         else:
-            app.logger.warning(f"Authorization failed: Invalid username or password: { user }")
+            current_app.logger.warning("Authorization failed: Invalid username or password: %s", username)
             flash("Invalid username or password.", "error")
             return render_template('login.html'), 401
 
     return render_template('login.html', code=303)
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     """
     Log out the current user.
@@ -211,11 +674,12 @@ def logout():
         description: The user is successfully logged out.
     """
     user=current_user()
-    app.logger.info(f"User signed out successfully: { user }")
-    session.pop('user_id', None)
+    current_app.logger.info("User signed out successfully: %s", user.username if user else None)
+    get_caches().users.pop(session.pop('user_id', None))
+    g.pop('user', None)
     return redirect(url_for('index'), code=303)
 
-@app.route('/home')
+@route('/home')
 def home():
     """
     Home page for logged-in users.
@@ -228,11 +692,12 @@ def home():
       302:
         description: Redirects to the login page if the user is not authenticated.
     """
-    if not current_user():
+    user = current_user()
+    if not user:
         return {"error": "Unauthorized. Please log in."}, 401
-    return render_template('based/home.html', current_user=current_user()), 200
+    return render_template('based/home.html', current_user=user), 200
 
-@app.route('/tools/pairwise', methods=['GET', 'POST'])
+@route('/tools/pairwise', methods=['GET', 'POST'])
 def align():
     """
     Perform pairwise alignment for Python files.
@@ -252,6 +717,22 @@ def align():
         type: file
         required: true
         description: Second Python file to be compared
+      - name: mode
+        in: formData
+        type: string
+        enum: [global, local]
+        required: false
+        description: Align the whole files (global, default) or their best-matching regions (local)
+      - name: gap_open
+        in: formData
+        type: integer
+        required: false
+        description: Penalty for opening a gap; with gap_extend enables affine gap penalties
+      - name: gap_extend
+        in: formData
+        type: integer
+        required: false
+        description: Penalty for extending a gap
     responses:
       200:
         description: Alignment completed successfully
@@ -271,23 +752,32 @@ def align():
 
         # Validate file uploads
         if not file1 or not file2:
-            app.logger.warning("Alignment failed: Not all files uploaded.")
+            current_app.logger.warning("Alignment failed: Not all files uploaded.")
             errors.append("Both files are required.")
         if file1 and not file1.filename.endswith('.py'):
-            app.logger.warning("Alignment failed: Uploaded not a .py file.")
+            current_app.logger.warning("Alignment failed: Uploaded not a .py file.")
             errors.append("File 1 must be a Python file with a .py extension.")
         if file2 and not file2.filename.endswith('.py'):
-            app.logger.warning("Alignment failed: Uploaded not a .py file.")
+            current_app.logger.warning("Alignment failed: Uploaded not a .py file.")
             errors.append("File 2 must be a Python file with a .py extension.")
+        try:
+            options = parse_alignment_options(request.form)
+        except ValueError as error:
+            current_app.logger.warning("Alignment failed: %s", error)
+            errors.append(str(error))
 
-        # Validate file sizes
-        max_size = 1 * 1024 * 1024  # 1MB in bytes
-        if file1 and file1.content_length > max_size:
-            app.logger.warning("Alignment failed: Uploaded too big file.")
-            errors.append("File 1 must be smaller than 1MB.")
-        if file2 and file2.content_length > max_size:
-            app.logger.warning("Alignment failed: Uploaded too big file.")
-            errors.append("File 2 must be smaller than 1MB.")
+        # Validate file sizes while hashing the uploads chunk by chunk
+        max_size = current_app.config['UPLOAD_MAX_BYTES']
+        hashes = []
+        for number, upload in enumerate((file1, file2), 1):
+            if not upload or errors:
+                continue
+            try:
+                with timed('upload_read'):
+                    hashes.append(hash_upload(upload.stream, max_size))
+            except UploadTooLarge:
+                current_app.logger.warning("Alignment failed: Uploaded too big file.")
+                errors.append(f"File {number} must not be larger than {format_size(max_size)}.")
 
         # Handle errors
         if errors:
@@ -295,38 +785,239 @@ def align():
                 flash(error, "error")
             return redirect(url_for('align'), code=303)
 
-        # Read file content
-        file1_content = file1.read().decode('utf-8', errors='replace').strip()
-        file2_content = file2.read().decode('utf-8', errors='replace').strip()
+        # Stream the uploads through the tokenizer unless their tokens are cached already
+        (hash1, size1), (hash2, size2) = hashes
+        blob1, blob2 = get_upload_tokens(file1, hash1), get_upload_tokens(file2, hash2)
 
-        # Perform alignment
-        alignment_result = perform_alignment(file1_content, file2_content)
+        # Store each content once; uploads whose content is stored already are not read again
+        store_content(hash1, stream=file1.stream, size=size1)
+        store_content(hash2, stream=file2.stream, size=size2)
 
-        # Save results to the database
+        # Save the alignment as pending; the scores are filled in by the cache or a background job
+        alignment_id = str(uuid.uuid4())
         alignment = AlignmentHistory(
             user_id=session['user_id'],
             file1_name=file1.filename,
             file2_name=file2.filename,
-            file1_content=file1_content,
-            file2_content=file2_content,
-            aligned_file1=alignment_result['aligned_file1'],
-            aligned_file2=alignment_result['aligned_file2'],
-            score=alignment_result['needleman_score'],
-            similarity=alignment_result['similarity'],
-            norm_score=alignment_result['norm_score'],
-            alignment_id=str(uuid.uuid4())
+            file1_hash=hash1,
+            file2_hash=hash2,
+            score=0,
+            similarity=0,
+            norm_score=0,
+            status='pending',
+            alignment_id=alignment_id,
+            scoring=options or None
         )
+
+        # Reuse the result of an identical pair
+        scoring = alignment_scoring(options)
+        alignment_result = get_caches().results.get(hash1, hash2, scoring)
+        if alignment_result is not None:
+            current_app.logger.info("Alignment result reused from cache.")
+            apply_alignment_result(alignment, alignment_result)
+
         db.session.add(alignment)
         db.session.commit()
 
+        if alignment_result is None:
+            enqueue_alignment(alignment_id, hash1, hash2, blob1, blob2, scoring)
+
+        # Make both files searchable in the user's similarity index
+        index_file(session['user_id'], file1.filename, hash1, blob1)
+        index_file(session['user_id'], file2.filename, hash2, blob2)
 
-        app.logger.info(f"Alignment performed successfully: { AlignmentHistory.alignment_id }")
+        current_app.logger.info("Alignment performed successfully: %s", alignment_id)
 
-        return redirect(url_for('alignment_results', alignment_id=alignment.alignment_id), code=303)
+        return redirect(url_for('alignment_results', alignment_id=alignment_id), code=303)
 
     return render_template('based/align.html'), 200
 
-@app.route('/results/p/<alignment_id>')
+def parse_flag(value, default):
+    """Interpret a boolean option given as JSON value or as form/query string ("0", "false", "no", "off")."""
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() not in ('0', 'false', 'no', 'off')
+
+def read_api_uploads():
+    """
+    Read the two files of an API request from multipart uploads.
+    :return: List of (file name, content hash, packed tokens, store callback) tuples.
+    :raises ValueError: If a file is missing, not a Python file or too large.
+    """
+    files = []
+    for number in (1, 2):
+        upload = request.files.get(f'file{number}')
+        if not upload:
+            raise ValueError("Both files are required.")
+        if not upload.filename.endswith('.py'):
+            raise ValueError(f"File {number} must be a Python file with a .py extension.")
+        max_size = current_app.config['UPLOAD_MAX_BYTES']
+        try:
+            with timed('upload_read'):
+                digest, size = hash_upload(upload.stream, max_size)
+        except UploadTooLarge:
+            raise ValueError(f"File {number} must not be larger than {format_size(max_size)}.")
+        store = partial(store_content, digest, stream=upload.stream, size=size)
+        files.append((upload.filename, digest, get_upload_tokens(upload, digest), store))
+    return files
+
+def read_api_json(body):
+    """
+    Read the two files of an API request from a JSON body with file1/file2 contents and optional names.
+    :return: List of (file name, content hash, packed tokens, store callback) tuples.
+    :raises ValueError: If a file is missing or too large.
+    """
+    files = []
+    for number in (1, 2):
+        content = body.get(f'file{number}')
+        if not isinstance(content, str):
+            raise ValueError("Both files are required.")
+        max_size = current_app.config['UPLOAD_MAX_BYTES']
+        if len(content.encode('utf-8')) > max_size:
+            raise ValueError(f"File {number} must not be larger than {format_size(max_size)}.")
+        digest = content_hash(content)
+        name = str(body.get(f'file{number}_name') or f'file{number}.py')
+        files.append((name, digest, get_caches().tokens.get_blob(content, digest), partial(store_content, digest, content)))
+    return files
+
+@route('/api/v1/align', methods=['POST'])
+def api_align():
+    """
+    Align two Python files and return the result as JSON in a single round-trip.
+    ---
+    tags:
+      - API
+    consumes:
+      - multipart/form-data
+      - application/json
+    parameters:
+      - name: file1
+        in: formData
+        type: file
+        required: false
+        description: First Python file (multipart requests)
+      - name: file2
+        in: formData
+        type: file
+        required: false
+        description: Second Python file (multipart requests)
+      - name: persist
+        in: query
+        type: boolean
+        required: false
+        description: Save the alignment to the history (default true)
+      - name: include_alignment
+        in: query
+        type: boolean
+        required: false
+        description: Include the aligned token sequences in the response (default true)
+      - name: incremental
+        in: query
+        type: boolean
+        required: false
+        description: Keep DP checkpoints so the next revision of file1 against the same file2 is re-aligned incrementally
+      - name: body
+        in: body
+        required: false
+        description: JSON alternative to the multipart fields
+        schema:
+          type: object
+          properties:
+            file1: {type: string, description: Content of the first file}
+            file2: {type: string, description: Content of the second file}
+            file1_name: {type: string}
+            file2_name: {type: string}
+            persist: {type: boolean}
+            include_alignment: {type: boolean}
+            incremental: {type: boolean}
+            mode: {type: string, enum: [global, local, units]}
+            gap_open: {type: integer}
+            gap_extend: {type: integer}
+    responses:
+      200:
+        description: Alignment result; contains alignment_id if the alignment was saved. With mode "units" the
+          unit-level comparison report instead, which is never saved
+      400:
+        description: Missing, invalid or too large files
+      401:
+        description: The user is not logged in
+    """
+    if not current_user():
+        return {"error": "Unauthorized. Please log in."}, 401
+
+    # Options may be given in the JSON body, the form or the query string
+    body = request.get_json(silent=True) if request.is_json else None
+    options = dict(request.values, **body) if isinstance(body, dict) else request.values
+    persist = parse_flag(options.get('persist'), True)
+    include_alignment = parse_flag(options.get('include_alignment'), True)
+    incremental = parse_flag(options.get('incremental'), False)
+    try:
+        if request.is_json:
+            if not isinstance(body, dict):
+                raise ValueError("The request body must be a JSON object.")
+            files = read_api_json(body)
+        else:
+            files = read_api_uploads()
+        units = options.get('mode') == 'units'
+        alignment_options = parse_alignment_options(dict(options, mode='global') if units else options)
+    except ValueError as error:
+        current_app.logger.warning("API alignment failed: %s", error)
+        return {"error": str(error)}, 400
+
+    if units:
+        # Pair the top-level functions and classes of both files instead of aligning them as a whole
+        if request.is_json:
+            contents = [body['file1'], body['file2']]
+        else:
+            contents = [read_upload_text(request.files[f'file{number}'].stream) for number in (1, 2)]
+        report = compare_units(
+            [(files[0][0], contents[0])], [(files[1][0], contents[1])],
+            workers=current_app.config['ALIGNMENT_WORKERS'],
+            scoring=alignment_scoring(alignment_options),
+            executor=get_job_queue()
+        )
+        current_app.logger.info("API unit comparison performed successfully.")
+        return report, 200
+
+    (name1, hash1, blob1, store1), (name2, hash2, blob2, store2) = files
+    # Persisted alignments need the traceback for the results page
+    result = run_alignment(
+        hash1, hash2, blob1, blob2,
+        score_only=not (persist or include_alignment),
+        scoring=alignment_scoring(alignment_options),
+        # Revisions of file1 checked against the same file2 share their DP checkpoints
+        incremental_key=(session['user_id'], name1, hash2) if incremental else None
+    )
+
+    if persist:
+        store1()
+        store2()
+        alignment = AlignmentHistory(
+            user_id=session['user_id'],
+            file1_name=name1,
+            file2_name=name2,
+            file1_hash=hash1,
+            file2_hash=hash2,
+            alignment_id=str(uuid.uuid4()),
+            scoring=alignment_options or None
+        )
+        apply_alignment_result(alignment, result)
+        db.session.add(alignment)
+        db.session.commit()
+        index_file(session['user_id'], name1, hash1, blob1)
+        index_file(session['user_id'], name2, hash2, blob2)
+        result['alignment_id'] = alignment.alignment_id
+
+    if not include_alignment:
+        result.pop('aligned_file1', None)
+        result.pop('aligned_file2', None)
+
+    current_app.logger.info("API alignment performed successfully.")
+    return result, 200
+
+@route('/results/p/<alignment_id>')
 def alignment_results(alignment_id):
     """
     Retrieve and display the results of a specific alignment.
@@ -339,6 +1030,11 @@ def alignment_results(alignment_id):
         type: string
         required: true
         description: The unique ID of the alignment result
+      - name: offset
+        in: query
+        type: integer
+        required: false
+        description: First aligned position shown in the line-aligned diff (pages of RESULTS_PAGE_SIZE)
     responses:
       200:
         description: Displays the alignment results
@@ -353,30 +1049,61 @@ def alignment_results(alignment_id):
     ).first()
 
     if not alignment:
-        app.logger.warning("Alignment displaying failed: Result not found or access denied.")
+        current_app.logger.warning("Alignment displaying failed: Result not found or access denied.")
         return {"error": "Alignment result not found."}, 404
 
-    # Render results with alignment data from the database
+    if alignment.status != 'done':
+        status = 'pending' if alignment.status == 'queued' else alignment.status
+        return render_template(
+            'based/results.html',
+            status=status,
+            file1_name=alignment.file1_name,
+            file2_name=alignment.file2_name
+        ), 202 if status == 'pending' else 200
+
+    # Render results with alignment data from the database; only one page of the aligned sequences
+    # is mapped back to source lines
+    file1, file2 = alignment.file_contents()
+    codes1, codes2 = alignment.alignment_codes()
+    page_size = current_app.config['RESULTS_PAGE_SIZE']
+    offset = min(max(request.args.get('offset', 0, type=int), 0), max(len(codes1) - 1, 0))
+    rows = line_aligned_rows(
+        codes1, codes2,
+        token_lines(file1, alignment.file1_hash), token_lines(file2, alignment.file2_hash),
+        source_lines(file1), source_lines(file2),
+        offset=offset, limit=page_size, span=alignment.span
+    )
     return render_template(
         'based/results.html',
+        status=alignment.status,
+        scoring=alignment_scoring(alignment.scoring),
+        span=alignment.span,
         score=alignment.score,
         similarity=alignment.similarity,
         norm_score=alignment.norm_score,
-        file1=alignment.file1_content,
-        file2=alignment.file2_content,
-        file1_tokens=alignment.aligned_file1.split("\n"),  # Split tokens by lines
-        file2_tokens=alignment.aligned_file2.split("\n"),  # Split tokens by lines
+        rows=rows,
+        offset=offset,
+        total_rows=len(codes1),
+        previous_offset=max(offset - page_size, 0) if offset else None,
+        next_offset=offset + page_size if offset + page_size < len(codes1) else None,
+        alignment_id=alignment.alignment_id,
         file1_name=alignment.file1_name,
         file2_name=alignment.file2_name
     ), 200
 
-@app.route('/history')
+@route('/history')
 def history():
     """
     View user's alignment history.
     ---
     tags:
       - History
+    parameters:
+      - name: before
+        in: query
+        type: string
+        required: false
+        description: Cursor of the next page, as given by the "Older" link
     responses:
       200:
         description: Displays a list of past alignment results for the logged-in user.
@@ -386,11 +1113,300 @@ def history():
     if not current_user():
         return {"error": "Unauthorized. Please log in."}, 401
 
-    alignments = AlignmentHistory.query.filter_by(user_id=session['user_id']).order_by(
-        AlignmentHistory.date_created.desc()
-    ).all()
+    alignments, next_cursor = history_page(
+        session['user_id'],
+        before=parse_history_cursor(request.args.get('before')),
+        page_size=current_app.config['HISTORY_PAGE_SIZE']
+    )
+
+    return render_template(
+        'based/history.html',
+        alignments=alignments,
+        next_cursor=next_cursor,
+        paged='before' in request.args
+    ), 200
+
+@route('/tools/batch', methods=['GET', 'POST'])
+def batch():
+    """
+    Compare many Python files all-vs-all.
+    ---
+    tags:
+      - Tools
+    consumes:
+      - multipart/form-data
+    parameters:
+      - name: files
+        in: formData
+        type: file
+        required: false
+        description: Python files to be compared (the field may be repeated)
+      - name: archive
+        in: formData
+        type: file
+        required: false
+        description: Zip archive with Python files to be compared
+      - name: top_k
+        in: formData
+        type: integer
+        required: false
+        description: Number of most similar pairs to report (default 10)
+    responses:
+      200:
+        description: Similarity matrix and most similar pairs
+      400:
+        description: Error due to missing or invalid files
+    """
+    if not current_user():
+        return {"error": "Unauthorized. Please log in."}, 401
+
+    if request.method == 'POST':
+        max_size = current_app.config['UPLOAD_MAX_BYTES']
+        max_files = current_app.config['BATCH_MAX_FILES']
+        top_k = request.form.get('top_k', 10, type=int)
+        if top_k < 1:
+            current_app.logger.warning("Batch comparison failed: Invalid number of pairs.")
+            flash("The number of pairs to show must be at least 1.", "error")
+            return render_template('based/batch.html'), 400
+        files = []
+        for upload in request.files.getlist('files'):
+            if upload.filename.endswith('.py'):
+                try:
+                    hash_upload(upload.stream, max_size)
+                except UploadTooLarge:
+                    current_app.logger.warning("Batch comparison failed: Uploaded too big file.")
+                    flash(f"{upload.filename} must not be larger than {format_size(max_size)}.", "error")
+                    return render_template('based/batch.html'), 400
+                upload.stream.seek(0)
+                files.append((upload.filename, upload.stream.read().decode('utf-8', errors='replace')))
+        archive = request.files.get('archive')
+        if archive and archive.filename:
+            try:
+                files.extend(read_archive(archive.stream, max_size, max(max_files - len(files), 0),
+                                          current_app.config['BATCH_MAX_BYTES']))
+            except zipfile.BadZipFile:
+                current_app.logger.warning("Batch comparison failed: Invalid archive.")
+                flash("The archive must be a valid zip file.", "error")
+                return render_template('based/batch.html'), 400
+            except ArchiveTooLarge:
+                current_app.logger.warning("Batch comparison failed: Archive too large.")
+                flash(f"At most {max_files} files and {format_size(current_app.config['BATCH_MAX_BYTES'])} "
+                      "can be compared at once.", "error")
+                return render_template('based/batch.html'), 400
+
+        if len(files) < 2:
+            current_app.logger.warning("Batch comparison failed: Not enough Python files.")
+            flash("Upload at least two Python files.", "error")
+            return render_template('based/batch.html'), 400
+        if len(files) > max_files:
+            current_app.logger.warning("Batch comparison failed: Too many files.")
+            flash(f"At most {max_files} files can be compared at once.", "error")
+            return render_template('based/batch.html'), 400
+
+        # The pairs are scored in chunks on the alignment job pool instead of a pool of their own
+        report = compare_all(
+            files,
+            workers=current_app.config['ALIGNMENT_WORKERS'],
+            top_k=top_k,
+            scoring=current_app.config['ALIGNMENT_SCORING'],
+            tokenizer=get_caches().tokens.get_tokens,
+            executor=get_job_queue()
+        )
+        current_app.logger.info("Batch comparison performed successfully: %d files", len(files))
+        return render_template('based/batch.html', report=report), 200
+
+    return render_template('based/batch.html'), 200
+
+@route('/tools/search', methods=['GET', 'POST'])
+def search():
+    """
+    Find files similar to an upload among the user's previously aligned files.
+    ---
+    tags:
+      - Tools
+    consumes:
+      - multipart/form-data
+    parameters:
+      - name: file
+        in: formData
+        type: file
+        required: true
+        description: Python file to search for
+    responses:
+      200:
+        description: Candidates from the similarity index with their exact alignment scores
+      400:
+        description: Error due to a missing or invalid file
+    """
+    if not current_user():
+        return {"error": "Unauthorized. Please log in."}, 401
+
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename.endswith('.py'):
+            current_app.logger.warning("Search failed: Uploaded not a .py file.")
+            flash("A Python file with a .py extension is required.", "error")
+            return render_template('based/search.html'), 400
+
+        max_size = current_app.config['UPLOAD_MAX_BYTES']
+        try:
+            with timed('upload_read'):
+                digest, _ = hash_upload(upload.stream, max_size)
+        except UploadTooLarge:
+            current_app.logger.warning("Search failed: Uploaded too big file.")
+            flash(f"The file must not be larger than {format_size(max_size)}.", "error")
+            return render_template('based/search.html'), 400
+        tokens = unpack_tokens(get_upload_tokens(upload, digest))
+
+        # Only the LSH candidates are aligned exactly
+        matches = []
+        for jaccard, entry in find_similar_files(session['user_id'], tokens, current_app.config['SEARCH_CANDIDATES']):
+            blob = get_caches().tokens.lookup(entry.content_hash)
+            if blob is None:
+                continue
+            result = align_tokens(tokens, unpack_tokens(blob), score_only=True, **current_app.config['ALIGNMENT_SCORING'])
+            matches.append({"file_name": entry.file_name, "jaccard": jaccard, **result})
+        matches.sort(key=lambda match: match['similarity'], reverse=True)
+
+        current_app.logger.info("Search performed successfully: %d candidates", len(matches))
+        return render_template('based/search.html', file_name=upload.filename, matches=matches), 200
+
+    return render_template('based/search.html'), 200
+
+@command('index-history')
+def index_history():
+    """Add the files of all stored alignments to their users' similarity indexes."""
+    for alignment in AlignmentHistory.query.all():
+        for name, content in zip((alignment.file1_name, alignment.file2_name), alignment.file_contents()):
+            digest = content_hash(content)
+            index_file(alignment.user_id, name, digest, get_caches().tokens.get_blob(content, digest))
+
+def migrate_alignment_storage(batch_size=100):
+    """
+    Move the contents and alignments of legacy history rows into content blobs and packed token codes.
+    :param batch_size: Number of rows converted per transaction.
+    :return: Number of converted rows.
+    """
+    converted = 0
+    while True:
+        alignments = AlignmentHistory.query.filter(AlignmentHistory.file1_hash.is_(None)).options(
+            db.undefer_group('legacy')
+        ).limit(batch_size).all()
+        if not alignments:
+            return converted
+        for alignment in alignments:
+            hash1, hash2 = content_hash(alignment.file1_content), content_hash(alignment.file2_content)
+            store_content(hash1, alignment.file1_content)
+            store_content(hash2, alignment.file2_content)
+            alignment.file1_hash, alignment.file2_hash = hash1, hash2
+            if alignment.aligned_file1 or alignment.aligned_file2:
+                alignment.aligned_codes1 = pack_alignment(alignment.aligned_file1)
+                alignment.aligned_codes2 = pack_alignment(alignment.aligned_file2)
+            alignment.file1_content = alignment.file2_content = ''
+            alignment.aligned_file1 = alignment.aligned_file2 = ''
+        db.session.commit()
+        converted += len(alignments)
+
+@command('migrate-storage')
+def migrate_storage():
+    """Convert history rows stored as raw text to deduplicated, compressed storage."""
+    print(f"Converted alignments: {migrate_alignment_storage()}")
+
+@route('/metrics')
+def metrics():
+    """
+    Stage timings, request latencies, token counts, matrix sizes and cache statistics for Prometheus.
+    ---
+    tags:
+      - Tools
+    produces:
+      - text/plain
+    responses:
+      200:
+        description: Metrics in the Prometheus text exposition format.
+    """
+    caches = get_caches()
+    body = render_metrics({
+        "tokens": caches.tokens.memory.stats(),
+        "results": caches.results.stats(),
+        "incremental": caches.incremental.stats()
+    })
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@route('/cache/stats')
+def cache_stats():
+    """
+    Hit/miss counters and occupancy of the token and alignment result caches.
+    ---
+    tags:
+      - Tools
+    responses:
+      200:
+        description: Cache statistics as JSON.
+      401:
+        description: The user is not logged in.
+    """
+    if not current_user():
+        return {"error": "Unauthorized. Please log in."}, 401
+
+    caches = get_caches()
+    return {
+        "tokens": caches.tokens.memory.stats(),
+        "results": caches.results.stats(),
+        "incremental": caches.incremental.stats()
+    }, 200
+
+def create_app(config=None):
+    """
+    Create and configure the application. Nothing is set up at import time: the database is bound,
+    the log file opened and the routes registered here, and Swagger only on the first request to /apidocs.
+    The tables are created by the init-db command.
+    :param config: Optional dictionary of configuration values overriding the defaults.
+    :return: Flask application.
+    """
+    app = Flask(__name__)
+    app.secret_key = "23"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['ALIGNMENT_ENGINE'] = 'auto'
+    app.config['ALIGNMENT_SCORING'] = dict(DEFAULT_SCORING)
+    app.config['LINEAR_MEMORY_THRESHOLD'] = LINEAR_MEMORY_THRESHOLD
+    app.config['TOKEN_CACHE_MAX_BYTES'] = 64 * 1024 * 1024
+    app.config['RESULT_CACHE_MAX_BYTES'] = 64 * 1024 * 1024
+    app.config['LINE_CACHE_MAX_BYTES'] = 16 * 1024 * 1024  # Token line arrays used by the results view
+    app.config['INCREMENTAL_CACHE_MAX_BYTES'] = 64 * 1024 * 1024  # DP checkpoints of incremental API alignments
+    app.config['ALIGNMENT_WORKERS'] = 2  # Size of the alignment process pool, 0 runs jobs inline
+    app.config['BATCH_MAX_FILES'] = 200
+    app.config['BATCH_MAX_BYTES'] = 32 * 1024 * 1024  # Uncompressed size of the Python files of one batch archive
+    app.config['SEARCH_CANDIDATES'] = 20  # Candidates from the LSH index that get an exact alignment
+    app.config['UPLOAD_MAX_BYTES'] = 1 * 1024 * 1024  # Hard limit per uploaded file, enforced while reading
+    app.config['HISTORY_PAGE_SIZE'] = 50
+    app.config['RESULTS_PAGE_SIZE'] = ROWS_PER_PAGE  # Aligned positions per page of the results view
+    app.config['USER_CACHE_TTL'] = 30  # Seconds a logged-in user is served from memory, 0 loads it on every request
+    app.config['ADMIN_USERS'] = {name for name in os.environ.get('ADMIN_USERS', '').split(',') if name}
+    app.config['PROFILE_HEADER'] = 'X-Profile'  # Admins send this header to profile a request with cProfile
+    app.config['PROFILE_SAMPLE_RATE'] = 1.0  # Fraction of the requested profiles that are actually taken
+    app.config['PROFILE_DIR'] = os.path.join(app.instance_path, 'profiles')
+    app.config.update(config or {})
+
+    # Configure SQLAlchemy; the database is taken from DATABASE_URL (see app/database.py)
+    configure_database(app)
+    db.init_app(app)
+    with app.app_context():
+        enable_sqlite_pragmas(db.engine, app.config['SQLITE_PRAGMAS'])
+
+    app.extensions['caches'] = AppCaches(app.config)
 
-    return render_template('based/history.html', alignments=alignments), 200
+    app.logger = SingletonLogger.get_logger()
+    app.add_template_filter(format_size)
+    app.before_request(resume_pending_once)
+    app.before_request(start_request_instrumentation)
+    app.after_request(finish_request_instrumentation)
+    for rule, view, options in ROUTES:
+        app.add_url_rule(rule, view.__name__, view, **options)
+    for name, function in COMMANDS:
+        app.cli.command(name)(function)
+    app.wsgi_app = LazySwagger(app, app.wsgi_app)
+    return app
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
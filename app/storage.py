@@ -0,0 +1,38 @@
+import zlib
+from .alignment import AbstractToken
+
+# Code used for gaps in packed alignments; token codes are the AbstractToken values
+GAP_CODE = 255
+
+LABEL_CODES = {str(token): int(token) for token in AbstractToken}
+LABEL_CODES["-"] = GAP_CODE
+CODE_LABELS = {code: label for label, code in LABEL_CODES.items()}
+
+
+def compress_text(content):
+    """Compress file content for storage."""
+    return zlib.compress(content.encode("utf-8"))
+
+def decompress_text(blob):
+    return zlib.decompress(blob).decode("utf-8")
+
+def pack_alignment(aligned):
+    """
+    Pack a space-joined aligned token sequence into a zlib-compressed array of token codes.
+    Aligned sequences are dominated by long runs of the same code, which zlib encodes compactly.
+    :param aligned: Aligned sequence as produced by align_tokens, e.g. "loop - general_token".
+    :return: Compressed bytes with one code per aligned position.
+    """
+    return zlib.compress(encode_alignment(aligned))
+
+def unpack_alignment(blob):
+    """Unpack an aligned sequence packed by pack_alignment back into its space-joined form."""
+    return " ".join(CODE_LABELS[code] for code in unpack_alignment_codes(blob))
+
+def encode_alignment(aligned):
+    """Encode a space-joined aligned token sequence as uncompressed token codes."""
+    return bytes(LABEL_CODES[label] for label in aligned.split())
+
+def unpack_alignment_codes(blob):
+    """Unpack an aligned sequence packed by pack_alignment into its token codes, without decoding labels."""
+    return zlib.decompress(blob)
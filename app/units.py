@@ -0,0 +1,204 @@
+import argparse
+import json
+import re
+import sys
+import numpy as np
+from .alignment import AbstractToken, DEFAULT_SCORING, source_lines, tokenize_lines
+from .batch import collect_files, score_pairs
+from .cache import pack_tokens
+
+# Source line of a top-level function or class definition
+DEFINITION = re.compile(r"(?:async\s+)?(def|class)\s+(\w+)")
+
+# Name of the unit collecting the module-level code of a file
+MODULE_UNIT = "<module>"
+
+
+def _unit(file, name, kind, line):
+    return {"file": file, "name": name, "kind": kind, "first_line": line, "last_line": line, "tokens": []}
+
+def split_units(code, file=None):
+    """
+    Split a Python file into its top-level functions and classes.
+    A unit starts at a function_def or class_def token whose line is not indented, together with the
+    decorators right above it, and extends to the next top-level statement. Module-level code outside
+    the units is collected into one more unit named MODULE_UNIT.
+    :param code: Python code as a string.
+    :param file: Name of the file, stored with every unit.
+    :return: List of units (dictionaries with file, name, kind, first/last line and abstract tokens).
+    """
+    tokens, first_lines, last_lines = tokenize_lines(code)
+    source = source_lines(code)
+    module = _unit(file, MODULE_UNIT, "module", 1)
+    units = []
+    current = None
+    for token, first, last in zip(tokens, first_lines, last_lines):
+        line = source[first - 1] if first <= len(source) else ""
+
+        # Indented lines, blank lines and comments continue the open unit
+        if line[:1] not in ("", " ", "\t", "#"):
+            definition = DEFINITION.match(line)
+            if token in (AbstractToken.FUNCTION_DEF, AbstractToken.CLASS_DEF) and definition:
+                if current is None or current["name"] is not None:
+                    current = _unit(file, None, None, first)
+                    units.append(current)
+                current["kind"] = "function" if definition.group(1) == "def" else "class"
+                current["name"] = definition.group(2)
+            elif line.startswith("@") or definition:
+                # Decorators (and the async keyword) open a unit that is named by the definition that follows
+                if current is None or current["name"] is not None:
+                    current = _unit(file, None, None, first)
+                    units.append(current)
+            else:
+                current = None
+
+        unit = current if current is not None else module
+        unit["tokens"].append(token)
+        unit["last_line"] = max(unit["last_line"], min(last, len(source)))
+
+    # Decorators without a definition below them belong to the module-level code
+    for unit in units:
+        if unit["name"] is None:
+            module["tokens"].extend(unit["tokens"])
+    units = [unit for unit in units if unit["name"] is not None]
+    if module["tokens"]:
+        units.append(module)
+    return units
+
+def assign_units(weights):
+    """
+    Find the one-to-one assignment of rows to columns with the largest total weight (Hungarian algorithm).
+    :param weights: Matrix of pair weights, e.g. unit similarities; it need not be square.
+    :return: List of (row, column) pairs, one per row or column of the smaller dimension.
+    """
+    weights = np.asarray(weights, dtype=float)
+    transposed = weights.shape[0] > weights.shape[1]
+    cost = -(weights.T if transposed else weights)
+    n, m = cost.shape
+    if n == 0:
+        return []
+
+    # Shortest augmenting paths with row/column potentials u and v; columns and rows are 1-based, 0 is virtual
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)  # Row assigned to each column, 0 if free
+    way = np.zeros(m + 1, dtype=np.int64)
+    for row in range(1, n + 1):
+        owner[0] = row
+        column = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[column] = True
+            current = owner[column]
+            free = ~used
+            free[0] = False
+            slack = cost[current - 1] - u[current] - v[1:]
+            better = free[1:] & (slack < min_slack[1:])
+            min_slack[1:][better] = slack[better]
+            way[1:][better] = column
+            candidates = np.where(free, min_slack, np.inf)
+            next_column = int(np.argmin(candidates))
+            delta = candidates[next_column]
+            u[owner[used]] += delta
+            v[used] -= delta
+            min_slack[free] -= delta
+            column = next_column
+            if owner[column] == 0:
+                break
+        # Flip the augmenting path
+        while column:
+            previous = way[column]
+            owner[column] = owner[previous]
+            column = previous
+
+    pairs = [(int(owner[column]) - 1, column - 1) for column in range(1, m + 1) if owner[column]]
+    if transposed:
+        pairs = [(j, i) for i, j in pairs]
+    return sorted(pairs)
+
+def compare_units(files1, files2, workers=None, chunk_size=256, scoring=None, min_similarity=0.0, executor=None):
+    """
+    Align two files or projects unit by unit instead of as two flat token sequences.
+    Every unit of one side is scored against every unit of the other with many small score-only
+    alignments spread across a process pool; an assignment step then pairs the units, so reordered or
+    moved functions still match.
+    :param files1: List of (name, content) pairs of the first file or project.
+    :param files2: List of (name, content) pairs of the second file or project.
+    :param workers: Number of worker processes (None for one per CPU, 0 to score in this process).
+    :param chunk_size: Number of unit pairs scored per task.
+    :param scoring: Match/mismatch/gap scores, defaults to DEFAULT_SCORING.
+    :param min_similarity: Assigned pairs at or below this similarity are reported as unmatched.
+    :param executor: Running executor to score the pairs in instead of starting a pool (see score_pairs).
+    :return: Dictionary with the overall similarity, the matched unit pairs and the unmatched units.
+    """
+    units1 = [unit for name, content in files1 for unit in split_units(content, name)]
+    units2 = [unit for name, content in files2 for unit in split_units(content, name)]
+    blobs = [pack_tokens(unit["tokens"]) for unit in units1 + units2]
+    pairs = ((i, len(units1) + j) for i in range(len(units1)) for j in range(len(units2)))
+
+    # Scores of every unit pair; only the matrices are kept, not the individual results
+    similarity = np.zeros((len(units1), len(units2)))
+    needleman_scores = np.zeros((len(units1), len(units2)), dtype=np.int64)
+    norm_scores = np.zeros((len(units1), len(units2)))
+    for i, j, result in score_pairs(blobs, pairs, dict(scoring or DEFAULT_SCORING), workers, chunk_size, executor):
+        j -= len(units1)
+        similarity[i, j] = result["similarity"]
+        needleman_scores[i, j] = result["needleman_score"]
+        norm_scores[i, j] = result["norm_score"]
+
+    matched = [(i, j) for i, j in assign_units(similarity) if similarity[i, j] > min_similarity]
+    matched1 = {i for i, _ in matched}
+    matched2 = {j for _, j in matched}
+
+    # Overall similarity weights every unit pair by its number of tokens; unmatched units count as 0
+    total = sum(len(unit["tokens"]) for unit in units1 + units2)
+    weighted = sum(similarity[i, j] * (len(units1[i]["tokens"]) + len(units2[j]["tokens"])) for i, j in matched)
+
+    def describe(unit):
+        return {
+            "file": unit["file"],
+            "name": unit["name"],
+            "kind": unit["kind"],
+            "lines": [unit["first_line"], unit["last_line"]],
+            "tokens": len(unit["tokens"])
+        }
+
+    return {
+        "similarity": round(weighted / total, 3) if total else 1.0,
+        "units1": len(units1),
+        "units2": len(units2),
+        "pairs": [
+            {
+                "unit1": describe(units1[i]),
+                "unit2": describe(units2[j]),
+                "similarity": float(similarity[i, j]),
+                "needleman_score": int(needleman_scores[i, j]),
+                "norm_score": float(norm_scores[i, j])
+            }
+            for i, j in matched
+        ],
+        "unmatched1": [describe(unit) for i, unit in enumerate(units1) if i not in matched1],
+        "unmatched2": [describe(unit) for j, unit in enumerate(units2) if j not in matched2]
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Unit-by-unit similarity of two Python files or projects.")
+    parser.add_argument("first", help=".py file, directory or zip archive")
+    parser.add_argument("second", help=".py file, directory or zip archive")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=256, help="unit pairs scored per task")
+    parser.add_argument("--min-similarity", type=float, default=0.0, help="report weaker pairs as unmatched")
+    args = parser.parse_args(argv)
+
+    report = compare_units(
+        collect_files([args.first]), collect_files([args.second]),
+        workers=args.workers, chunk_size=args.chunk_size, min_similarity=args.min_similarity
+    )
+    json.dump(report, sys.stdout)
+    sys.stdout.write("\n")
+
+if __name__ == "__main__":
+    # Import through the package so worker processes resolve the functions as app.units.*
+    from app.units import main as units_main
+    units_main()
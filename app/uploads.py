@@ -0,0 +1,89 @@
+import codecs
+import hashlib
+import io
+import zlib
+from .alignment import iter_abstract_tokens
+from .cache import pack_tokens
+
+# Bytes read from an upload stream at a time
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds its byte limit while it is being read."""
+
+
+def format_size(size):
+    """Format a byte count for messages, e.g. 1048576 as "1 MB"."""
+    for unit, scale in (("MB", 1024 * 1024), ("KB", 1024)):
+        if size >= scale:
+            return f"{size / scale:.3g} {unit}"
+    return f"{size} bytes"
+
+
+def hash_upload(stream, max_bytes):
+    """
+    Hash the decoded text of an upload chunk by chunk, enforcing a hard size limit while reading.
+    The digest equals cache.content_hash of the decoded content, so it can be used as a cache key
+    before the upload is tokenized or decoded as a whole.
+    :param stream: Seekable binary stream of the upload.
+    :param max_bytes: Maximum accepted size in bytes.
+    :return: Tuple of (hex digest, size in bytes).
+    """
+    stream.seek(0)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes.")
+        digest.update(decoder.decode(chunk).encode("utf-8"))
+    digest.update(decoder.decode(b"", final=True).encode("utf-8"))
+    return digest.hexdigest(), size
+
+def _text_reader(stream):
+    stream.seek(0)
+    return io.TextIOWrapper(stream, encoding="utf-8", errors="replace", newline="")
+
+def tokenize_upload(stream):
+    """
+    Stream an upload line by line through the single-pass tokenizer.
+    :param stream: Seekable binary stream of the upload.
+    :return: Packed abstract tokens (see cache.pack_tokens).
+    """
+    text = _text_reader(stream)
+    try:
+        return pack_tokens(iter_abstract_tokens(text.readline))
+    finally:
+        text.detach()  # Leave the upload stream open for later reads
+
+def read_upload_text(stream):
+    """Decode a whole upload, with line endings preserved as in hash_upload."""
+    text = _text_reader(stream)
+    try:
+        return text.read()
+    finally:
+        text.detach()
+
+def compress_upload_text(stream):
+    """
+    Decode and compress an upload chunk by chunk, so the whole text is never held in memory.
+    :return: Bytes equal to storage.compress_text of the decoded content.
+    """
+    text = _text_reader(stream)
+    compressor = zlib.compressobj()
+    parts = []
+    try:
+        while True:
+            chunk = text.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            parts.append(compressor.compress(chunk.encode("utf-8")))
+    finally:
+        text.detach()
+    parts.append(compressor.flush())
+    return b"".join(parts)
@@ -0,0 +1,242 @@
+"""
+Benchmarks for the alignment pipeline.
+
+Generates Python sources of increasing size, runs every pipeline stage on them and reports wall time,
+throughput (tokens/s for tokenization, DP cells/s for alignment) and peak traced memory per stage.
+Results are printed as a table and can be written as JSON to compare runs across commits:
+
+    python -m benchmarks.bench_alignment --output before.json
+    python -m benchmarks.bench_alignment --output after.json --compare before.json
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+from app.alignment import (
+    tokenize_code, abstract_tokens, tokenize_abstract, needleman_wunsch, needleman_wunsch_numpy, hirschberg,
+    needleman_wunsch_score, bitparallel_score, perform_alignment
+)
+
+DEFAULT_SIZES = [1024, 10 * 1024, 100 * 1024, 1024 * 1024]
+
+# Largest DP matrix each alignment stage is run on; bigger inputs are reported as skipped
+DEFAULT_MAX_CELLS = {
+    "needleman_wunsch": 4_000_000,
+    "needleman_wunsch_numpy": 100_000_000,
+    "hirschberg": 100_000_000,
+    "needleman_wunsch_score": 400_000_000,
+    "bitparallel_score": 10_000_000_000,
+    "perform_alignment": 100_000_000,
+}
+
+_STATEMENTS = [
+    "{name} = {value}",
+    "{name} = {other}({value}, {name})",
+    "print({name}, {value})",
+    "result.append({name} * {value})",
+    "return {name}",
+]
+
+_BLOCKS = [
+    "for {name} in range({value}):",
+    "while {name} < {value}:",
+    "if {name} > {value}:",
+    "elif {name} == {value}:",
+    "else:",
+]
+
+
+def generate_source(size, seed=0):
+    """
+    Generate syntactically plausible Python source of roughly the given size in bytes.
+    :param size: Target size in bytes; the result is cut at the first line boundary after it.
+    :param seed: Seed of the generator, so that runs are reproducible.
+    :return: Source code as a string.
+    """
+    rng = random.Random(seed)
+    lines = []
+    length = 0
+    while length < size:
+        if rng.random() < 0.1:
+            line = "import " + rng.choice(["os", "sys", "json", "re", "math"])
+            body = []
+        elif rng.random() < 0.3:
+            kind = rng.choice(["def", "class"])
+            line = f"{kind} {rng.choice('fghk')}{rng.randrange(1000)}({'x' if kind == 'def' else ''}):"
+            body = ['    """Generated block."""'] if rng.random() < 0.3 else []
+            for _ in range(rng.randint(1, 6)):
+                if rng.random() < 0.4:
+                    body.append("    " + rng.choice(_BLOCKS).format(name="x", value=rng.randrange(100)))
+                    body.append("        " + _statement(rng))
+                else:
+                    body.append("    " + _statement(rng))
+        else:
+            line = _statement(rng)
+            body = []
+        for text in [line] + body:
+            lines.append(text)
+            length += len(text) + 1
+    return "\n".join(lines) + "\n"
+
+def _statement(rng):
+    return rng.choice(_STATEMENTS).format(
+        name=rng.choice("abcxyz"), other=rng.choice(["len", "max", "min"]), value=rng.randrange(1000)
+    )
+
+def mutate_source(source, rate=0.1, seed=1):
+    """
+    Return a variant of source with a fraction of its top-level statements dropped or duplicated,
+    as the second file to align; whole blocks are kept together so that the result still tokenizes.
+    """
+    rng = random.Random(seed)
+    units = []
+    for line in source.splitlines():
+        if units and line.startswith(" "):
+            units[-1].append(line)
+        else:
+            units.append([line])
+    lines = []
+    for unit in units:
+        roll = rng.random()
+        if roll < rate / 2:
+            continue
+        lines.extend(unit)
+        if roll > 1 - rate / 2:
+            lines.extend(unit)
+    return "\n".join(lines) + "\n"
+
+def _measure(fn, repeat, trace_memory):
+    """Return the best wall time of fn over repeat runs and the peak traced memory of one extra run."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    peak = None
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            fn()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return best, peak
+
+def run_benchmarks(sizes=DEFAULT_SIZES, repeat=3, max_cells=None, trace_memory=True, stages=None):
+    """
+    Run every stage of the pipeline on generated sources of the given sizes.
+    :param sizes: Source sizes in bytes.
+    :param repeat: Timed runs per stage; the best time is reported.
+    :param max_cells: Per-stage limit on DP cells, defaults to DEFAULT_MAX_CELLS.
+    :param trace_memory: Measure peak memory with tracemalloc in one additional run per stage.
+    :param stages: Names of the stages to run, or None for all.
+    :return: List of result dictionaries, one per stage and size.
+    """
+    max_cells = dict(DEFAULT_MAX_CELLS, **(max_cells or {}))
+    results = []
+
+    def record(stage, size, fn, tokens=None, cells=None):
+        if stages is not None and stage not in stages:
+            return
+        entry = {"stage": stage, "size_bytes": size, "tokens": tokens, "cells": cells}
+        if cells is not None and cells > max_cells.get(stage, float("inf")):
+            entry["skipped"] = True
+            results.append(entry)
+            return
+        seconds, peak = _measure(fn, repeat, trace_memory)
+        entry.update({
+            "seconds": seconds,
+            "tokens_per_s": tokens / seconds if tokens and seconds else None,
+            "cells_per_s": cells / seconds if cells and seconds else None,
+            "peak_bytes": peak
+        })
+        results.append(entry)
+
+    for size in sizes:
+        source1 = generate_source(size, seed=size)
+        source2 = mutate_source(source1, seed=size + 1)
+        raw_tokens = tokenize_code(source1)
+        tokens1, tokens2 = tokenize_abstract(source1), tokenize_abstract(source2)
+        cells = (len(tokens1) + 1) * (len(tokens2) + 1)
+
+        record("tokenize_code", size, lambda: tokenize_code(source1), tokens=len(raw_tokens))
+        record("abstract_tokens", size, lambda: abstract_tokens(raw_tokens), tokens=len(raw_tokens))
+        record("tokenize_abstract", size, lambda: tokenize_abstract(source1), tokens=len(raw_tokens))
+        for stage, fn in (("needleman_wunsch", needleman_wunsch),
+                          ("needleman_wunsch_numpy", needleman_wunsch_numpy),
+                          ("hirschberg", hirschberg),
+                          ("needleman_wunsch_score", needleman_wunsch_score),
+                          ("bitparallel_score", bitparallel_score)):
+            record(stage, size, lambda fn=fn: fn(tokens1, tokens2), tokens=len(tokens1) + len(tokens2), cells=cells)
+        record("perform_alignment", size, lambda: perform_alignment(source1, source2),
+               tokens=len(tokens1) + len(tokens2), cells=cells)
+    return results
+
+def environment():
+    """Describe the interpreter, libraries and commit the benchmarks ran on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "commit": commit
+    }
+
+def compare(results, baseline):
+    """
+    Relate each result to the matching entry of a baseline run.
+    :return: List of (stage, size, speedup) tuples, where speedup > 1 means faster than the baseline.
+    """
+    previous = {(entry["stage"], entry["size_bytes"]): entry for entry in baseline if not entry.get("skipped")}
+    ratios = []
+    for entry in results:
+        before = previous.get((entry["stage"], entry["size_bytes"]))
+        if before and not entry.get("skipped"):
+            ratios.append((entry["stage"], entry["size_bytes"], before["seconds"] / entry["seconds"]))
+    return ratios
+
+def _format_rate(value):
+    return f"{value:,.0f}" if value else "-"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the alignment pipeline.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="source sizes in bytes")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage (best is reported)")
+    parser.add_argument("--stages", nargs="+", help="only run these stages")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.repeat, trace_memory=not args.no_memory, stages=args.stages)
+    for entry in results:
+        if entry.get("skipped"):
+            print(f"{entry['stage']:<24}{entry['size_bytes']:>9} B  skipped ({entry['cells']:,} cells)")
+            continue
+        peak = f"{entry['peak_bytes'] / 1024:,.0f} KiB" if entry["peak_bytes"] is not None else "-"
+        print(f"{entry['stage']:<24}{entry['size_bytes']:>9} B  {entry['seconds'] * 1000:10.2f} ms"
+              f"  {_format_rate(entry['tokens_per_s']):>14} tok/s  {_format_rate(entry['cells_per_s']):>16} cells/s"
+              f"  {peak:>12}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)["results"]
+        for stage, size, speedup in compare(results, baseline):
+            print(f"{stage:<24}{size:>9} B  {speedup:6.2f}x vs baseline")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"environment": environment(), "results": results}, file, indent=2)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,11 @@
+import os
+import shutil
+import tempfile
+
+# The app reads DATABASE_URL when it is created, so point it at a scratch SQLite file first
+_database_dir = tempfile.mkdtemp(prefix="filealigner-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_database_dir, 'test.db')}"
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(_database_dir, ignore_errors=True)
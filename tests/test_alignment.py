@@ -0,0 +1,351 @@
+import io
+import json
+import random
+import subprocess
+import sys
+
+import pytest
+
+sys.path.insert(0, ".")
+
+from app.alignment import (
+    AbstractToken, tokenize_code, abstract_tokens, tokenize_abstract,
+    needleman_wunsch, needleman_wunsch_numpy, needleman_wunsch_score, hirschberg, perform_alignment,
+    gotoh, gotoh_score, myers_miller, align_tokens, lcs_length, edit_distance, bitparallel_scheme, bitparallel_score,
+    align_many, expand_paths, read_pairs
+)
+
+TOKENS = ["function_def", "class_def", "loop", "conditional", "docstring", "import_statement", "general_token"]
+
+
+def alignment_score(aligned1, aligned2, match=2, mismatch=-1, gap=-2):
+    """Score an alignment column by column."""
+    score = 0
+    for t1, t2 in zip(aligned1, aligned2):
+        if t1 == "-" or t2 == "-":
+            score += gap
+        else:
+            score += match if t1 == t2 else mismatch
+    return score
+
+
+def test_hirschberg_matches_needleman_wunsch_score():
+    """Hirschberg mode returns the full-matrix score and a valid optimal alignment."""
+    rng = random.Random(23)
+    for _ in range(50):
+        seq1 = [rng.choice(TOKENS) for _ in range(rng.randint(0, 40))]
+        seq2 = [rng.choice(TOKENS) for _ in range(rng.randint(0, 40))]
+        score, _, _ = needleman_wunsch(seq1, seq2)
+        linear_score, aligned1, aligned2 = hirschberg(seq1, seq2)
+
+        assert linear_score == score
+        assert len(aligned1) == len(aligned2)
+        assert [t for t in aligned1 if t != "-"] == seq1
+        assert [t for t in aligned2 if t != "-"] == seq2
+        assert alignment_score(aligned1, aligned2) == score
+
+
+def test_perform_alignment_switches_to_linear_memory():
+    """Above the cell threshold perform_alignment uses Hirschberg with the same score."""
+    code1 = "import os\n\ndef f(x):\n    for i in x:\n        if i:\n            print(i)\n"
+    code2 = "class A:\n    def f(self):\n        while True:\n            pass\n"
+    full = perform_alignment(code1, code2)
+    linear = perform_alignment(code1, code2, linear_memory_threshold=0)
+    assert linear["needleman_score"] == full["needleman_score"]
+    assert linear["norm_score"] == full["norm_score"]
+
+
+def test_numpy_engine_identical_to_python():
+    """The vectorized engine reproduces needleman_wunsch exactly, including the traceback."""
+    rng = random.Random(7)
+    for _ in range(50):
+        seq1 = [rng.choice(TOKENS) for _ in range(rng.randint(0, 60))]
+        seq2 = [rng.choice(TOKENS) for _ in range(rng.randint(0, 60))]
+        for scoring in ({}, {"match": 1, "mismatch": -3, "gap": -1}):
+            assert needleman_wunsch_numpy(seq1, seq2, **scoring) == needleman_wunsch(seq1, seq2, **scoring)
+
+
+def test_perform_alignment_engine_selection():
+    """Every engine can be selected explicitly and unknown engines are rejected."""
+    code1 = "def f():\n    return [i for i in range(3)]\n"
+    code2 = "def g():\n    for i in range(3):\n        yield i\n"
+    assert perform_alignment(code1, code2, engine="numpy") == perform_alignment(code1, code2, engine="python")
+    assert perform_alignment(code1, code2, engine="hirschberg")["needleman_score"] == \
+        perform_alignment(code1, code2)["needleman_score"]
+    with pytest.raises(ValueError):
+        perform_alignment(code1, code2, engine="quantum")
+
+
+def test_score_only_matches_full_alignment():
+    """The rolling rows give the full DP score and the matches and length of its traceback path;
+    the band yields bounds around the score."""
+    rng = random.Random(11)
+    for _ in range(50):
+        seq1 = [rng.choice(TOKENS) for _ in range(rng.randint(0, 50))]
+        seq2 = seq1[:rng.randint(0, len(seq1))] + [rng.choice(TOKENS) for _ in range(rng.randint(0, 8))]
+        score, aligned1, aligned2 = needleman_wunsch(seq1, seq2)
+        matches = sum(1 for t1, t2 in zip(aligned1, aligned2) if t1 == t2 != "-")
+        assert needleman_wunsch_score(seq1, seq2)[:3] == (score, matches, len(aligned1))
+        for scoring in ({"match": 1, "mismatch": -3, "gap": -1}, {"match": 3, "mismatch": 1, "gap": -1}):
+            other_score, aligned1, aligned2 = needleman_wunsch(seq1, seq2, **scoring)
+            matches = sum(1 for t1, t2 in zip(aligned1, aligned2) if t1 == t2 != "-")
+            assert needleman_wunsch_score(seq1, seq2, **scoring)[:3] == (other_score, matches, len(aligned1))
+        for band in (0, 2, 8):
+            lower, _, _, upper = needleman_wunsch_score(seq1, seq2, band=band)
+            assert lower <= score <= upper
+            if lower == upper:
+                assert lower == score
+
+
+def test_perform_alignment_score_only():
+    """score_only returns the scores without aligned sequences."""
+    code1 = "import os\n\ndef f(x):\n    for i in x:\n        if i:\n            print(i)\n"
+    code2 = "import os\n\ndef g(y):\n    for j in y:\n        print(j)\n"
+    full = perform_alignment(code1, code2)
+    result = perform_alignment(code1, code2, score_only=True)
+    assert set(result) == {"similarity", "needleman_score", "norm_score"}
+    assert result == {key: full[key] for key in result}
+
+    banded = perform_alignment(code1, code2, score_only=True, band=50)
+    assert banded["exact"] and banded["score_bounds"] == [full["needleman_score"]] * 2
+
+
+def test_single_pass_tokenizer_matches_legacy_pair():
+    """The fused tokenizer splits blocks like tokenize_code and abstract_tokens."""
+    code = (
+        '"""Module docstring."""\n'
+        "import os\nfrom sys import path\n\n"
+        "class A:\n    def f(self, x):\n        # comment\n"
+        "        for i in x:\n            if i:\n                print(i)\n            else:\n                pass\n"
+        "        while x:\n            x = x[1:]\n"
+    )
+    assert [str(t) for t in tokenize_abstract(code)] == abstract_tokens(tokenize_code(code))
+
+
+def test_single_pass_tokenizer_ignores_keywords_in_identifiers():
+    """Identifiers that contain construct names are not misclassified."""
+    code = "loop_count = 0\nmy_class_def = None\n"
+    assert abstract_tokens(tokenize_code(code))[:2] == ["loop", "class_def"]
+    assert tokenize_abstract(code)[:2] == [AbstractToken.GENERAL_TOKEN, AbstractToken.GENERAL_TOKEN]
+
+
+def test_tokenizer_ignores_surrounding_blank_lines():
+    """Blank lines around the code do not change its tokens; blank lines inside it still do."""
+    code = "import os\n\ndef f():\n    if os:\n        pass\n\n    return 1\n\nx = f()"
+    for padded in ("\n\n" + code + "\n", "   \n" + code + "\n\n\n  \n", "\t\n\n" + code + "\n  \n"):
+        assert tokenize_abstract(padded) == tokenize_abstract(code)
+        assert perform_alignment(padded, code)["similarity"] == 1.0
+    assert tokenize_abstract("\n\ndef f():\n    pass\n") == tokenize_abstract("def f():\n    pass")
+    assert len(tokenize_abstract("   \ndef f():\n    pass\n\n\n  \n")) == 3
+    # Comments are code as far as stripping goes, so blank lines after them are kept
+    assert tokenize_abstract("# c\n\nx = 1") == tokenize_abstract("\n# c\n\nx = 1\n\n")
+
+
+def affine_score(aligned1, aligned2, match=2, mismatch=-1, gap_open=-3, gap_extend=-1):
+    """Score an alignment column by column with affine gap penalties."""
+    score, previous = 0, None
+    for t1, t2 in zip(aligned1, aligned2):
+        state = 1 if t1 == "-" else 2 if t2 == "-" else 0
+        if state:
+            score += gap_extend if state == previous else gap_open
+        else:
+            score += match if t1 == t2 else mismatch
+        previous = state
+    return score
+
+def best_affine_score(seq1, seq2, local=False, **scoring):
+    """Best affine score over every alignment (of every pair of substrings when local) by enumeration."""
+    def alignments(a, b):
+        if not a and not b:
+            yield [], []
+            return
+        if a and b:
+            for x, y in alignments(a[1:], b[1:]):
+                yield [a[0]] + x, [b[0]] + y
+        if a:
+            for x, y in alignments(a[1:], b):
+                yield [a[0]] + x, ["-"] + y
+        if b:
+            for x, y in alignments(a, b[1:]):
+                yield ["-"] + x, [b[0]] + y
+
+    if not local:
+        return max(affine_score(x, y, **scoring) for x, y in alignments(seq1, seq2))
+    best = 0
+    for i in range(len(seq1)):
+        for j in range(len(seq2)):
+            for k in range(i + 1, len(seq1) + 1):
+                for l in range(j + 1, len(seq2) + 1):
+                    best = max(best, best_affine_score(seq1[i:k], seq2[j:l], **scoring))
+    return best
+
+
+def test_gotoh_matches_enumeration():
+    """Global and local affine alignments are optimal and consistent with their reported scores and spans."""
+    rng = random.Random(19)
+    for _ in range(60):
+        seq1 = rng.choices("abc", k=rng.randint(0, 4))
+        seq2 = rng.choices("abc", k=rng.randint(0, 4))
+        scoring = {"gap_open": rng.choice([-4, -3, -2]), "gap_extend": rng.choice([-2, -1])}
+        if scoring["gap_open"] > scoring["gap_extend"]:
+            continue
+        for local in (False, True):
+            score, aligned1, aligned2, span = gotoh(seq1, seq2, local=local, **scoring)
+            assert score == best_affine_score(seq1, seq2, local=local, **scoring)
+            assert affine_score(aligned1, aligned2, **scoring) == score
+            start1, end1, start2, end2 = span
+            assert [t for t in aligned1 if t != "-"] == seq1[start1:end1]
+            assert [t for t in aligned2 if t != "-"] == seq2[start2:end2]
+            assert gotoh_score(seq1, seq2, local=local, **scoring)[0] == score
+
+
+def test_gotoh_score_follows_gotoh_path():
+    """The score-only affine DP reports the matches, length and span of the path gotoh() traces back."""
+    rng = random.Random(31)
+    cases = [([1, 0, 0, 1, 1, 1, 1, 1], [1, 0, 1, 1, 0, 1, 1, 1, 0, 0, 1, 1],
+              {"match": 1, "mismatch": 0, "gap_open": -4, "gap_extend": -2})]
+    for _ in range(400):
+        gap_extend = rng.choice([-2, -1, 0])
+        scoring = {"match": rng.choice([1, 2, 3]), "mismatch": rng.choice([-2, -1, 0]),
+                   "gap_open": rng.randint(gap_extend - 4, gap_extend), "gap_extend": gap_extend}
+        cases.append((rng.choices("abc", k=rng.randint(0, 20)), rng.choices("abc", k=rng.randint(0, 20)), scoring))
+    for seq1, seq2, scoring in cases:
+        for local in (False, True):
+            score, aligned1, aligned2, span = gotoh(seq1, seq2, local=local, **scoring)
+            matches = sum(a == b != "-" for a, b in zip(aligned1, aligned2))
+            assert gotoh_score(seq1, seq2, local=local, **scoring) == (score, matches, len(aligned1), span)
+
+
+def test_myers_miller_matches_gotoh():
+    """The linear-memory affine alignment is optimal and is used above the memory threshold."""
+    rng = random.Random(29)
+    for _ in range(300):
+        seq1 = rng.choices("abcd", k=rng.randint(0, rng.choice([4, 40])))
+        seq2 = rng.choices("abcd", k=rng.randint(0, rng.choice([4, 40])))
+        scoring = {"match": rng.choice([1, 2]), "mismatch": rng.choice([-1, -3]),
+                   "gap_open": rng.choice([-4, -3, -1]), "gap_extend": rng.choice([-2, -1])}
+        if scoring["gap_open"] > scoring["gap_extend"]:
+            continue
+        score, aligned1, aligned2 = myers_miller(seq1, seq2, **scoring)
+        assert score == gotoh(seq1, seq2, **scoring)[0]
+        assert affine_score(aligned1, aligned2, **scoring) == score
+        assert [t for t in aligned1 if t != "-"] == seq1 and [t for t in aligned2 if t != "-"] == seq2
+
+    seq1 = rng.choices(TOKENS, k=60)
+    seq2 = rng.choices(TOKENS, k=50)
+    for mode in ("global", "local"):
+        full = align_tokens(seq1, seq2, mode=mode, gap_open=-3, gap_extend=-1)
+        linear = align_tokens(seq1, seq2, mode=mode, gap_open=-3, gap_extend=-1, linear_memory_threshold=100)
+        assert linear["needleman_score"] == full["needleman_score"]
+        assert linear.get("span") == full.get("span")
+
+
+def test_align_tokens_local_mode():
+    """Local mode finds the shared region inside unrelated code and reports its span."""
+    shared = TOKENS[:5]
+    seq1 = ["general_token"] * 6 + shared + ["loop"] * 4
+    seq2 = ["class_def"] * 3 + shared
+    result = align_tokens(seq1, seq2, mode="local", gap_open=-3, gap_extend=-1)
+    assert result["span"] == [6, 11, 3, 8]
+    assert result["needleman_score"] == 2 * len(shared)
+    assert result["aligned_file1"] == result["aligned_file2"]
+
+    score_only = align_tokens(seq1, seq2, mode="local", gap_open=-3, gap_extend=-1, score_only=True)
+    assert score_only["needleman_score"] == result["needleman_score"]
+    with pytest.raises(ValueError):
+        gotoh(seq1, seq2, gap_open=-1, gap_extend=-3)
+
+
+def reference_lcs_and_distance(seq1, seq2):
+    """LCS length and edit distance by the textbook DP."""
+    lcs = [[0] * (len(seq2) + 1) for _ in range(len(seq1) + 1)]
+    distance = [[i + j if not i or not j else 0 for j in range(len(seq2) + 1)] for i in range(len(seq1) + 1)]
+    for i in range(1, len(seq1) + 1):
+        for j in range(1, len(seq2) + 1):
+            same = seq1[i - 1] == seq2[j - 1]
+            lcs[i][j] = lcs[i - 1][j - 1] + 1 if same else max(lcs[i - 1][j], lcs[i][j - 1])
+            distance[i][j] = min(distance[i - 1][j] + 1, distance[i][j - 1] + 1, distance[i - 1][j - 1] + (not same))
+    return lcs[-1][-1], distance[-1][-1]
+
+
+def test_bitparallel_kernels_match_dp():
+    """The bit-parallel LCS and edit distance agree with the DP, also across several machine words."""
+    rng = random.Random(23)
+    for _ in range(200):
+        seq1 = rng.choices(TOKENS, k=rng.randint(0, 150))
+        seq2 = rng.choices(TOKENS, k=rng.randint(0, 150))
+        assert (lcs_length(seq1, seq2), edit_distance(seq1, seq2)) == reference_lcs_and_distance(seq1, seq2)
+
+
+def test_bitparallel_score_and_fallback():
+    """Compatible schemes get the classic score; score_only results are unchanged whichever backend runs."""
+    assert bitparallel_scheme(2, -1, -2) == "edit"
+    assert bitparallel_scheme(2, -5, -2) == "lcs"
+    assert bitparallel_scheme(2, -3, -2) is None
+    rng = random.Random(5)
+    for _ in range(100):
+        seq1 = rng.choices(TOKENS, k=rng.randint(1, 80))
+        seq2 = rng.choices(TOKENS, k=rng.randint(1, 80))
+        for scoring in ({"match": 2, "mismatch": -1, "gap": -2}, {"match": 2, "mismatch": -5, "gap": -2},
+                        {"match": 1, "mismatch": -2, "gap": -1}):
+            assert bitparallel_score(seq1, seq2, **scoring) == needleman_wunsch_score(seq1, seq2, **scoring)[0]
+            assert align_tokens(seq1, seq2, score_only=True, engine="bitparallel", **scoring) == \
+                align_tokens(seq1, seq2, score_only=True, engine="numpy", **scoring)
+    with pytest.raises(ValueError):
+        bitparallel_score(TOKENS, TOKENS, match=2, mismatch=-3, gap=-2)
+    # The engine is rejected where no kernel applies instead of silently running the DP
+    with pytest.raises(ValueError):
+        align_tokens(TOKENS, TOKENS[::-1], score_only=True, engine="bitparallel", mismatch=-3)
+    with pytest.raises(ValueError):
+        align_tokens(TOKENS, TOKENS[::-1], engine="bitparallel")
+
+    # Where a kernel applies, including the default "edit" scheme, a band is skipped and the result is exact
+    seq1 = rng.choices(TOKENS, k=60)
+    seq2 = seq1[5:] + rng.choices(TOKENS, k=10)
+    for scoring in ({}, {"mismatch": -5}):
+        exact = align_tokens(seq1, seq2, score_only=True, engine="numpy", **scoring)
+        banded = align_tokens(seq1, seq2, score_only=True, band=2, **scoring)
+        assert needleman_wunsch_score(seq1, seq2, band=2, **scoring)[0] < exact["needleman_score"]
+        assert banded == dict(exact, score_bounds=[exact["needleman_score"]] * 2, exact=True)
+
+
+def test_align_many_matches_perform_alignment(tmp_path):
+    sources = ["def f(x):\n    return x\n", "class A:\n    def f(self):\n        pass\n", "import os\nfor i in x:\n    pass\n"]
+    for index, source in enumerate(sources):
+        (tmp_path / f"file{index}.py").write_text(source)
+    (tmp_path / "notes.txt").write_text("not python")
+    paths = expand_paths([str(tmp_path)])
+    assert [path.rsplit("/", 1)[1] for path in paths] == ["file0.py", "file1.py", "file2.py"]
+
+    pairs = [(paths[0], paths[1]), (paths[1], paths[2]), (paths[0], str(tmp_path / "missing.py"))]
+    # A malformed line of a pairs file becomes an error record instead of ending the stream
+    pairs_file = io.StringIO("".join(f"{path1}\t{path2}\n" for path1, path2 in pairs) + f"\n{paths[0]}\n")
+    pairs.append((paths[0], None))
+    assert list(read_pairs(pairs_file)) == pairs
+    records = list(align_many(pairs, workers=0, chunk_size=2))
+    assert [(record["file1"], record["file2"]) for record in records] == pairs
+    for record, (i, j) in zip(records, [(0, 1), (1, 2)]):
+        expected = perform_alignment(sources[i], sources[j])
+        assert {key: record[key] for key in expected} == expected
+    assert "error" in records[2] and "error" in records[3]
+
+    inline = list(align_many(pairs[:2], workers=0, score_only=True))
+    pooled = list(align_many(pairs[:2], workers=2, chunk_size=1, score_only=True))
+    assert sorted(pooled, key=lambda record: record["file2"]) == inline
+
+
+def test_command_line_streams_json_lines_without_web_stack(tmp_path):
+    for index, source in enumerate(["def f():\n    pass\n", "def g():\n    return 1\n", "x = 1\n"]):
+        (tmp_path / f"file{index}.py").write_text(source)
+    script = (
+        "import sys, runpy; sys.argv = ['app.alignment', sys.argv[1], '--workers', '0'];"
+        "runpy.run_module('app.alignment', run_name='__main__');"
+        "assert not {'flask', 'flask_sqlalchemy', 'sqlalchemy', 'flasgger'} & set(sys.modules)"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", script, str(tmp_path / "*.py")], capture_output=True, text=True, check=True
+    )
+    records = [json.loads(line) for line in completed.stdout.splitlines()]
+    assert len(records) == 3
+    assert all({"file1", "file2", "similarity", "needleman_score", "norm_score"} <= set(record) for record in records)
+    assert all("aligned_file1" not in record for record in records)
@@ -1,16 +1,34 @@
+import os
 import pytest
+import subprocess
 import sys
+import zipfile
+from datetime import datetime, timedelta
+from io import BytesIO
 
 sys.path.insert(0, ".")
 
-from app.server import app, db, User, AlignmentHistory
+from sqlalchemy import event
+from app.cache import content_hash
+from app.server import (
+    create_app, db, User, AlignmentHistory, TokenizedFile, ContentBlob, resume_pending_alignments,
+    requeue_pending_alignments, index_file, IndexedFile, migrate_alignment_storage, history_page, parse_history_cursor
+)
+
+app = create_app()
+
+# Seconds allowed for importing app.server in a fresh interpreter
+IMPORT_TIME_BUDGET = 2.0
 
 @pytest.fixture
 def client():
     """Set up a Flask test client and test database."""
     app.config["TESTING"] = True
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"  # Use in-memory DB
     app.config["SECRET_KEY"] = "test_secret"
+    app.config["ALIGNMENT_WORKERS"] = 0  # Run alignment jobs inline
+    app.extensions.pop("alignment_jobs", None)
+    app.extensions["caches"].users.clear()  # User ids are reused once the tables are dropped
+    app.extensions["caches"].incremental.clear()
 
     with app.test_client() as client:
         with app.app_context():
@@ -91,8 +109,540 @@ def test_logout(client):
     with client.session_transaction() as sess:
         assert "user_id" not in sess  # Ensure session is cleared
 
+def test_logged_in_user_is_cached(client):
+    """The user row is loaded once and then served from memory until logout."""
+    client.post("/register", data={
+        "username": "cached",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        for _ in range(3):
+            assert b"cached" in client.get("/home").data
+        assert sum("FROM user" in statement for statement in statements) == 1
+
+        client.get("/logout")
+        assert client.get("/home").status_code == 401
+        client.post("/login", data={"username": "cached", "password": "password"})
+        statements.clear()
+        client.get("/home")
+        assert any("FROM user" in statement for statement in statements)
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
 def test_unauthorized_home_access(client):
     """Ensure unauthorized users cannot access /home."""
     response = client.get("/home")
     assert response.status_code == 401
     assert b"Unauthorized" in response.data
+
+def test_pairwise_alignment_caches_tokens(client):
+    """Uploading two files stores the alignment and the tokenized contents."""
+    client.post("/register", data={
+        "username": "aligner",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    response = client.post("/tools/pairwise", data={
+        "file1": (BytesIO(b"def f(x):\n    return x\n"), "a.py"),
+        "file2": (BytesIO(b"def g(y):\n    if y:\n        return y\n"), "b.py"),
+    }, content_type="multipart/form-data")
+
+    assert response.status_code == 303
+    with app.app_context():
+        assert AlignmentHistory.query.count() == 1
+        assert TokenizedFile.query.count() == 2
+
+def test_pairwise_alignment_reuses_cached_result(client):
+    """Aligning the same pair twice is served from the result cache."""
+    client.post("/register", data={
+        "username": "repeater",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    files = lambda: {
+        "file1": (BytesIO(b"import os\nprint(os.name)\n"), "a.py"),
+        "file2": (BytesIO(b"import sys\nprint(sys.path)\n"), "b.py"),
+    }
+    hits = client.get("/cache/stats").get_json()["results"]["hits"]
+    client.post("/tools/pairwise", data=files(), content_type="multipart/form-data")
+    client.post("/tools/pairwise", data=files(), content_type="multipart/form-data")
+
+    assert client.get("/cache/stats").get_json()["results"]["hits"] == hits + 1
+    with app.app_context():
+        assert AlignmentHistory.query.count() == 2
+        assert ContentBlob.query.count() == 2  # Identical contents are stored once
+
+def test_alignment_storage_is_compact(client):
+    """New alignments keep contents in blobs and alignments as packed codes, decoded on the results page."""
+    client.post("/register", data={
+        "username": "compact",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    response = client.post("/tools/pairwise", data={
+        "file1": (BytesIO(b"import os\nprint(os.name)\n"), "a.py"),
+        "file2": (BytesIO(b"for i in range(3):\n    print(i)\n"), "b.py"),
+    }, content_type="multipart/form-data")
+    with app.app_context():
+        alignment = AlignmentHistory.query.one()
+        assert alignment.file1_content == "" and alignment.aligned_file1 == ""
+        assert alignment.aligned_codes1 is not None
+
+    response = client.get(response.headers["Location"])
+    assert b"print(os.name)" in response.data
+    assert b"import_statement" in response.data
+
+def test_legacy_alignments_are_migrated(client):
+    """Rows stored as raw text render before and after the storage migration."""
+    client.post("/register", data={
+        "username": "legacy",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    with client.session_transaction() as sess:
+        user_id = sess["user_id"]
+    with app.app_context():
+        for number in range(3):
+            db.session.add(AlignmentHistory(
+                user_id=user_id, file1_name="a.py", file2_name="b.py",
+                file1_content="import os\n", file2_content="x = 1\n",
+                aligned_file1="import_statement -", aligned_file2="- general_token",
+                score=-4, similarity=0, norm_score=0, alignment_id=f"legacy-{number}"
+            ))
+        db.session.commit()
+
+    before = client.get("/results/p/legacy-0").data
+    with app.app_context():
+        assert migrate_alignment_storage(batch_size=2) == 3
+        assert ContentBlob.query.count() == 2
+        alignment = AlignmentHistory.query.filter_by(alignment_id="legacy-0").one()
+        assert alignment.file1_content == "" and alignment.file1_hash is not None
+    assert client.get("/results/p/legacy-0").data == before
+    assert b"import_statement" in before and b"import os" in before
+
+def test_pending_alignment_resumes(client):
+    """Pending alignments show a pending page and are resumed once, after init-db queued them."""
+    client.post("/register", data={
+        "username": "waiter",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    with client.session_transaction() as sess:
+        user_id = sess["user_id"]
+    with app.app_context():
+        db.session.add(AlignmentHistory(
+            user_id=user_id, file1_name="a.py", file2_name="b.py",
+            file1_content="x = 1\n", file2_content="y = 2\n",
+            aligned_file1="", aligned_file2="", score=0, similarity=0, norm_score=0,
+            status="pending", alignment_id="pending-job"
+        ))
+        db.session.commit()
+
+    response = client.get("/results/p/pending-job")
+    assert response.status_code == 202
+    assert b"still running" in response.data
+
+    # Pending rows may belong to a live process and are only resumed once queued at startup
+    with app.app_context():
+        resume_pending_alignments()
+        assert AlignmentHistory.query.filter_by(alignment_id="pending-job").one().status == "pending"
+    result = app.test_cli_runner().invoke(args=["init-db"])
+    assert "Queued interrupted alignments: 1" in result.output
+    assert client.get("/results/p/pending-job").status_code == 202
+
+    with app.app_context():
+        resume_pending_alignments()
+        assert requeue_pending_alignments() == 0
+    response = client.get("/results/p/pending-job")
+    assert response.status_code == 200
+    assert b"Similarity" in response.data
+
+def test_batch_comparison_with_archive(client):
+    """A zip archive plus single files are compared all-vs-all."""
+    client.post("/register", data={
+        "username": "screener",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("one.py", "def f():\n    return 1\n")
+        zf.writestr("two.py", "def g():\n    return 2\n")
+    archive.seek(0)
+
+    response = client.post("/tools/batch", data={
+        "files": [(BytesIO(b"for i in range(3):\n    print(i)\n"), "three.py")],
+        "archive": (archive, "set.zip"),
+    }, content_type="multipart/form-data")
+    assert response.status_code == 200
+    assert b"Similarity matrix" in response.data
+    assert b"one.py" in response.data and b"three.py" in response.data
+
+    response = client.post("/tools/batch", data={}, content_type="multipart/form-data")
+    assert response.status_code == 400
+
+    # Single files and archive members are held to the upload limit
+    app.config["UPLOAD_MAX_BYTES"] = 64
+    try:
+        response = client.post("/tools/batch", data={
+            "files": [(BytesIO(b"x = 1\n" * 20), "big.py"), (BytesIO(b"y = 2\n"), "small.py")]
+        }, content_type="multipart/form-data")
+        assert response.status_code == 400
+        assert b"big.py must not be larger than" in response.data
+
+        big_archive = BytesIO()
+        with zipfile.ZipFile(big_archive, "w") as zf:
+            zf.writestr("big.py", "x = 1\n" * 20)
+            zf.writestr("small.py", "y = 2\n")
+        big_archive.seek(0)
+        response = client.post("/tools/batch", data={
+            "files": [(BytesIO(b"z = 3\n"), "other.py")],
+            "archive": (big_archive, "set.zip"),
+        }, content_type="multipart/form-data")
+        assert response.status_code == 200
+        assert b"small.py" in response.data and b"big.py" not in response.data
+    finally:
+        app.config["UPLOAD_MAX_BYTES"] = 1 * 1024 * 1024
+
+def test_batch_comparison_rejects_invalid_requests(client):
+    """A non-positive top_k and archives over the batch limits are rejected with 400."""
+    client.post("/register", data={
+        "username": "limited",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    files = [(BytesIO(b"x = 1\n"), "one.py"), (BytesIO(b"y = 2\n"), "two.py")]
+    response = client.post("/tools/batch", data={"files": files, "top_k": "0"},
+                           content_type="multipart/form-data")
+    assert response.status_code == 400
+    assert b"must be at least 1" in response.data
+
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        for index in range(3):
+            zf.writestr(f"f{index}.py", f"x = {index}\n")
+    archive.seek(0)
+    app.config["BATCH_MAX_FILES"] = 3
+    try:
+        response = client.post("/tools/batch", data={
+            "files": [(BytesIO(b"z = 3\n"), "other.py")],
+            "archive": (archive, "set.zip"),
+        }, content_type="multipart/form-data")
+        assert response.status_code == 400
+        assert b"At most 3 files" in response.data
+    finally:
+        app.config["BATCH_MAX_FILES"] = 200
+
+def test_similarity_search_finds_indexed_files(client):
+    """Files from earlier alignments are found through the similarity index."""
+    client.post("/register", data={
+        "username": "searcher",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    source = b"".join(b"def f%d(x):\n    for i in x:\n        if i:\n            print(i)\n" % i for i in range(20))
+    client.post("/tools/pairwise", data={
+        "file1": (BytesIO(source), "original.py"),
+        "file2": (BytesIO(b"import os\n"), "other.py"),
+    }, content_type="multipart/form-data")
+
+    response = client.post("/tools/search", data={
+        "file": (BytesIO(source + b"x = 1\n"), "suspect.py"),
+    }, content_type="multipart/form-data")
+    assert response.status_code == 200
+    assert b"original.py" in response.data
+    assert b"other.py" not in response.data
+
+def test_pairwise_alignment_rejects_oversized_upload(client):
+    """Files above UPLOAD_MAX_BYTES are rejected even though multipart parts carry no content length."""
+    client.post("/register", data={
+        "username": "bigfiles",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    response = client.post("/tools/pairwise", data={
+        "file1": (BytesIO(b"#" * (1024 * 1024 + 1)), "big.py"),
+        "file2": (BytesIO(b"x = 1\n"), "small.py"),
+    }, content_type="multipart/form-data", follow_redirects=True)
+    assert b"File 1 must not be larger than 1 MB." in response.data
+    with app.app_context():
+        assert AlignmentHistory.query.count() == 0
+
+    # The message follows the configured limit
+    app.config["UPLOAD_MAX_BYTES"] = 512 * 1024
+    try:
+        response = client.post("/api/v1/align", json={"file1": "#" * (512 * 1024 + 1), "file2": "x = 1\n"})
+        assert response.get_json()["error"] == "File 1 must not be larger than 512 KB."
+    finally:
+        app.config["UPLOAD_MAX_BYTES"] = 1 * 1024 * 1024
+
+def test_history_is_paginated(client):
+    """History pages follow each other without gaps and load only the list columns."""
+    client.post("/register", data={
+        "username": "historian",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    with client.session_transaction() as sess:
+        user_id = sess["user_id"]
+    start = datetime(2024, 1, 1)
+    with app.app_context():
+        for number in range(7):
+            db.session.add(AlignmentHistory(
+                user_id=user_id, file1_name=f"a{number}.py", file2_name="b.py",
+                score=0, similarity=0, norm_score=0, alignment_id=f"history-{number}",
+                date_created=start + timedelta(minutes=number // 2)  # Pairs share a timestamp
+            ))
+        db.session.commit()
+
+        seen, cursor = [], None
+        while True:
+            page, next_cursor = history_page(user_id, before=cursor and parse_history_cursor(cursor), page_size=3)
+            assert all("score" not in alignment.__dict__ for alignment in page)
+            seen.extend(alignment.alignment_id for alignment in page)
+            if next_cursor is None:
+                break
+            cursor = next_cursor
+        assert seen == [f"history-{number}" for number in reversed(range(7))]
+
+    app.config["HISTORY_PAGE_SIZE"] = 3
+    try:
+        response = client.get("/history")
+        assert b"a6.py" in response.data and b"a3.py" not in response.data
+        assert b"Older" in response.data
+    finally:
+        app.config["HISTORY_PAGE_SIZE"] = 50
+
+def test_api_align_returns_json(client):
+    """The JSON API aligns multipart or JSON bodies in one request and honours its options."""
+    assert client.post("/api/v1/align", json={"file1": "x = 1\n", "file2": "y = 2\n"}).status_code == 401
+    client.post("/register", data={
+        "username": "scripted",
+        "password": "password",
+        "confirm_password": "password"
+    })
+
+    response = client.post("/api/v1/align", data={
+        "file1": (BytesIO(b"import os\nprint(os.name)\n"), "a.py"),
+        "file2": (BytesIO(b"for i in range(3):\n    print(i)\n"), "b.py"),
+    }, content_type="multipart/form-data")
+    assert response.status_code == 200
+    result = response.get_json()
+    assert {"similarity", "needleman_score", "norm_score", "aligned_file1", "alignment_id"} <= set(result)
+    assert client.get(f"/results/p/{result['alignment_id']}").status_code == 200
+
+    response = client.post("/api/v1/align?include_alignment=0", json={
+        "file1": "import os\nprint(os.name)\n", "file2": "x = 1\n", "persist": False
+    })
+    assert response.status_code == 200
+    assert set(response.get_json()) == {"similarity", "needleman_score", "norm_score"}
+    with app.app_context():
+        assert AlignmentHistory.query.count() == 1
+
+    response = client.post("/api/v1/align?include_alignment=false", json={"file1": "x = 1\n"})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Both files are required."
+
+    # Unit mode pairs the functions of both files, also when they are reordered, and saves nothing
+    code1 = "def first(x):\n    for i in x:\n        print(i)\n\nclass Second:\n    pass\n"
+    code2 = "class Second:\n    pass\n\ndef first(x):\n    for i in x:\n        print(i)\n"
+    response = client.post("/api/v1/align", data={
+        "file1": (BytesIO(code1.encode()), "a.py"),
+        "file2": (BytesIO(code2.encode()), "b.py"),
+        "mode": "units",
+    }, content_type="multipart/form-data")
+    assert response.status_code == 200
+    report = response.get_json()
+    assert report["similarity"] == 1.0
+    assert [(pair["unit1"]["name"], pair["unit2"]["name"]) for pair in report["pairs"]] == \
+        [("first", "first"), ("Second", "Second")]
+    response = client.post("/api/v1/align", json={
+        "file1": code1, "file2": code2, "file1_name": "a.py", "file2_name": "b.py", "mode": "units"
+    })
+    assert response.get_json() == report
+    with app.app_context():
+        assert AlignmentHistory.query.count() == 1
+
+def test_results_line_aligned_pages(client):
+    """The results page shows the alignment as a line-aligned diff, one page at a time."""
+    client.post("/register", data={
+        "username": "reader",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    app.config['RESULTS_PAGE_SIZE'] = 10
+    try:
+        file1 = "".join(f"value_{i} = {i}\n" for i in range(25))
+        file2 = "import os\n" + file1
+        alignment_id = client.post("/api/v1/align", json={"file1": file1, "file2": file2}).get_json()["alignment_id"]
+
+        page = client.get(f"/results/p/{alignment_id}").get_data(as_text=True)
+        assert "positions 1&ndash;10 of 27" in page
+        assert "import os" in page and "value_8 = 8" in page and "value_9 = 9" not in page
+        assert "offset=10" in page and "Previous" not in page
+
+        page = client.get(f"/results/p/{alignment_id}?offset=20").get_data(as_text=True)
+        assert "positions 21&ndash;27 of 27" in page
+        assert "value_24 = 24" in page and "value_8 = 8" not in page
+        assert "offset=10" in page and "Next" not in page
+    finally:
+        app.config['RESULTS_PAGE_SIZE'] = 200
+
+    # A form feed does not start a line of its own, so the code after it keeps its line
+    file1 = "import os\n\x0c\ndef paged():\n    return 1\n"
+    file2 = "import os\ndef paged():\n    return 1\n"
+    alignment_id = client.post("/api/v1/align", json={"file1": file1, "file2": file2}).get_json()["alignment_id"]
+    page = client.get(f"/results/p/{alignment_id}").get_data(as_text=True)
+    assert page.count("function_def</span><pre>def paged():</pre>") == 2
+
+def test_api_incremental_revisions(client):
+    """Revisions of file1 sent with incremental=true reuse the DP rows of the previous revision."""
+    client.post("/register", data={
+        "username": "ci",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    reference = "".join(f"def f{i}(x):\n    for y in x:\n        print(y)\n" for i in range(40))
+    revision = reference.replace("def f35", "import os\ndef f35")
+    results = []
+    for content in (reference, revision):
+        response = client.post("/api/v1/align", json={
+            "file1": content, "file1_name": "submission.py", "file2": reference,
+            "persist": False, "incremental": True
+        })
+        assert response.status_code == 200
+        results.append(response.get_json())
+
+    incremental_states = app.extensions["caches"].incremental
+    assert incremental_states.stats()["entries"] == 1
+    with app.app_context():
+        user_id = User.query.filter_by(username="ci").one().id
+    state = incremental_states.get(((user_id, "submission.py", content_hash(reference)), False))
+    assert state.reused_rows > 0
+    expected = client.post("/api/v1/align", json={"file1": revision, "file2": reference, "persist": False})
+    assert results[1] == expected.get_json()
+    assert results[1]["similarity"] < results[0]["similarity"] == 1.0
+
+def test_local_alignment_options(client):
+    """Local mode and affine gap penalties are validated, applied and shown with the result."""
+    client.post("/register", data={
+        "username": "local",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    shared = "def f(x):\n    for i in x:\n        if i:\n            print(i)\n"
+    file1 = "import os\n" * 5 + shared
+    file2 = shared + "class A:\n    pass\n" * 3
+
+    response = client.post("/api/v1/align", json={
+        "file1": file1, "file2": file2, "mode": "local", "gap_open": -4, "gap_extend": -1
+    })
+    assert response.status_code == 200
+    result = response.get_json()
+    assert result["span"][:2] == [5, 9] and result["span"][2] == 0
+    with app.app_context():
+        alignment = AlignmentHistory.query.filter_by(alignment_id=result["alignment_id"]).one()
+        assert alignment.scoring == {"mode": "local", "gap_open": -4, "gap_extend": -1}
+        assert alignment.span == result["span"]
+    page = client.get(f"/results/p/{result['alignment_id']}").get_data(as_text=True)
+    assert "Best-matching region" in page and "local" in page
+
+    for options in ({"mode": "semiglobal"}, {"gap_open": "wide"}, {"gap_open": -1, "gap_extend": -3}):
+        response = client.post("/api/v1/align", json={"file1": file1, "file2": file2, **options})
+        assert response.status_code == 400
+
+def test_metrics_and_admin_profiling(client, tmp_path):
+    """Stage timings reach /metrics; only admins can request a profile."""
+    client.post("/register", data={
+        "username": "operator",
+        "password": "password",
+        "confirm_password": "password"
+    })
+    client.post("/tools/pairwise", data={
+        "file1": (BytesIO(b"import json\nprint(json.dumps([]))\n"), "a.py"),
+        "file2": (BytesIO(b"while True:\n    break\n"), "b.py"),
+    }, content_type="multipart/form-data", follow_redirects=True)
+
+    text = client.get("/metrics").get_data(as_text=True)
+    for stage in ("upload_read", "tokenize", "dp_fill", "traceback", "db_commit", "template_render"):
+        assert f'filealigner_stage_seconds_count{{stage="{stage}"}}' in text
+    assert 'filealigner_request_seconds_count{endpoint="align"}' in text
+    assert 'filealigner_cache_misses_total{cache="results"}' in text
+
+    app.config["PROFILE_DIR"] = str(tmp_path)
+    assert "X-Profile" not in client.get("/history", headers={"X-Profile": "1"}).headers
+    app.config["ADMIN_USERS"] = {"operator"}
+    try:
+        response = client.get("/history", headers={"X-Profile": "1"})
+        assert (tmp_path / response.headers["X-Profile"]).exists()
+    finally:
+        app.config["ADMIN_USERS"] = set()
+
+
+def test_import_has_no_startup_side_effects(tmp_path):
+    """Importing the server module loads no Swagger, opens no log file and touches no database."""
+    script = (
+        "import sys, time; started = time.perf_counter(); import app.server;"
+        "print(time.perf_counter() - started, 'flasgger' in sys.modules)"
+    )
+    env = dict(os.environ, PYTHONPATH=os.getcwd(), DATABASE_URL=f"sqlite:///{tmp_path / 'startup.db'}")
+    completed = subprocess.run(
+        [sys.executable, "-c", script], cwd=tmp_path, env=env, capture_output=True, text=True, check=True
+    )
+    seconds, flasgger_loaded = completed.stdout.split()
+    assert float(seconds) < IMPORT_TIME_BUDGET
+    assert flasgger_loaded == "False"
+    assert list(tmp_path.iterdir()) == []
+
+def test_apps_keep_separate_caches(client, tmp_path):
+    """Apps on different databases never serve each other's cached user rows."""
+    other = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'other.db'}", "TESTING": True, "USER_CACHE_TTL": 5
+    })
+    assert other.extensions["caches"] is not app.extensions["caches"]
+    assert other.extensions["caches"].users.ttl == 5
+    with other.app_context():
+        db.create_all()
+    with other.test_client() as other_client:
+        other_client.post("/register", data={
+            "username": "elsewhere", "password": "password", "confirm_password": "password"
+        })
+        assert b"elsewhere" in other_client.get("/home").data
+
+    client.post("/register", data={"username": "here", "password": "password", "confirm_password": "password"})
+    page = client.get("/home").data
+    assert b"here" in page and b"elsewhere" not in page
+
+def test_apidocs_served_on_first_request(client):
+    """Swagger is set up on the first request to the docs and describes the registered routes."""
+    assert client.get("/apidocs/").status_code == 200
+    spec = client.get("/apispec_1.json").get_json()
+    assert {"/api/v1/align", "/tools/pairwise", "/results/p/{alignment_id}"} <= set(spec["paths"])
+    assert client.get("/").status_code == 200
+
+
+def test_index_file_tolerates_concurrent_insert(client, monkeypatch):
+    """A file indexed by another request between the lookup and the insert is not an error."""
+    import app.server as server
+
+    def index_concurrently(tokens):
+        with db.engine.begin() as connection:
+            connection.execute(IndexedFile.__table__.insert().values(
+                user_id=1, content_hash="same", file_name="other.py", signature=b""
+            ))
+        return signature_of(tokens)
+
+    signature_of = server.signature_of
+    monkeypatch.setattr(server, "signature_of", index_concurrently)
+    with app.app_context():
+        index_file(1, "a.py", "same", bytes([1, 2, 3, 4, 5, 6]))
+        assert IndexedFile.query.filter_by(user_id=1, content_hash="same").one().file_name == "other.py"
@@ -0,0 +1,78 @@
+import io
+import sys
+import zipfile
+
+import pytest
+
+sys.path.insert(0, ".")
+
+from app.alignment import perform_alignment
+from app.batch import ArchiveTooLarge, compare_all, main, read_archive
+from app.jobs import JobQueue
+
+FILES = [
+    ("a.py", "def f(x):\n    for i in x:\n        print(i)\n"),
+    ("b.py", "def g(y):\n    for j in y:\n        print(j)\n"),
+    ("c.py", "import os\nclass C:\n    '''Doc.'''\n"),
+    ("d.py", "while True:\n    if x:\n        break\n"),
+]
+
+
+def test_compare_all_matrix_and_top_pairs():
+    """The matrix is symmetric and holds the score-only similarity of every pair."""
+    report = compare_all(FILES, workers=0, chunk_size=2, top_k=2)
+    matrix = report["matrix"]
+    assert report["names"] == [name for name, _ in FILES]
+    for i in range(len(FILES)):
+        assert matrix[i][i] == 1.0
+        for j in range(len(FILES)):
+            assert matrix[i][j] == matrix[j][i]
+    expected = perform_alignment(FILES[0][1], FILES[2][1], score_only=True)["similarity"]
+    assert matrix[0][2] == expected
+
+    assert len(report["top_pairs"]) == 2
+    assert report["top_pairs"][0]["file1"] == "a.py" and report["top_pairs"][0]["file2"] == "b.py"
+    assert report["top_pairs"][0]["similarity"] >= report["top_pairs"][1]["similarity"]
+
+
+def test_compare_all_process_pool_matches_inline():
+    """Scoring across worker processes or on a job queue gives the same report."""
+    inline = compare_all(FILES, workers=0)
+    assert compare_all(FILES, workers=2, chunk_size=1) == inline
+    queue = JobQueue(2)
+    try:
+        assert compare_all(FILES, workers=2, chunk_size=2, executor=queue) == inline
+    finally:
+        queue.shutdown()
+
+
+def test_read_archive_keeps_python_files():
+    """Only .py members of an archive are compared."""
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as archive:
+        archive.writestr("src/a.py", "x = 1\n")
+        archive.writestr("README.md", "# readme\n")
+        archive.writestr("src/big.py", "x = 1\n" * 10)
+    assert read_archive(data.getvalue(), max_bytes=20) == [("src/a.py", "x = 1\n")]
+
+
+def test_read_archive_limits_before_reading(monkeypatch):
+    """Archives over the file count or total size are rejected before any member is decompressed."""
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as archive:
+        for index in range(3):
+            archive.writestr(f"f{index}.py", "x = 1\n" * 10)
+    monkeypatch.setattr(zipfile.ZipFile, "read", lambda *args: pytest.fail("member was read"))
+    with pytest.raises(ArchiveTooLarge):
+        read_archive(data.getvalue(), max_files=2)
+    with pytest.raises(ArchiveTooLarge):
+        read_archive(data.getvalue(), max_total_bytes=100)
+
+
+def test_top_k_must_be_positive(capsys):
+    """compare_all and the command line reject a top_k below 1."""
+    with pytest.raises(ValueError):
+        compare_all(FILES, workers=0, top_k=0)
+    with pytest.raises(SystemExit):
+        main(["--top-k", "0", "a.py"])
+    assert "--top-k" in capsys.readouterr().err
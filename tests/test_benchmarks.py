@@ -0,0 +1,22 @@
+import json
+import sys
+
+sys.path.insert(0, ".")
+
+from app.alignment import tokenize_abstract
+from benchmarks.bench_alignment import DEFAULT_MAX_CELLS, compare, generate_source, mutate_source, run_benchmarks
+
+
+def test_generated_sources_tokenize():
+    source = generate_source(4096, seed=3)
+    assert 4096 <= len(source) < 4096 + 200
+    assert tokenize_abstract(mutate_source(source))
+
+def test_benchmark_smoke():
+    """A tiny run covers every stage and produces JSON-serializable results."""
+    results = run_benchmarks(sizes=[512], repeat=1)
+    assert {entry["stage"] for entry in results} >= set(DEFAULT_MAX_CELLS)
+    assert all(entry["seconds"] > 0 and entry["peak_bytes"] > 0 for entry in results)
+    assert all(entry["cells_per_s"] for entry in results if entry["stage"] in DEFAULT_MAX_CELLS)
+    json.dumps(results)
+    assert all(abs(speedup - 1) < 1e-9 for _, _, speedup in compare(results, results))
@@ -0,0 +1,99 @@
+import sys
+
+sys.path.insert(0, ".")
+
+import app.cache as cache_module
+from app.alignment import tokenize_abstract
+from app.cache import LRUCache, TokenCache, ResultCache, TTLCache, content_hash, pack_tokens, unpack_tokens
+
+
+class DictStore:
+    """In-memory stand-in for the persistent tier."""
+
+    def __init__(self):
+        self.blobs = {}
+
+    def load(self, digest):
+        return self.blobs.get(digest)
+
+    def save(self, digest, blob):
+        self.blobs[digest] = blob
+
+
+def test_lru_cache_evicts_by_size():
+    """Least recently used entries are evicted once max_bytes is exceeded."""
+    cache = LRUCache(max_bytes=10)
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    assert cache.get("a") == b"12345"  # "a" becomes most recently used
+    cache.put("c", b"123")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    assert cache.size <= 10
+    assert cache.stats()["misses"] == 1
+
+
+def test_pack_tokens_roundtrip():
+    """Token arrays take one byte per token and unpack to the same tokens."""
+    tokens = tokenize_abstract("import os\n\ndef f():\n    return 1\n")
+    blob = pack_tokens(tokens)
+    assert len(blob) == len(tokens)
+    assert unpack_tokens(blob) == tokens
+
+
+def test_token_cache_skips_tokenization_on_repeat(monkeypatch):
+    """Repeat contents are served from the LRU tier, then from the persistent tier."""
+    calls = []
+
+    def counting_tokenizer(content):
+        calls.append(content)
+        return tokenize_abstract(content)
+
+    monkeypatch.setattr(cache_module, "tokenize_abstract", counting_tokenizer)
+    store = DictStore()
+    code = "for i in range(3):\n    print(i)\n"
+
+    cache = TokenCache(store=store)
+    tokens = cache.get_tokens(code)
+    assert cache.get_tokens(code) == tokens
+    assert content_hash(code) in store.blobs
+
+    # A fresh process only has the persistent tier
+    assert TokenCache(store=store).get_tokens(code) == tokens
+    assert len(calls) == 1
+
+
+def test_result_cache_keys_on_scoring():
+    """Results are reused only for the same pair, scoring parameters and score-only flag."""
+    cache = ResultCache()
+    scoring = {"match": 2, "mismatch": -1, "gap": -2}
+    cache.put("h1", "h2", scoring, {"needleman_score": 4, "aligned_file1": "loop", "aligned_file2": "loop"})
+
+    assert cache.get("h1", "h2", scoring)["needleman_score"] == 4
+    assert cache.get("h2", "h1", scoring) is None
+    assert cache.get("h1", "h2", dict(scoring, gap=-1)) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+
+    # Score-only results are cached apart from full ones
+    assert cache.get("h1", "h2", scoring, score_only=True) is None
+    cache.put("h1", "h2", scoring, {"needleman_score": 4, "similarity": 0.5}, score_only=True)
+    assert cache.get("h1", "h2", scoring, score_only=True) == {"needleman_score": 4, "similarity": 0.5}
+    assert "aligned_file1" in cache.get("h1", "h2", scoring)
+
+
+def test_ttl_cache_expires_and_invalidates():
+    """Entries expire after the TTL, can be dropped early and are not kept when the TTL is 0."""
+    now = [0.0]
+    cache = TTLCache(ttl=30, clock=lambda: now[0])
+    cache.put(1, "alice")
+    cache.put(2, "bob")
+    now[0] = 29.0
+    assert cache.get(1) == "alice"
+    cache.pop(2)
+    assert cache.get(2) is None
+    now[0] = 30.0
+    assert cache.get(1) is None
+
+    disabled = TTLCache(ttl=0)
+    disabled.put(1, "alice")
+    assert disabled.get(1) is None
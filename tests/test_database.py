@@ -0,0 +1,71 @@
+import sys
+import threading
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import text
+
+sys.path.insert(0, ".")
+
+from app.database import database_uri, enable_sqlite_pragmas, engine_options, init_database
+
+
+def make_app(uri, options, pragmas):
+    """Build a minimal app with one table on the given database."""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = uri
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+    db = SQLAlchemy(app)
+
+    class Entry(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        value = db.Column(db.Integer, nullable=False)
+
+    with app.app_context():
+        enable_sqlite_pragmas(db.engine, pragmas)
+        init_database(db)
+    return app, db, Entry
+
+def test_engine_options_per_backend():
+    """Server databases get a sized, recycled pool; in-memory SQLite gets no pool options."""
+    options = engine_options("postgresql://user:secret@db/aligner", pool_size=8, max_overflow=4)
+    assert options == {"pool_size": 8, "max_overflow": 4, "pool_pre_ping": True, "pool_recycle": 1800}
+    assert engine_options("sqlite:///:memory:") == {}
+    assert "pool_recycle" not in engine_options("sqlite:///users.db")
+    assert database_uri("postgres://user@db/aligner") == "postgresql://user@db/aligner"
+
+@pytest.mark.parametrize("pragmas", [
+    {"journal_mode": "WAL", "busy_timeout": 5000, "synchronous": "NORMAL"},
+    {},
+])
+def test_concurrent_writes_to_sqlite_file(tmp_path, pragmas):
+    """Concurrent writers on a pooled SQLite file succeed, with and without the connection pragmas."""
+    uri = f"sqlite:///{tmp_path / 'test.db'}"
+    app, db, Entry = make_app(uri, engine_options(uri, pool_size=4, max_overflow=0), pragmas)
+    errors = []
+
+    def write(offset):
+        try:
+            with app.app_context():
+                for value in range(offset, offset + 25):
+                    db.session.add(Entry(value=value))
+                    db.session.commit()
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=write, args=(offset,)) for offset in range(0, 100, 25)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        assert not errors
+        assert Entry.query.count() == 100
+        journal_mode = db.session.execute(text("PRAGMA journal_mode")).scalar()
+        assert journal_mode == ("wal" if pragmas else "delete")
+        if pragmas:
+            assert db.session.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+            assert db.session.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert db.engine.pool.size() == 4
@@ -0,0 +1,64 @@
+import sys
+
+sys.path.insert(0, ".")
+
+from app.alignment import align_tokens, source_lines, tokenize_abstract, tokenize_lines
+from app.diffview import line_aligned_rows
+from app.storage import encode_alignment
+
+CODE1 = '"""Doc."""\nimport os\n\ndef f(x):\n    for i in range(\n            x):\n        print(i)\n'
+CODE2 = "import os\n\ndef g(y):\n    print(y)\n"
+
+
+def aligned_rows(code1, code2, **options):
+    tokens1, *lines1 = tokenize_lines(code1)
+    tokens2, *lines2 = tokenize_lines(code2)
+    result = align_tokens(tokens1, tokens2)
+    codes1, codes2 = encode_alignment(result["aligned_file1"]), encode_alignment(result["aligned_file2"])
+    return line_aligned_rows(codes1, codes2, lines1, lines2, source_lines(code1), source_lines(code2), **options)
+
+
+def test_tokenize_lines_tracks_token_lines():
+    """Every abstract token gets the source lines from its first to its last part."""
+    tokens, first, last = tokenize_lines(CODE1)
+    assert tokens == tokenize_abstract(CODE1)
+    assert len(first) == len(last) == len(tokens)
+    assert [str(token) for token in tokens[:5]] == [
+        "docstring", "import_statement", "general_token", "function_def", "loop"
+    ]
+    assert list(first[:5]) == [1, 2, 3, 4, 5]
+    assert list(last[:5]) == [1, 2, 3, 4, 6]
+
+
+def test_line_aligned_rows_map_tokens_to_source():
+    """Rows pair the source lines of aligned tokens and leave gaps empty."""
+    rows = aligned_rows(CODE1, CODE2)
+    assert rows[0]["status"] == "gap" and rows[0]["right"] is None
+    assert rows[0]["left"]["text"] == '"""Doc."""'
+    imports = rows[1]
+    assert imports["status"] == "match"
+    assert imports["left"]["text"] == imports["right"]["text"] == "import os"
+    loop = next(row["left"] for row in rows if row["left"] and row["left"]["token"] == "loop")
+    assert (loop["first"], loop["last"]) == (5, 6)
+    assert loop["text"] == "    for i in range(\n            x):"
+
+
+def test_source_lines_follow_tokenize():
+    """Form feeds and other separators stay inside their line, so token lines index the source."""
+    code = "import os\r\n\x0c\ndef f():\x1c\n    return 1\n"
+    assert source_lines(code) == ["import os", "\x0c", "def f():\x1c", "    return 1"]
+    rows = aligned_rows(code, "import os\ndef f():\n    return 1\n")
+    texts = {row["left"]["token"]: row["left"]["text"] for row in rows if row["left"]}
+    assert texts["import_statement"] == "import os" and texts["function_def"] == "def f():\x1c"
+
+
+def test_line_aligned_rows_window():
+    """A page starts at the token of its first aligned position and holds at most limit rows."""
+    rows = aligned_rows(CODE1, CODE2)
+    window = aligned_rows(CODE1, CODE2, offset=2, limit=3)
+    assert len(window) == 3
+    for row, expected in zip(window, rows[2:5]):
+        assert row["status"] == expected["status"]
+        for side in ("left", "right"):
+            assert (row[side] or {}).get("first") == (expected[side] or {}).get("first")
+    assert aligned_rows(CODE1, CODE2, offset=len(rows)) == []
@@ -0,0 +1,83 @@
+import random
+import sys
+
+sys.path.insert(0, ".")
+
+from app.alignment import align_tokens
+from app.cache import unpack_tokens
+from app.incremental import align_incremental
+
+TOKEN_CODES = [0, 0, 0, 1, 3, 4, 6]
+
+
+def revise(rng, codes):
+    """Insert, delete or replace a few short runs of tokens."""
+    codes = list(codes)
+    for _ in range(rng.randint(1, 3)):
+        position = rng.randrange(len(codes) + 1)
+        operation = rng.random()
+        if operation < 0.33:
+            codes[position:position] = rng.choices(TOKEN_CODES, k=rng.randint(1, 5))
+        elif operation < 0.66:
+            del codes[position:position + rng.randint(1, 5)]
+        else:
+            codes[position:position + 2] = rng.choices(TOKEN_CODES, k=2)
+    return codes or [1]
+
+
+def test_incremental_matches_full_alignment():
+    """Every revision gives exactly the result of a full alignment, in both modes."""
+    rng = random.Random(22)
+    for case in range(80):
+        codes = rng.choices(TOKEN_CODES, k=rng.randint(1, 60))
+        reference = bytes(rng.choices(TOKEN_CODES, k=rng.randint(1, 60)))
+        score_only = case % 2 == 1
+        state = None
+        for _ in range(4):
+            result, state = align_incremental(bytes(codes), reference, state, score_only=score_only)
+            expected = align_tokens(unpack_tokens(bytes(codes)), unpack_tokens(reference),
+                                    engine="numpy", score_only=score_only)
+            assert result == expected
+            codes = revise(rng, codes)
+
+
+def test_incremental_reuses_prefix_rows():
+    """Only the rows after the last checkpoint within the common prefix are recomputed."""
+    rng = random.Random(7)
+    codes = rng.choices(TOKEN_CODES, k=400)
+    reference = bytes(rng.choices(TOKEN_CODES, k=380))
+    _, state = align_incremental(bytes(codes), reference)
+    assert state.reused_rows == 0
+
+    revised = codes[:350] + [2, 2] + codes[350:]
+    result, revised_state = align_incremental(bytes(revised), reference, state)
+    assert 350 - state.interval < revised_state.reused_rows <= 350
+    assert result == align_tokens(unpack_tokens(bytes(revised)), unpack_tokens(reference), engine="numpy")
+
+    # A state computed for another second sequence or other scores is not reused
+    _, other = align_incremental(bytes(revised), reference[:-1], state)
+    assert other.reused_rows == 0
+    _, other = align_incremental(bytes(revised), reference, state, gap=-3)
+    assert other.reused_rows == 0
+
+
+def test_incremental_checkpoints_fit_budget():
+    """Checkpoints are spaced out to stay within the memory budget and are still reused."""
+    rng = random.Random(11)
+    codes = rng.choices(TOKEN_CODES, k=400)
+    reference = bytes(rng.choices(TOKEN_CODES, k=300))
+    for score_only in (False, True):
+        budget = 10 * 301 * 8 * (3 if score_only else 1)
+        _, state = align_incremental(bytes(codes), reference, score_only=score_only, max_bytes=budget)
+        assert state.interval == 40
+        assert sum(row.nbytes for rows in state.checkpoints.values() for row in rows) <= budget + 301 * 24
+
+        revised = codes[:350] + [2] + codes[350:]
+        result, revised_state = align_incremental(
+            bytes(revised), reference, state, score_only=score_only, max_bytes=budget
+        )
+        # 401 rows need an interval of 41; it is rounded up to 80 so the old checkpoints still apply
+        assert revised_state.interval == 80 and revised_state.reused_rows == 320
+        assert result == align_tokens(
+            unpack_tokens(bytes(revised)), unpack_tokens(reference), engine="numpy", score_only=score_only
+        )
@@ -0,0 +1,34 @@
+import sys
+import threading
+
+sys.path.insert(0, ".")
+
+from app.alignment import perform_alignment, tokenize_abstract
+from app.cache import pack_tokens
+from app.jobs import JobQueue, align_packed
+
+CODE1 = "def f(x):\n    for i in x:\n        print(i)\n"
+CODE2 = "def g(y):\n    while y:\n        y -= 1\n"
+
+
+def test_job_queue_runs_in_process_pool():
+    """Jobs run in worker processes and report through the callback."""
+    queue = JobQueue(max_workers=1)
+    done = threading.Event()
+    results = []
+
+    def callback(future):
+        results.append(future.result())
+        done.set()
+
+    blob1, blob2 = pack_tokens(tokenize_abstract(CODE1)), pack_tokens(tokenize_abstract(CODE2))
+    queue.submit(align_packed, blob1, blob2, callback=callback)
+    assert done.wait(30)
+    queue.shutdown()
+    assert results == [perform_alignment(CODE1, CODE2)]
+
+
+def test_job_queue_inline_reports_errors():
+    """With no workers, jobs run inline and exceptions end up in the future."""
+    future = JobQueue(max_workers=0).submit(align_packed, b"\x00", b"\x00", engine="missing")
+    assert isinstance(future.exception(), ValueError)
@@ -0,0 +1,41 @@
+import logging
+import sys
+import threading
+
+sys.path.insert(0, ".")
+
+from app.logs import QueueLogging
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record, self.format(record), threading.current_thread()))
+
+
+def test_records_are_handled_in_listener_thread():
+    """Records keep their template and arguments and are written by the listener thread."""
+    logger = logging.getLogger("test_queue_logging")
+    logger.setLevel(logging.INFO)
+    handler = RecordingHandler()
+    queue_logging = QueueLogging(logger, handler)
+    queue_logging.start()
+    try:
+        logger.info("Aligned %s with %d tokens: %s", "a.py", 12, object())
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("Job failed: %s", "job-1")
+    finally:
+        queue_logging.stop()
+
+    (record, message, thread), (failed, failure, _) = handler.records
+    assert thread is not threading.current_thread()
+    assert record.msg == "Aligned %s with %d tokens: %s"
+    assert record.args[:2] == ("a.py", 12) and isinstance(record.args[2], str)
+    assert message.startswith("Aligned a.py with 12 tokens: <")
+    assert failure.startswith("Job failed: job-1") and "ValueError: boom" in failure
+    assert logger.handlers == []
@@ -0,0 +1,38 @@
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, ".")
+
+from app.lsh import band_keys, estimate_jaccard, shingles, signature_of
+
+
+def test_signatures_estimate_jaccard():
+    """Near-duplicates share LSH buckets, unrelated sequences do not."""
+    rng = random.Random(5)
+    tokens = [rng.randrange(7) for _ in range(2000)]
+    edited = tokens[:1000] + [rng.randrange(7) for _ in range(50)] + tokens[1000:]
+    unrelated = [rng.randrange(7) for _ in range(2000)]
+
+    signature = signature_of(tokens)
+    assert estimate_jaccard(signature, signature_of(edited)) > 0.8
+    assert estimate_jaccard(signature, signature_of(unrelated)) < 0.3
+    assert set(band_keys(signature)) & set(band_keys(signature_of(edited)))
+    assert not set(band_keys(signature)) & set(band_keys(signature_of(unrelated)))
+
+
+def test_shingles_of_short_sequences():
+    """Sequences shorter than a shingle still get one distinct shingle."""
+    assert len(shingles([])) == 1
+    assert len(shingles([1, 2])) == 1
+    assert shingles([1, 2])[0] != shingles([1, 2, 0])[0]
+
+
+def test_shingle_length_limit():
+    """The shingle length is stored in the top 4 bits, so at most 15 tokens fit."""
+    rng = random.Random(15)
+    tokens = [rng.randrange(7) for _ in range(40)]
+    assert len(shingles(tokens, k=15)) == len({tuple(tokens[i:i + 15]) for i in range(len(tokens) - 14)})
+    with pytest.raises(ValueError):
+        shingles(tokens, k=16)
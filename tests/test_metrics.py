@@ -0,0 +1,35 @@
+import sys
+
+sys.path.insert(0, ".")
+
+from app.alignment import align_tokens, tokenize_abstract
+from app.metrics import Histogram, render_metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_seconds", "Test.", (0.1, 1), label="stage")
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value, "fill")
+
+    assert histogram.snapshot("fill") == ([1, 3, 4], 4.05, 4)
+    lines = histogram.render()
+    assert 'test_seconds_bucket{stage="fill",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="fill",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{stage="fill"} 4' in lines
+
+def test_render_includes_cache_stats():
+    stats = {"hits": 3, "misses": 1, "entries": 2, "size_bytes": 10, "max_bytes": 100}
+    text = render_metrics({"tokens": stats})
+    assert 'filealigner_cache_hits_total{cache="tokens"} 3' in text
+    assert "# TYPE filealigner_stage_seconds histogram" in text
+
+def test_align_tokens_reports_stage_timings():
+    tokens1 = tokenize_abstract("import os\nfor i in x:\n    pass\n")
+    tokens2 = tokenize_abstract("import os\nx = 1\n")
+    for engine in ("python", "numpy", "hirschberg"):
+        timings = {}
+        align_tokens(tokens1, tokens2, engine=engine, timings=timings)
+        assert set(timings) == {"dp_fill", "traceback"}
+    timings = {}
+    align_tokens(tokens1, tokens2, score_only=True, timings=timings)
+    assert set(timings) == {"dp_fill"}
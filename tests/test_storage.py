@@ -0,0 +1,23 @@
+import sys
+
+sys.path.insert(0, ".")
+
+from app.alignment import align_tokens, tokenize_abstract
+from app.storage import compress_text, decompress_text, pack_alignment, unpack_alignment
+
+
+def test_packed_alignment_round_trip():
+    """Aligned sequences survive packing, gaps included, and take far less space than the text."""
+    tokens1 = tokenize_abstract("import os\n" + "x = 1\n" * 200 + "def f():\n    pass\n")
+    tokens2 = tokenize_abstract("x = 1\n" * 150 + "for i in x:\n    pass\n")
+    result = align_tokens(tokens1, tokens2)
+    assert "-" in result["aligned_file1"].split() + result["aligned_file2"].split()
+
+    for aligned in (result["aligned_file1"], result["aligned_file2"]):
+        packed = pack_alignment(aligned)
+        assert unpack_alignment(packed) == aligned
+        assert len(packed) * 20 < len(aligned)
+
+def test_empty_alignment_and_text():
+    assert unpack_alignment(pack_alignment("")) == ""
+    assert decompress_text(compress_text("é\r\n")) == "é\r\n"
@@ -0,0 +1,82 @@
+import itertools
+import sys
+
+import numpy as np
+
+sys.path.insert(0, ".")
+
+from app.units import MODULE_UNIT, assign_units, compare_units, split_units
+
+CODE = '''"""Module docstring."""
+import os
+
+@decorator
+def first(x):
+    for i in x:
+        print(i)
+# trailing comment
+
+class Second:
+    def method(self):
+        pass
+
+CONSTANT = 1
+async def third():
+    if CONSTANT:
+        return 2
+'''
+
+
+def test_split_units_at_top_level_definitions():
+    """Top-level functions and classes become units with their decorators; the rest is module-level code."""
+    units = split_units(CODE, "a.py")
+    assert [(unit["name"], unit["kind"]) for unit in units] == [
+        ("first", "function"), ("Second", "class"), ("third", "function"), (MODULE_UNIT, "module")
+    ]
+    first, second, third, module = units
+    assert (first["first_line"], first["last_line"]) == (4, 9)
+    assert [str(token) for token in first["tokens"]][:2] == ["general_token", "function_def"]
+    assert [str(token) for token in second["tokens"]][:2] == ["class_def", "function_def"]
+    assert (third["first_line"], third["last_line"]) == (15, 17)
+    assert [str(token) for token in module["tokens"]][:2] == ["docstring", "import_statement"]
+    assert all(unit["file"] == "a.py" for unit in units)
+
+
+def test_split_units_after_form_feed():
+    """A form feed line does not shift the source lines the units are found on."""
+    units = split_units(CODE.replace("# trailing comment\n", "# trailing comment\n\x0c\n"), "a.py")
+    assert [unit["name"] for unit in units] == ["first", "Second", "third", MODULE_UNIT]
+    assert (units[1]["first_line"], units[2]["first_line"]) == (11, 16)
+
+
+def test_assign_units_is_optimal():
+    """The assignment maximises the total weight, also for non-square matrices."""
+    rng = np.random.default_rng(21)
+    for _ in range(100):
+        rows, columns = (int(size) for size in rng.integers(1, 6, 2))
+        weights = rng.random((rows, columns))
+        pairs = assign_units(weights)
+        assert len(pairs) == min(rows, columns)
+        assert len({i for i, _ in pairs}) == len({j for _, j in pairs}) == len(pairs)
+        if rows <= columns:
+            best = max(sum(weights[i, p[i]] for i in range(rows))
+                       for p in itertools.permutations(range(columns), rows))
+        else:
+            best = max(sum(weights[p[j], j] for j in range(columns))
+                       for p in itertools.permutations(range(rows), columns))
+        assert np.isclose(sum(weights[i, j] for i, j in pairs), best)
+
+
+def test_compare_units_matches_reordered_functions():
+    """Reordered and renamed units are paired by content, across files of a project."""
+    reordered = CODE[CODE.index("class Second"):].replace("Second", "Renamed") + CODE[:CODE.index("class Second")]
+    report = compare_units([("a.py", CODE)], [("b.py", reordered)], workers=0)
+    names = {(pair["unit1"]["name"], pair["unit2"]["name"]) for pair in report["pairs"]}
+    assert {("first", "first"), ("Second", "Renamed"), ("third", "third")} <= names
+    assert report["units1"] == report["units2"] == 4
+
+    split = [("one.py", CODE[:CODE.index("class Second")]), ("two.py", CODE[CODE.index("class Second"):])]
+    report = compare_units([("a.py", CODE)], split, workers=0, min_similarity=0.5)
+    pairs = {(pair["unit1"]["name"], pair["unit2"]["file"]) for pair in report["pairs"]}
+    assert {("first", "one.py"), ("Second", "two.py"), ("third", "two.py")} <= pairs
+    assert report["unmatched2"] and 0 < report["similarity"] < 1
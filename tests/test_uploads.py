@@ -0,0 +1,42 @@
+import io
+import sys
+
+import pytest
+
+sys.path.insert(0, ".")
+
+from app.alignment import tokenize_abstract
+from app.cache import content_hash, pack_tokens
+from app.storage import decompress_text
+from app.uploads import (
+    CHUNK_SIZE, UploadTooLarge, compress_upload_text, format_size, hash_upload, read_upload_text, tokenize_upload
+)
+
+
+def test_streamed_upload_matches_decoded_content():
+    """Hash, tokens and text of a streamed upload equal those of the decoded content."""
+    raw = ("def f():\r\n    return 'é'\r\n" * 5000).encode("utf-8") + b"\xff\n"
+    stream = io.BytesIO(raw)
+    content = raw.decode("utf-8", errors="replace")
+    assert len(raw) > CHUNK_SIZE
+
+    digest, size = hash_upload(stream, max_bytes=len(raw))
+    assert (digest, size) == (content_hash(content), len(raw))
+    assert tokenize_upload(stream) == pack_tokens(tokenize_abstract(content))
+    assert read_upload_text(stream) == content
+    assert decompress_text(compress_upload_text(stream)) == content
+    assert not stream.closed
+
+
+def test_upload_limit_enforced_while_reading():
+    """Uploads above the limit are rejected regardless of the declared content length."""
+    with pytest.raises(UploadTooLarge):
+        hash_upload(io.BytesIO(b"x" * 101), max_bytes=100)
+
+
+def test_format_size():
+    """Size limits are shown in the largest unit they reach."""
+    assert format_size(1024 * 1024) == "1 MB"
+    assert format_size(1536 * 1024) == "1.5 MB"
+    assert format_size(64 * 1024) == "64 KB"
+    assert format_size(100) == "100 bytes"